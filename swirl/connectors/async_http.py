@@ -0,0 +1,306 @@
+'''
+@author:     Sid Probstein
+@contact:    sid@swirl.today
+'''
+
+from sys import path
+from os import environ
+import asyncio
+import time
+
+import django
+
+from swirl.utils import swirl_setdir
+path.append(swirl_setdir()) # path to settings.py file
+environ.setdefault('DJANGO_SETTINGS_MODULE', 'swirl_server.settings')
+django.setup()
+
+from django.conf import settings
+
+import httpx
+import requests
+from requests.auth import HTTPBasicAuth, HTTPDigestAuth
+from channels.db import database_sync_to_async
+
+from celery.utils.log import get_task_logger
+logger = get_task_logger(__name__)
+
+from swirl.connectors import alloc_connector
+from swirl.connectors.requests import Requests, PageRateLimiter
+from swirl.processors.utils import get_tag
+from swirl.performance_logger import ProviderQueryRequestLogger
+from swirl.streaming import notify_search_update
+from swirl.http_sessions import http_session_pool
+
+module_name = 'async_http.py'
+
+SWIRL_ASYNC_HTTP = getattr(settings, 'SWIRL_ASYNC_HTTP', False)
+SWIRL_ASYNC_HTTP_MAX_CONNECTIONS = getattr(settings, 'SWIRL_ASYNC_HTTP_MAX_CONNECTIONS', 100)
+SWIRL_ASYNC_HTTP_MAX_KEEPALIVE = getattr(settings, 'SWIRL_ASYNC_HTTP_MAX_KEEPALIVE', 20)
+SWIRL_TIMEOUT = getattr(settings, 'SWIRL_TIMEOUT', 10)
+SWIRL_PROVIDER_TIMEOUT_TAG = 'timeout'
+
+########################################
+########################################
+
+def is_async_http_connector(connector):
+
+    '''
+    True for connectors whose requests the async engine can send: the Requests family, including M365
+    '''
+
+    try:
+        return issubclass(alloc_connector(connector=connector), Requests)
+    except KeyError:
+        return False
+
+def provider_timeout(provider):
+
+    '''
+    Seconds one provider may take, all pages included: the timeout:<seconds> tag if present, otherwise SWIRL_TIMEOUT
+    '''
+
+    timeout = get_tag(SWIRL_PROVIDER_TIMEOUT_TAG, provider.tags)
+    if not timeout or timeout == SWIRL_PROVIDER_TIMEOUT_TAG:
+        return float(SWIRL_TIMEOUT)
+    try:
+        return float(timeout)
+    except ValueError:
+        logger.warning(f"{module_name}: invalid {SWIRL_PROVIDER_TIMEOUT_TAG} tag {timeout} for provider {provider.id}, ignoring")
+        return float(SWIRL_TIMEOUT)
+
+def deadline_transport(deadline):
+
+    '''
+    Returns a Requests.transport that sends with requests, limiting each request to the seconds left until deadline
+    '''
+
+    def send(method, url, **kwargs):
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise requests.exceptions.Timeout(f"provider timeout reached before requesting {url}")
+        timeout = kwargs.get('timeout', None)
+        kwargs['timeout'] = min(timeout, remaining) if isinstance(timeout, (int, float)) else remaining
+        return http_session_pool.request(method.upper(), url, **kwargs)
+    return send
+
+########################################
+
+class UnsupportedRequest(Exception):
+    pass
+
+class PageRequest:
+
+    '''
+    One page request captured from send_request(), converted to httpx arguments
+    '''
+
+    __slots__ = ('method', 'url', 'verify', 'kwargs')
+
+    def __init__(self, method, url, verify=True, auth=None, **kwargs):
+        self.method = method.upper()
+        self.url = url
+        # httpx sets certificate verification per client, not per request
+        self.verify = verify
+        for key in kwargs:
+            if key not in ['params', 'headers', 'json', 'data']:
+                raise UnsupportedRequest(f"unsupported request argument {key}")
+        if isinstance(kwargs.get('data', None), str):
+            kwargs['content'] = kwargs.pop('data')
+        if auth is not None:
+            if type(auth) == HTTPBasicAuth:
+                kwargs['auth'] = httpx.BasicAuth(auth.username, auth.password)
+            elif type(auth) == HTTPDigestAuth:
+                kwargs['auth'] = httpx.DigestAuth(auth.username, auth.password)
+            else:
+                raise UnsupportedRequest(f"unsupported auth {type(auth).__name__}")
+        self.kwargs = kwargs
+
+class PageResponse:
+
+    '''
+    Gives an httpx response the requests.Response attributes process_pages() reads
+    '''
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.reason = response.reason_phrase
+        self.headers = response.headers
+        self.text = response.text
+        self._response = response
+
+    def json(self):
+        return self._response.json()
+
+########################################
+
+class AsyncHttpFederation:
+
+    '''
+    Federates a search to many Requests family providers from one event loop
+    Every page of every provider is requested concurrently over pooled httpx clients; query processing,
+    normalization, result processing and saving run exactly as in Connector.federate()
+    '''
+
+    def __init__(self, search_id, providers, update, session, request_id=''):
+        self.search_id = search_id
+        self.providers = providers
+        self.update = update
+        self.session = session
+        self.request_id = request_id
+        self.clients = {}
+        self.results = {}
+
+    def client(self, verify):
+        key = verify if isinstance(verify, str) else bool(verify)
+        if key not in self.clients:
+            # requests follows redirects, so providers that redirect work the same from here
+            self.clients[key] = httpx.AsyncClient(
+                verify=key,
+                follow_redirects=True,
+                timeout=httpx.Timeout(SWIRL_TIMEOUT),
+                limits=httpx.Limits(max_connections=SWIRL_ASYNC_HTTP_MAX_CONNECTIONS, max_keepalive_connections=SWIRL_ASYNC_HTTP_MAX_KEEPALIVE)
+            )
+        return self.clients[key]
+
+    ########################################
+
+    def page_requests(self, connector):
+
+        '''
+        Builds every page request for connector by capturing send_request(); returns None if one can't be sent with httpx
+        '''
+
+        page_requests = []
+        connector.transport = PageRequest
+        try:
+            for page_query in connector.page_queries():
+                if page_query == "":
+                    page_requests.append((page_query, None))
+                    break
+                page_requests.append((page_query, connector.request_page(page_query, self.session)))
+            # end for
+        except UnsupportedRequest as err:
+            logger.debug(f"{module_name}: {connector}: {err}, using requests")
+            return None
+        finally:
+            connector.transport = None
+        return page_requests
+
+    async def send(self, page_request, timeout=SWIRL_TIMEOUT):
+        # each request may take as long as the provider's timeout:<seconds> tag allows
+        try:
+            response = await self.client(page_request.verify).request(page_request.method, page_request.url, timeout=httpx.Timeout(timeout), **page_request.kwargs)
+            return PageResponse(response)
+        except (httpx.HTTPError, httpx.InvalidURL) as err:
+            return err
+
+    async def execute(self, connector, page_requests, timeout):
+        if page_requests is None:
+            # not expressible in httpx, send it with requests off the event loop; every request gets what is left of
+            # the provider timeout, so the thread has stopped using connector by the time complete_provider() does
+            connector.transport = deadline_transport(time.time() + timeout)
+            try:
+                await database_sync_to_async(connector.execute_search, thread_sensitive=False)(self.session)
+            finally:
+                connector.transport = None
+            return
+        # the provider's page_concurrency and page_rate limits apply here too
+        concurrency, rate = connector.paging_limits()
+        semaphore = asyncio.Semaphore(concurrency)
+        limiter = PageRateLimiter(rate)
+
+        async def send_page(page_request):
+            async with semaphore:
+                await asyncio.sleep(limiter.delay())
+                return await self.send(page_request, timeout)
+
+        responses = iter(await asyncio.gather(*[send_page(page_request) for page_query, page_request in page_requests if page_request]))
+        return [(page_query, next(responses) if page_request else None) for page_query, page_request in page_requests]
+
+    def complete_provider(self, connector, pages, timeout, error=None):
+        # as in Connector.federate(), a failing provider errors alone instead of failing the whole search
+        if timeout:
+            connector.error(f"timed out after {timeout}s")
+            result = False
+        elif error is not None:
+            connector.error(f'{error}')
+            result = False
+        else:
+            try:
+                if pages is not None:
+                    connector.process_pages(pages)
+                result = connector.complete_federate()
+            except Exception as err:
+                connector.error(f'{err}')
+                result = False
+            # end try
+        notify_search_update(self.search_id, provider_id=connector.provider_id)
+        return result
+
+    async def federate_provider(self, connector, page_requests):
+        with ProviderQueryRequestLogger(connector.provider.connector+'_'+str(connector.provider_id), self.request_id):
+            pages = None
+            timed_out = 0
+            error = None
+            if not connector.cached:
+                timeout = provider_timeout(connector.provider)
+                if page_requests is None:
+                    # bounded by deadline_transport(); cancelling it wouldn't stop the thread
+                    try:
+                        pages = await self.execute(connector, page_requests, timeout)
+                    except Exception as err:
+                        error = err
+                else:
+                    try:
+                        pages = await asyncio.wait_for(self.execute(connector, page_requests, timeout), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        timed_out = timeout
+            # result processing and saving run in parallel threads, not one after another on the shared sync thread
+            self.results[connector.provider_id] = await database_sync_to_async(self.complete_provider, thread_sensitive=False)(connector, pages, timed_out, error)
+
+    async def fan_out(self, prepared):
+        try:
+            outcomes = await asyncio.gather(*[self.federate_provider(connector, page_requests) for connector, page_requests in prepared], return_exceptions=True)
+            for (connector, page_requests), outcome in zip(prepared, outcomes):
+                if isinstance(outcome, Exception):
+                    logger.error(f"{module_name}: {connector}: {outcome}")
+                    self.results[connector.provider_id] = False
+            # end for
+        finally:
+            for client in self.clients.values():
+                await client.aclose()
+
+    ########################################
+
+    def federate(self):
+
+        '''
+        Returns {provider_id: federate() result} for every provider
+        '''
+
+        prepared = []
+        for provider_id, provider_connector in self.providers:
+            connector = alloc_connector(connector=provider_connector)(provider_id, self.search_id, self.update, request_id=self.request_id)
+            if not connector.prepare_federate(self.session):
+                self.results[provider_id] = False
+                notify_search_update(self.search_id, provider_id=provider_id)
+                continue
+            page_requests = None
+            if not connector.cached:
+                try:
+                    page_requests = self.page_requests(connector)
+                except Exception as err:
+                    connector.error(f'{err}')
+                    self.results[provider_id] = False
+                    notify_search_update(self.search_id, provider_id=provider_id)
+                    continue
+            prepared.append((connector, page_requests))
+        # end for
+
+        if prepared:
+            asyncio.run(self.fan_out(prepared))
+        return self.results
+
+def federate_http(search_id, providers, update, session, request_id=''):
+    return AsyncHttpFederation(search_id, providers, update, session, request_id=request_id).federate()
@@ -0,0 +1,258 @@
+'''
+@author:     Sid Probstein
+@contact:    sid@swirl.today
+'''
+
+from sys import path
+from os import environ
+import os
+import time
+import threading
+import hashlib
+import json
+
+import django
+
+from swirl.utils import swirl_setdir
+path.append(swirl_setdir()) # path to settings.py file
+environ.setdefault('DJANGO_SETTINGS_MODULE', 'swirl_server.settings')
+django.setup()
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+
+from celery.utils.log import get_task_logger
+logger = get_task_logger(__name__)
+
+from swirl.models import SearchProvider
+
+module_name = 'client_registry.py'
+
+SWIRL_CLIENT_IDLE_TIMEOUT = getattr(settings, 'SWIRL_CLIENT_IDLE_TIMEOUT', 300)
+SWIRL_CLIENT_HEALTH_CHECK_INTERVAL = getattr(settings, 'SWIRL_CLIENT_HEALTH_CHECK_INTERVAL', 30)
+SWIRL_CLIENT_POOL_SIZE = getattr(settings, 'SWIRL_CLIENT_POOL_SIZE', 10)
+
+# SearchProvider fields that change how a connector connects
+CLIENT_PROVIDER_FIELDS = ['connector', 'url', 'credentials', 'eval_credentials', 'date_updated']
+
+########################################
+########################################
+
+def client_config_hash(provider, config=None):
+    value = {field: getattr(provider, field, None) for field in CLIENT_PROVIDER_FIELDS}
+    value['config'] = config
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+class ClientEntry:
+
+    __slots__ = ('client', 'close', 'health_check', 'created', 'last_used', 'last_checked', 'uses')
+
+    def __init__(self, client, close=None, health_check=None):
+        self.client = client
+        self.close = close
+        self.health_check = health_check
+        self.created = self.last_used = self.last_checked = time.time()
+        self.uses = 0
+
+class ClientRegistry:
+
+    '''
+    Per-process registry of long-lived connector clients and connections, keyed by (provider id, connection config hash)
+    Clients idle longer than idle_timeout are closed; clients are health checked at most every health_check_interval seconds
+    Saving or deleting a SearchProvider drops its clients; the config hash includes date_updated, so other workers reconnect too
+    '''
+
+    def __init__(self, idle_timeout=SWIRL_CLIENT_IDLE_TIMEOUT, health_check_interval=SWIRL_CLIENT_HEALTH_CHECK_INTERVAL):
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.clients = {}
+        self._pid = os.getpid()
+        # _lock only guards the dicts; creating, checking and closing clients, which can block on the network,
+        # happens under the key's own lock, so one unreachable provider doesn't hold up the others
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _close(self, key, entry):
+        logger.debug(f"{module_name}: closing client {key[0]}_{key[1][:8]}")
+        if entry.close:
+            try:
+                entry.close(entry.client)
+            except Exception as err:
+                logger.warning(f"{module_name}: error closing client for provider {key[0]}: {err}")
+
+    def _healthy(self, entry, now):
+        if not entry.health_check or now - entry.last_checked < self.health_check_interval:
+            return True
+        entry.last_checked = now
+        try:
+            return bool(entry.health_check(entry.client))
+        except Exception as err:
+            logger.info(f"{module_name}: health check failed: {err}")
+            return False
+
+    def _pop(self, match):
+        # call with _lock held
+        return [(key, self.clients.pop(key)) for key in [k for k, entry in self.clients.items() if match(k, entry)]]
+
+    def get(self, provider, factory, close=None, health_check=None, config=None):
+
+        '''
+        Returns the client for provider, calling factory() to create it when there is none or the old one is idle or unhealthy
+        close(client) and health_check(client) are optional; config is any extra connection setting to key on
+        '''
+
+        key = (provider.id, client_config_hash(provider, config))
+        now = time.time()
+        with self._lock:
+            if self._pid != os.getpid():
+                # forked: sockets inherited from the parent can't be shared
+                self.clients = {}
+                self._key_locks = {}
+                self._pid = os.getpid()
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        self.evict_idle(now)
+        with key_lock:
+            with self._lock:
+                entry = self.clients.get(key, None)
+            if entry and not self._healthy(entry, now):
+                with self._lock:
+                    stale = self._pop(lambda k, e: e is entry)
+                for old_key, old_entry in stale:
+                    self._close(old_key, old_entry)
+                entry = None
+            if not entry:
+                entry = ClientEntry(factory(), close=close, health_check=health_check)
+                with self._lock:
+                    # a changed configuration replaces the provider's older clients
+                    stale = self._pop(lambda k, e: k[0] == provider.id)
+                    self.clients[key] = entry
+                for old_key, old_entry in stale:
+                    self._close(old_key, old_entry)
+            with self._lock:
+                entry.last_used = now
+                entry.uses = entry.uses + 1
+            return entry.client
+
+    def discard(self, provider_id, client=None):
+
+        '''
+        Drops the provider's clients, or only client, e.g. after it raised a connection error
+        '''
+
+        with self._lock:
+            stale = self._pop(lambda k, e: k[0] == provider_id and (client is None or e.client is client))
+        for key, entry in stale:
+            self._close(key, entry)
+
+    def evict_idle(self, now=None):
+        now = now or time.time()
+        with self._lock:
+            stale = self._pop(lambda k, e: now - e.last_used > self.idle_timeout)
+        for key, entry in stale:
+            self._close(key, entry)
+
+    def clear(self):
+        with self._lock:
+            stale = self._pop(lambda k, e: True)
+        for key, entry in stale:
+            self._close(key, entry)
+
+    def stats(self):
+        with self._lock:
+            return [
+                {
+                    'provider_id': key[0],
+                    'uses': entry.uses,
+                    'age': round(time.time() - entry.created, 1),
+                    'idle': round(time.time() - entry.last_used, 1)
+                }
+                for key, entry in self.clients.items()
+            ]
+
+client_registry = ClientRegistry()
+
+########################################
+
+class ConnectionPool:
+
+    '''
+    Idle DB-API connections for one provider; a connection is checked out by one caller at a time, since they aren't thread safe
+    At most size idle connections are kept; connections are health checked at most every health_check_interval seconds
+    Closing the pool closes its idle connections now and checked out ones when they are returned
+    '''
+
+    def __init__(self, factory, close=None, health_check=None, size=SWIRL_CLIENT_POOL_SIZE, health_check_interval=SWIRL_CLIENT_HEALTH_CHECK_INTERVAL):
+        self.factory = factory
+        self.close_connection = close
+        self.health_check = health_check
+        self.size = size
+        self.health_check_interval = health_check_interval
+        self.idle = []
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def _close(self, connection):
+        if self.close_connection:
+            try:
+                self.close_connection(connection)
+            except Exception as err:
+                logger.warning(f"{module_name}: error closing connection: {err}")
+
+    def _healthy(self, connection, returned):
+        if not self.health_check or time.time() - returned < self.health_check_interval:
+            return True
+        try:
+            return bool(self.health_check(connection))
+        except Exception as err:
+            logger.info(f"{module_name}: health check failed: {err}")
+            return False
+
+    def checkout(self):
+
+        '''
+        Returns an idle connection, or a new one from factory()
+        '''
+
+        while True:
+            with self._lock:
+                if not self.idle:
+                    break
+                connection, returned = self.idle.pop()
+            if self._healthy(connection, returned):
+                return connection
+            self._close(connection)
+        # end while
+        return self.factory()
+
+    def checkin(self, connection, discard=False):
+
+        '''
+        Returns a checked out connection to the pool, or closes it if discard, e.g. after it raised a database error
+        '''
+
+        with self._lock:
+            if not discard and not self.closed and len(self.idle) < self.size:
+                self.idle.append((connection, time.time()))
+                return
+        self._close(connection)
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            idle, self.idle = self.idle, []
+        for connection, returned in idle:
+            self._close(connection)
+
+########################################
+
+def close_client(client):
+    client.close()
+
+def close_pool(pool):
+    pool.close()
+
+def invalidate_provider_clients(sender, instance, **kwargs):
+    client_registry.discard(instance.id)
+
+post_save.connect(invalidate_provider_clients, sender=SearchProvider, dispatch_uid='swirl_client_registry_save')
+post_delete.connect(invalidate_provider_clients, sender=SearchProvider, dispatch_uid='swirl_client_registry_delete')
@@ -8,6 +8,8 @@ from sys import path
 from os import environ
 import time
 import copy
+import json
+import tracemalloc
 
 import django
 from django.db import Error
@@ -25,15 +27,45 @@ from celery.utils.log import get_task_logger
 logger = get_task_logger(__name__)
 
 from swirl.models import Search, Result, SearchProvider
-from swirl.connectors.utils import get_mappings_dict
+from swirl.connectors.provider_plan import provider_plan
+from swirl.connectors.result_cache import get_result_cache, provider_result_cache_ttl, result_cache_key
+from swirl.connectors.client_registry import client_registry, close_client, close_pool, ConnectionPool
+from swirl.result_items import SWIRL_RESULT_ITEM_STORAGE, add_result_items
+from swirl.dedupe_index import SWIRL_DEDUPE_INDEX, DedupeIndex
+from swirl.cpu_executor import SWIRL_CPU_POOL, run_result_processor
 from swirl.processors import *
 from swirl.processors.utils import result_processor_feedback_merge_records
 from swirl.processors.transform_query_processor_utils import get_query_processor_or_transform
 
 SWIRL_RP_SKIP_TAG = 'SW_RESULT_PROCESSOR_SKIP'
+SWIRL_DEDUPE_FIELD = getattr(settings, 'SWIRL_DEDUPE_FIELD', 'url')
+
+# debug: snapshot the results before each result processor and check what it did to them
+SWIRL_RESULT_PROCESSOR_SNAPSHOTS = getattr(settings, 'SWIRL_RESULT_PROCESSOR_SNAPSHOTS', False)
+# log the memory each result processor allocates, using tracemalloc
+SWIRL_RESULT_PROCESSOR_ALLOCATIONS = getattr(settings, 'SWIRL_RESULT_PROCESSOR_ALLOCATIONS', False)
+
+# connector state fetch() hands to process(), when federation is split into I/O and CPU tasks; sent as JSON
+FETCH_STATE = ['query_string_to_provider', 'query_to_provider', 'found', 'retrieved', 'results', 'messages', 'status',
+               'start_time', 'result_processor_json_feedback']
 
 ########################################
 
+def start_allocations():
+    # tracemalloc stays on once started; it counts every thread of this process, and none of the cpu pool's
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    return time.time(), tracemalloc.get_traced_memory()[0]
+
+def stop_allocations(start):
+    '''
+    Returns (seconds, bytes allocated and still held, peak bytes above the start) since start_allocations()
+    '''
+    start_time, start_memory = start
+    current, peak = tracemalloc.get_traced_memory()
+    return time.time() - start_time, current - start_memory, peak - start_memory
+
 class Connector:
 
     type = "SWIRL Connector"
@@ -62,6 +94,7 @@ class Connector:
         self.processed_results = []
         self.messages = []
         self.start_time = None
+        self.cached = False
         self.search_user = None
         self.request_id = request_id
         self._swirl_timeout = getattr(settings,'SWIRL_TIMEOUT')
@@ -79,9 +112,11 @@ class Connector:
         except ObjectDoesNotExist as err:
             logger.warning("unable to find search user, no auth check")
 
-        self.query_mappings = get_mappings_dict(self.provider.query_mappings)
-        self.response_mappings = get_mappings_dict(self.provider.response_mappings)
-        self.result_mappings = get_mappings_dict(self.provider.result_mappings)
+        # parsed once per provider version, copied so a connector can't change the shared plan
+        plan = provider_plan(self.provider)
+        self.query_mappings = dict(plan.query_mappings)
+        self.response_mappings = dict(plan.response_mappings)
+        self.result_mappings = dict(plan.result_mappings)
 
         self.status = 'READY'
 
@@ -114,52 +149,131 @@ class Connector:
         Executes the workflow for a given search and provider
         '''
 
-        self.start_time = time.time()
+        if not self.prepare_federate(session):
+            return False
+        if not self.cached:
+            try:
+                self.execute_search(session)
+            except Exception as err:
+                self.error(f'{err}')
+                return False
+            # end try
+        return self.complete_federate()
+
+    ########################################
+
+    def fetch(self, session):
+
+        '''
+        The I/O half of federate(): query processing, execute_search() or the result cache, and normalization
+        Returns the FETCH_STATE process() needs to finish, or False
+        '''
 
-        if self.status == 'READY':
-            self.status = 'FEDERATING'
+        if not self.prepare_federate(session):
+            return False
+        if not self.cached:
             try:
-                self.process_query()
-                self.construct_query()
-                v = self.validate_query(session)
-                if v:
-                    if not self.auth:
-                        self.status = 'NO_AUTH'
-                        return False
-                    self.execute_search(session)
-                    if self.status not in ['FEDERATING', 'READY']:
-                        self.error(f"execute_search() failed, status {self.status}")
-                        return False
-                    if self.status in ['FEDERATING', 'READY']:
-                        self.normalize_response()
-                    if self.status not in ['FEDERATING', 'READY']:
-                        self.error(f"normalize_response() failed, status {self.status}")
-                        return False
-                    else:
-                        self.process_results()
-                    if self.status == 'READY':
-                        res = self.save_results()
-                        if res:
-                            return res
-                        else:
-                            return False
-                    else:
-                        self.error(f"process_results() failed, status {self.status}")
-                        return False
-                else:
-                    self.status = 'ERR_VALIDATE_QUERY'
-                    self.error(f'validate_query() failed: {v}')
+                self.execute_search(session)
+                if self.status not in ['FEDERATING', 'READY']:
+                    self.error(f"execute_search() failed, status {self.status}")
+                    return False
+                self.normalize_response()
+                if self.status not in ['FEDERATING', 'READY']:
+                    self.error(f"normalize_response() failed, status {self.status}")
                     return False
-                # end if
+                self.put_cached_response()
             except Exception as err:
                 self.error(f'{err}')
                 return False
             # end try
-        else:
+        # celery sends it as JSON; values it can't encode, e.g. a MongoDB ObjectId or bytes from a SQL row, become str
+        # as MappingResultProcessor would make them
+        return json.loads(json.dumps({attr: getattr(self, attr) for attr in FETCH_STATE}, default=str))
+
+    def process(self, state):
+
+        '''
+        The CPU half of federate(): restores the state fetch() returned, then runs the result processors and saves
+        '''
+
+        if self.status != 'READY':
+            self.error(f'unexpected status: {self.status}')
+            return False
+        for attr in FETCH_STATE:
+            setattr(self, attr, state[attr])
+        # normalized and cached by fetch()
+        self.cached = True
+        return self.complete_federate()
+
+    ########################################
+
+    def prepare_federate(self, session):
+
+        '''
+        Runs the workflow up to execute_search(): query processing, construction, validation and the result cache lookup
+        Returns False if the search should not continue; self.cached is True if execute_search() can be skipped
+        '''
+
+        self.start_time = time.time()
+
+        if self.status != 'READY':
             self.error(f'unexpected status: {self.status}')
             return False
         # end if
 
+        self.status = 'FEDERATING'
+        try:
+            self.process_query()
+            self.construct_query()
+            v = self.validate_query(session)
+            if not v:
+                self.status = 'ERR_VALIDATE_QUERY'
+                self.error(f'validate_query() failed: {v}')
+                return False
+            if not self.auth:
+                self.status = 'NO_AUTH'
+                return False
+            self.cached = self.get_cached_response()
+        except Exception as err:
+            self.error(f'{err}')
+            return False
+        # end try
+        return True
+
+    ########################################
+
+    def complete_federate(self):
+
+        '''
+        Runs the workflow after execute_search(): normalization, the result cache, result processing and saving
+        '''
+
+        try:
+            if not self.cached:
+                if self.status not in ['FEDERATING', 'READY']:
+                    self.error(f"execute_search() failed, status {self.status}")
+                    return False
+                self.normalize_response()
+                if self.status not in ['FEDERATING', 'READY']:
+                    self.error(f"normalize_response() failed, status {self.status}")
+                    return False
+                self.put_cached_response()
+            # end if
+            self.process_results()
+            if self.status == 'READY':
+                res = self.save_results()
+                if res:
+                    return res
+                else:
+                    return False
+            else:
+                self.error(f"process_results() failed, status {self.status}")
+                return False
+        except Exception as err:
+            self.error(f'{err}')
+            return False
+        # end try
+
     ########################################
 
     def process_query(self):
@@ -245,6 +359,105 @@ class Connector:
 
     ########################################
 
+    def get_client(self, factory, close=close_client, health_check=None):
+
+        '''
+        Returns this provider's pooled client or connection, creating it with factory() if needed
+        '''
+
+        return client_registry.get(self.provider, factory, close=close, health_check=health_check)
+
+    def discard_client(self, client=None):
+
+        '''
+        Drops this provider's pooled client, so the next query reconnects
+        '''
+
+        client_registry.discard(self.provider.id, client)
+
+    def checkout_connection(self, factory, close=close_client, health_check=None):
+
+        '''
+        Checks out a connection from this provider's pool, for DB-API connections that one search must not share with another
+        Give it back with return_connection()
+        '''
+
+        self.connection_pool = client_registry.get(self.provider, lambda: ConnectionPool(factory, close=close, health_check=health_check), close=close_pool)
+        return self.connection_pool.checkout()
+
+    def return_connection(self, connection, discard=False):
+
+        '''
+        Returns a connection from checkout_connection() to its pool; discard closes it instead, e.g. after a database error
+        '''
+
+        self.connection_pool.checkin(connection, discard=discard)
+
+    ########################################
+
+    def _result_cache_key(self):
+
+        '''
+        Returns the result cache key and TTL for this provider and query, or (None, 0) if it should not be cached
+        Updates (subscriptions) always go to the provider
+        '''
+
+        if self.update:
+            return None, 0
+        ttl = provider_result_cache_ttl(self.provider)
+        if ttl <= 0:
+            return None, 0
+        return result_cache_key(self.provider, self.search, self.query_string_to_provider, self.query_to_provider), ttl
+
+    def get_cached_response(self):
+
+        '''
+        Loads the normalized response from the result cache, if present
+        Returns True on a hit; result processors still run on the cached results
+        '''
+
+        key, ttl = self._result_cache_key()
+        if not key:
+            return False
+        cache = get_result_cache()
+        if cache is None:
+            return False
+        try:
+            cached = cache.get(key)
+        except Exception as err:
+            self.warning(f"result cache get failed: {err}")
+            return False
+        if cached is None:
+            self.message(f"Result cache miss for: {self.provider.name}")
+            return False
+        self.results = cached['results']
+        self.found = cached['found']
+        self.retrieved = cached['retrieved']
+        self.status = 'READY'
+        self.message(f"Result cache hit for: {self.provider.name}")
+        return True
+
+    def put_cached_response(self):
+
+        '''
+        Stores the normalized response (before result processing) in the result cache
+        '''
+
+        key, ttl = self._result_cache_key()
+        if not key:
+            return False
+        cache = get_result_cache()
+        if cache is None:
+            return False
+        try:
+            cache.set(key, {'results': self.results, 'found': self.found, 'retrieved': self.retrieved}, timeout=ttl)
+        except Exception as err:
+            self.warning(f"result cache set failed: {err}")
+            return False
+        return True
+
+    ########################################
+
     def normalize_response(self):
 
         '''
@@ -328,17 +541,30 @@ class Connector:
 
         processors_to_skip = self._get_skip_processors_from_tags()
 
+        stage_allocations = []
         for processor in processor_list:
             if processor in processors_to_skip:
                 logger.debug(f"{self}: skipping processor: process results {processor} becasue it was in a skip tag of the search")
                 continue
             logger.debug(f"{self}: invoking processor: process results {processor}")
-            last_results = copy.deepcopy(self.results)
+            # processors get the live results, copied only for debugging
+            stage_input = self.results
+            snapshot = copy.deepcopy(self.results) if SWIRL_RESULT_PROCESSOR_SNAPSHOTS else None
+            if SWIRL_RESULT_PROCESSOR_ALLOCATIONS:
+                stage_start = start_allocations()
             try:
-                proc = alloc_processor(processor=processor)(self.results, self.provider, self.query_string_to_provider, request_id=self.request_id,
-                                                            result_processor_json_feedback=self.result_processor_json_feedback)
-                modified = proc.process()
-                self.results = proc.get_results()
+                # item by item processors can split large result sets across the cpu pool
+                pooled = None
+                if SWIRL_CPU_POOL:
+                    pooled = run_result_processor(processor, self.results, self.provider, self.query_string_to_provider, request_id=self.request_id,
+                                                  feedback=self.result_processor_json_feedback)
+                if pooled:
+                    modified, self.results = pooled
+                else:
+                    proc = alloc_processor(processor=processor)(self.results, self.provider, self.query_string_to_provider, request_id=self.request_id,
+                                                                result_processor_json_feedback=self.result_processor_json_feedback)
+                    modified = proc.process()
+                    self.results = proc.get_results()
                 logger.debug(f'provider : {self.provider.name} processor: {processor} modified : {modified}')
                 ## Check if this processor generated feed back and if so, remember it and merge it in to the exsiting
                 if self.results and 'result_processor_feedback' in self.results[-1]:
@@ -346,16 +572,18 @@ class Connector:
             except (NameError, TypeError, ValueError) as err:
                 self.error(f'{processor}: {err.args}, {err}')
                 return
+            if SWIRL_RESULT_PROCESSOR_ALLOCATIONS:
+                stage_allocations.append((processor,) + stop_allocations(stage_start))
+            if snapshot is not None:
+                self.check_result_processor(processor, modified, snapshot, stage_input)
+                del snapshot
             if modified < 0:
-                # if len(last_results) + modified != len(self.results):
-                #     self.warning(f"{processor} reported {modified} modified results, but returned {len(self.results)}!!")
                 self.message(f"{processor} deleted {-1*modified} results from: {self.provider.name}")
             else:
-                # if len(self.results) != len(last_results):
-                #     self.warning(f"{processor} updated {modified} results but returned {len(self.results)}!!")
                 self.message(f"{processor} updated {modified} results from: {self.provider.name}")
-            del last_results
         # end for
+        if stage_allocations:
+            logger.info(f"{self}: result processing: " + ', '.join([f"{name} {elapsed:.3f}s {allocated/1024:+.0f}KB peak {peak/1024:.0f}KB" for name, elapsed, allocated, peak in stage_allocations]))
         self.processed_results = self.results if self.results else []
         self.status = 'READY'
         self.retrieved = len(self.processed_results) # adjust retrieved in case processing effected the size of the list.
@@ -364,6 +592,19 @@ class Connector:
 
     ########################################
 
+    def check_result_processor(self, processor, modified, snapshot, stage_input):
+
+        '''
+        With SWIRL_RESULT_PROCESSOR_SNAPSHOTS, compares a processor's input, as it was and as it is, with what it returned
+        '''
+
+        if modified < 0 and len(snapshot) + modified != len(self.results):
+            self.warning(f"{processor} reported {modified} modified results, but returned {len(self.results)}!!")
+        if not alloc_processor(processor=processor).mutates_results and stage_input != snapshot:
+            self.warning(f"{processor} has mutates_results = False, but changed the results it was given!!")
+
+    ########################################
+
     def save_results(self):
 
         '''
@@ -394,6 +635,12 @@ class Connector:
                 return False
             # load the single result object now :\
             result = Result.objects.get(id=result[0].id)
+            # drop items this search already delivered, from any provider
+            if SWIRL_DEDUPE_INDEX:
+                dedupe_index = DedupeIndex(self.search.id, SWIRL_DEDUPE_FIELD)
+                delivered = len(self.processed_results)
+                self.processed_results = dedupe_index.filter(self.processed_results)
+                self.retrieved = self.retrieved - (delivered - len(self.processed_results))
             # add new flag
             for r in self.processed_results:
                 r['new'] = True
@@ -402,12 +649,17 @@ class Connector:
                 result.found = max(result.found, self.found)
                 result.retrieved = result.retrieved + self.retrieved
                 result.time = f'{result.time + (end_time - self.start_time):.1f}'
-                result.json_results = result.json_results + self.processed_results
+                if SWIRL_RESULT_ITEM_STORAGE:
+                    add_result_items(result, self.processed_results)
+                else:
+                    result.json_results = result.json_results + self.processed_results
                 result.query_processors = query_processors
                 result.result_processors = result_processors
                 result.status = 'UPDATED'
                 logger.debug(f"{self}: Result.save()")
                 result.save()
+                if SWIRL_DEDUPE_INDEX:
+                    dedupe_index.save()
             except Error as err:
                 self.error(f'save_results() update failed: {err.args}, {err}', save_results=False)
                 return False
@@ -422,7 +674,9 @@ class Connector:
                                                query_string_to_provider=self.query_string_to_provider, query_to_provider=self.query_to_provider,
                                                query_processors=query_processors, result_processors=result_processors, messages=self.messages,
                                                status=self.status, found=self.found, retrieved=self.retrieved, time=f'{(end_time - self.start_time):.1f}',
-                                               json_results=self.processed_results, owner=self.search.owner,result_processor_json_feedback=self.result_processor_json_feedback)
+                                               json_results=[] if SWIRL_RESULT_ITEM_STORAGE else self.processed_results, owner=self.search.owner,result_processor_json_feedback=self.result_processor_json_feedback)
+            if SWIRL_RESULT_ITEM_STORAGE:
+                add_result_items(new_result, self.processed_results)
             new_result.save()
         except Error as err:
             self.error(f'save_results() failed: {err.args}, {err}', save_results=False)
@@ -16,7 +16,7 @@ django.setup()
 from celery.utils.log import get_task_logger
 logger = get_task_logger(__name__)
 
-from swirl.connectors.utils import bind_query_mappings
+from swirl.connectors.provider_plan import provider_plan
 from swirl.connectors.connector import Connector
 
 ########################################
@@ -50,7 +50,7 @@ class DBConnector(Connector):
         else:
             self.error(f"{{fields}} not found in bound query_template")
             return
-        count_query = bind_query_mappings(count_query_template, self.provider.query_mappings)
+        count_query = provider_plan(self.provider).bind_query(count_query_template)
 
         if '{query_string}' in count_query:
             count_query = count_query.replace('{query_string}', self.query_string_to_provider)
@@ -61,7 +61,7 @@ class DBConnector(Connector):
         self.count_query = count_query
 
         # main query
-        query_to_provider = bind_query_mappings(self.provider.query_template, self.provider.query_mappings)
+        query_to_provider = provider_plan(self.provider).bind_query(self.provider.query_template)
         if '{query_string}' in query_to_provider:
             query_to_provider = query_to_provider.replace('{query_string}', self.query_string_to_provider)
 
@@ -17,7 +17,7 @@ django.setup()
 from celery.utils.log import get_task_logger
 logger = get_task_logger(__name__)
 
-from swirl.connectors.utils import bind_query_mappings
+from swirl.connectors.provider_plan import provider_plan
 from swirl.connectors.verify_ssl_common import VerifyCertsCommon
 
 from elasticsearch import Elasticsearch
@@ -43,7 +43,7 @@ class Elastic(VerifyCertsCommon):
 
         logger.debug(f"{self}: construct_query()")
 
-        query_to_provider = bind_query_mappings(self.provider.query_template, self.provider.query_mappings)
+        query_to_provider = provider_plan(self.provider).bind_query(self.provider.query_template)
 
         if '{query_string}' in self.provider.query_template:
             query_to_provider = query_to_provider.replace('{query_string}', self.query_string_to_provider)
@@ -96,15 +96,15 @@ class Elastic(VerifyCertsCommon):
             self.status = "ERR_NO_URL"
             return
 
-        try:
+        def new_client():
             if verify_certs:
-                es = Elasticsearch(basic_auth=tuple(auth),hosts=url,verify_certs=verify_certs,ca_certs=ca_certs)
-            else:
-                if auth:
-                    es = Elasticsearch(basic_auth=tuple(auth),hosts=url)
-                else:
-                    es = Elasticsearch(hosts=url)
+                return Elasticsearch(basic_auth=tuple(auth),hosts=url,verify_certs=verify_certs,ca_certs=ca_certs)
+            if auth:
+                return Elasticsearch(basic_auth=tuple(auth),hosts=url)
+            return Elasticsearch(hosts=url)
 
+        try:
+            es = self.get_client(new_client, health_check=lambda client: client.ping())
         except NameError as err:
             self.error(f'NameError: {err}')
         except TypeError as err:
@@ -143,6 +143,7 @@ class Elastic(VerifyCertsCommon):
         try:
             response = es.search(index=index, query=query, size=size)
         except ConnectionError as err:
+            self.discard_client(es)
             self.error(f"es.search reports: {err}")
         except NotFoundError:
             self.error(f"es.search reports HTTP/404 (Not Found)")
@@ -12,7 +12,7 @@ from celery.utils.log import get_task_logger
 logger = get_task_logger(__name__)
 
 from swirl.connectors.utils import get_search_obj
-from swirl.connectors.utils import get_mappings_dict
+from swirl.connectors.provider_plan import provider_plan
 from swirl.connectors.requestsget import RequestsGet
 from swirl.connectors.requestspost import RequestsPost
 from swirl.authenticators.microsoft import Microsoft
@@ -37,9 +37,9 @@ class M365(RequestsGet):
         self.auth = self.authenticator.is_authenticated(session)
         return super().validate_query(session)
 
-    def execute_search(self, session):
+    def request_page(self, page_query, session=None):
         self.provider.credentials = f"bearer={session['microsoft_access_token']}"
-        return super().execute_search(session)
+        return super().request_page(page_query, session)
 
 class M365Post(RequestsPost):
 
@@ -57,9 +57,9 @@ class M365Post(RequestsPost):
         self.auth = self.authenticator.is_authenticated(session)
         return super().validate_query(session)
 
-    def execute_search(self, session):
+    def request_page(self, page_query, session=None):
         self.provider.credentials = f"bearer={session['microsoft_access_token']}"
-        return super().execute_search(session)
+        return super().request_page(page_query, session)
 
 
 class M365SearchQuery(M365Post):
@@ -71,8 +71,8 @@ class M365SearchQuery(M365Post):
     def __init__(self, provider_id, search_id, update, request_id=''):
         super().__init__(provider_id, search_id, update, request_id)
         self.provider.response_mappings = self.provider.response_mappings or 'FOUND=value[0].hitsContainers[0].total,RESULTS=value[0].hitsContainers[0].hits'
-        self.response_mappings = get_mappings_dict(self.provider.response_mappings)
-        self.query_mappings_mappings = get_mappings_dict(self.provider.query_mappings)
+        self.response_mappings = dict(provider_plan(self.provider).response_mappings)
+        self.query_mappings_mappings = dict(provider_plan(self.provider).query_mappings)
         self.provider.url = 'https://graph.microsoft.com/beta/search/query'
         self.entity_type = ""
         self.search = get_search_obj(id=search_id) # get the seach object so we can decorate the search request if needed
@@ -105,7 +105,7 @@ class M365OutlookMessages(M365SearchQuery):
     def __init__(self, provider_id, search_id, update, request_id=''):
         super().__init__(provider_id, search_id, update, request_id)
         self.provider.result_mappings = self.provider.result_mappings or "title=resource.subject,body=summary,date_published=resource.createdDateTime,author=resource.sender.emailAddress.name,url=resource.webLink,resource.isDraft,resource.importance,resource.hasAttachments,resource.ccRecipients[*].emailAddress[*].name,resource.replyTo[*].emailAddress[*].name,NO_PAYLOAD"
-        self.result_mappings = get_mappings_dict(self.provider.result_mappings)
+        self.result_mappings = dict(provider_plan(self.provider).result_mappings)
         self.entity_type = "message"
 
 class M365OutlookCalendar(M365SearchQuery):
@@ -117,7 +117,7 @@ class M365OutlookCalendar(M365SearchQuery):
     def __init__(self, provider_id, search_id, update, request_id=''):
         super().__init__(provider_id, search_id, update, request_id)
         self.provider.result_mappings = self.provider.result_mappings or "title=resource.subject,body=summary,date_published=resource.start.dateTime,url='https://outlook.office.com/calendar/item/{sw_urlencode(hitId)}',resource.sensitivity,resource.type,resource.hasAttachments,NO_PAYLOAD"
-        self.result_mappings = get_mappings_dict(self.provider.result_mappings)
+        self.result_mappings = dict(provider_plan(self.provider).result_mappings)
         self.entity_type = "event"
 
 class M365OneDrive(M365SearchQuery):
@@ -129,7 +129,7 @@ class M365OneDrive(M365SearchQuery):
     def __init__(self, provider_id, search_id, update, request_id=''):
         super().__init__(provider_id, search_id, update, request_id)
         self.provider.result_mappings = self.provider.result_mappings or "title=resource.name,body='{resource.name} - {summary}',date_published=resource.createdDateTime,url=resource.webUrl,author=resource.createdBy.user.displayName,resource.lastModifiedBy.user.displayName,resource.lastModifiedDateTime,FILE_SYSTEM,NO_PAYLOAD"
-        self.result_mappings = get_mappings_dict(self.provider.result_mappings)
+        self.result_mappings = dict(provider_plan(self.provider).result_mappings)
         self.entity_type = "driveItem"
 
     def send_request(self, url, params=None, query=None, **kwargs):
@@ -145,7 +145,7 @@ class M365SharePointSites(M365SearchQuery):
     def __init__(self, provider_id, search_id, update, request_id=''):
         super().__init__(provider_id, search_id, update, request_id)
         self.provider.result_mappings = self.provider.result_mappings or "title=resource.displayName,body=summary,date_published=resource.createdDateTime,url=resource.webUrl,resource.lastModifiedDateTime,NO_PAYLOAD"
-        self.result_mappings = get_mappings_dict(self.provider.result_mappings)
+        self.result_mappings = dict(provider_plan(self.provider).result_mappings)
         self.entity_type = "site"
 
 
@@ -158,5 +158,5 @@ class MicrosoftTeams(M365SearchQuery):
     def __init__(self, provider_id, search_id, update, request_id=''):
         super().__init__(provider_id, search_id, update, request_id)
         self.provider.result_mappings = self.provider.result_mappings or "title=summary,body=summary,date_published=resource.createdDateTime,author=resource.from.emailAddress.name,url=resource.webLink,resource.importance,resource.channelIdentity.channelId,NO_PAYLOAD"
-        self.result_mappings = get_mappings_dict(self.provider.result_mappings)
+        self.result_mappings = dict(provider_plan(self.provider).result_mappings)
         self.entity_type = "chatMessage"
@@ -8,6 +8,7 @@ from os import environ
 
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
+from pymongo.errors import ConnectionFailure
 import json
 
 import django
@@ -89,17 +90,24 @@ class MongoDB(Connector):
         database_name = config[0]
         collection_name = config[1]
 
+        client = None
         try:
-            client = MongoClient(mongo_uri, server_api=ServerApi('1'))
+            # MongoClient keeps its own connection pool, so one client per provider is shared by every query
+            client = self.get_client(lambda: MongoClient(mongo_uri, server_api=ServerApi('1')), health_check=lambda client: client.admin.command('ping'))
             db = client[database_name]
             collection = db[collection_name]
             # warning: query to provider is a json object
             found = collection.count_documents(self.query_to_provider)
 
+        except ConnectionFailure as err:
+            # includes ServerSelectionTimeoutError; the shared client is only dropped when the connection is the problem
+            self.error(f"{err} connecting to {self.type}")
+            self.status = 'ERR'
+            self.discard_client(client)
+            return
         except Exception as err:
             self.error(f"{err} connecting to {self.type}")
             self.status = 'ERR'
-            client.close()
             return
  
         logger.debug(f"{self}: count {found}")
@@ -122,13 +130,15 @@ class MongoDB(Connector):
             else:
                 results = collection.find(self.query_to_provider).limit(self.provider.results_per_query)
             self.response = list(results)
+        except ConnectionFailure as err:
+            self.error(f"{err} querying {self.type}")
+            self.status = 'ERR'
+            self.discard_client(client)
+            return
         except Exception as err:
             self.error(f"{err} querying {self.type}")
             self.status = 'ERR'
-            client.close()
             return
-        finally:
-            client.close()
 
         self.found = found
         self.retrieved = len(self.response)
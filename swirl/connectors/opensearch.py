@@ -18,7 +18,7 @@ django.setup()
 from celery.utils.log import get_task_logger
 logger = get_task_logger(__name__)
 
-from swirl.connectors.utils import bind_query_mappings
+from swirl.connectors.provider_plan import provider_plan
 from swirl.connectors.verify_ssl_common import VerifyCertsCommon
 import json
 
@@ -42,7 +42,7 @@ class OpenSearch(VerifyCertsCommon):
 
         logger.debug(f"{self}: construct_query()")
 
-        base_query = bind_query_mappings(self.provider.query_template, self.provider.query_mappings)
+        base_query = provider_plan(self.provider).bind_query(self.provider.query_template)
         logger.debug(f"base_query: {base_query}")
 
         if '{query_string}' in self.provider.query_template:
@@ -96,7 +96,7 @@ class OpenSearch(VerifyCertsCommon):
             # client_cert_path = '/full/path/to/client.pem'
             # client_key_path = '/full/path/to/client-key.pem'
             try:
-                client = opensearch(
+                client = self.get_client(lambda: opensearch(
                     hosts = [{'host': host, 'port': port}],
                     http_compress = True, # enables gzip compression for request bodies
                     http_auth = auth,
@@ -107,7 +107,7 @@ class OpenSearch(VerifyCertsCommon):
                     ssl_assert_hostname = False,
                     ssl_show_warn = False,
                     ca_certs = ca_certs
-                )
+                ), health_check=lambda client: client.ping())
             except SSLError:
                 self.error(f"client.search reports SSL Error")
             except ConnectionError as err:
@@ -120,14 +120,14 @@ class OpenSearch(VerifyCertsCommon):
             # no credentials!
             logger.debug("no credentials!")
             try:
-                client = opensearch(
+                client = self.get_client(lambda: opensearch(
                     hosts = [{'host': host, 'port': port}],
                     http_compress = True, # enables gzip compression for request bodies
                     use_ssl = False,
                     verify_certs = False,
                     ssl_assert_hostname = False,
                     ssl_show_warn = False
-                )
+                ), health_check=lambda client: client.ping())
             except SSLError as err:
                 self.error(f"client.search reports SSL Error: {err}")
             except ConnectionError as err:
@@ -159,6 +159,7 @@ class OpenSearch(VerifyCertsCommon):
         except AuthorizationException:
             self.error(f"client.search reports HTTP/403 (Access Denied)")
         except ConnectionError as err:
+            self.discard_client(client)
             self.error(f"client.search reports: {err}")
         except TransportError as err:
             self.error(f"client.search reports Transport Error: {err}")
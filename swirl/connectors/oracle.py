@@ -48,9 +48,12 @@ class Oracle(DBConnector):
             self.warning("No credentials!")
         dsn = self.provider.url
 
+        conn = None
+        cursor = None
+        discard = False
         try:
-            # Create a new connection
-            conn = oracledb.connect(username, password, dsn)
+            # Check out a connection no other search is using
+            conn = self.checkout_connection(lambda: oracledb.connect(username, password, dsn), health_check=lambda conn: conn.ping() is None)
             cursor = conn.cursor()
             cursor.execute(self.count_query)
             found = cursor.fetchone()[0]
@@ -69,9 +72,13 @@ class Oracle(DBConnector):
             error, = e.args
             self.error(f"Database error: {error.code}, {error.message}")
             self.status = 'ERR'
-            cursor.close()
-            conn.close()
+            discard = True
             return
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self.return_connection(conn, discard=discard)
 
         try:
             if results:
@@ -81,9 +88,6 @@ class Oracle(DBConnector):
         except json.JSONDecodeError as err:
             self.error(f"{err} converting JSON")
 
-        cursor.close()
-        conn.close()
-
         self.found = found
         self.retrieved = self.provider.results_per_query
         return
@@ -45,69 +45,75 @@ class PostgreSQL(DBConnector):
             self.status = 'ERR_INVALID_CONFIG'
             return
 
-        connection = None
-        try:
+        def connect():
             connection = psycopg2.connect(host=config[0], port=config[1], database=config[2], user=config[3], password=config[4])
-        except Error as err:
-            self.error(f"{err} connecting to {self.type}")
-            return
+            # read only queries; a failed one must not leave the pooled connection in an aborted transaction
+            connection.autocommit = True
+            return connection
 
-        # issue the count(*) query
-        cursor = None
-        rows = None
-        found = None
+        connection = None
         try:
-            cursor = connection.cursor()
-            cursor.execute(self.count_query)
-            found = cursor.fetchone()
+            connection = self.checkout_connection(connect, health_check=lambda connection: connection.closed == 0)
         except Error as err:
             self.error(f"{err} connecting to {self.type}")
-            self.status = 'ERR'
             return
 
-        if found == None:
-            found = 0
-        else:
-            found = found[0]
+        discard = False
+        try:
 
-        if 'json' in self.count_query.lower():
-            self.warning(f"Ignoring 0 return from find, since 'json' appears in the query_string")
-        else:
-            if found == 0:
-                self.message(f"Retrieved 0 of 0 results from: {self.provider.name}")
-                self.status = 'READY'
-                self.found = 0
-                self.retrieved = 0
+            # issue the count(*) query; cursors are closed on every path, the connection is pooled
+            rows = None
+            found = None
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(self.count_query)
+                    found = cursor.fetchone()
+            except (Error, psycopg2.Error) as err:
+                discard = True
+                self.error(f"{err} connecting to {self.type}")
+                self.status = 'ERR'
                 return
+
+            if found == None:
+                found = 0
+            else:
+                found = found[0]
+
+            if 'json' in self.count_query.lower():
+                self.warning(f"Ignoring 0 return from find, since 'json' appears in the query_string")
+            else:
+                if found == 0:
+                    self.message(f"Retrieved 0 of 0 results from: {self.provider.name}")
+                    self.status = 'READY'
+                    self.found = 0
+                    self.retrieved = 0
+                    return
             # end if
-        # end if
 
-        # issue the main query
-        cursor = None
-        rows = None
-        try:
-            cursor = connection.cursor()
+            # issue the main query
             rows = None
-            cursor.execute(self.query_to_provider)
-            column_names = [desc[0] for desc in cursor.description]
-            rows = cursor.fetchall()
-        except Error as err:
-            self.error(f"{err} querying {self.type}")
-            return
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(self.query_to_provider)
+                    column_names = [desc[0] for desc in cursor.description]
+                    rows = cursor.fetchall()
+            except (Error, psycopg2.Error) as err:
+                discard = True
+                self.error(f"{err} querying {self.type}")
+                return
 
-        # rows is a list of tuple results
+            # rows is a list of tuple results
 
-        if rows == None:
-            logger.warning(f"Received 0 results, but count_query returned {found}")
-            self.message(f"Retrieved 0 of 0 results from: {self.provider.name}")
-            return
+            if rows == None:
+                logger.warning(f"Received 0 results, but count_query returned {found}")
+                self.message(f"Retrieved 0 of 0 results from: {self.provider.name}")
+                return
             # end if
-        # end if
 
-        self.response = rows
+            self.response = rows
 
-        cursor.close()
-        connection.close()
+        finally:
+            self.return_connection(connection, discard=discard)
 
         self.column_names = column_names
         self.found = found
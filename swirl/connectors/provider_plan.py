@@ -0,0 +1,192 @@
+'''
+@author:     Sid Probstein
+@contact:    sid@swirl.today
+'''
+
+from sys import path
+from os import environ
+import re
+import threading
+from collections import OrderedDict
+
+import django
+
+from swirl.utils import swirl_setdir
+path.append(swirl_setdir()) # path to settings.py file
+environ.setdefault('DJANGO_SETTINGS_MODULE', 'swirl_server.settings')
+django.setup()
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+
+from jsonpath_ng import parse
+
+from celery.utils.log import get_task_logger
+logger = get_task_logger(__name__)
+
+from swirl.models import SearchProvider
+from swirl.connectors.utils import bind_query_mappings, get_mappings_dict
+from swirl.processors.result_map_converter import ResultMapConverter
+from swirl.swirl_common import RESULT_MAPPING_COMMANDS
+
+module_name = 'provider_plan.py'
+
+SWIRL_PROVIDER_PLAN_CACHE_SIZE = getattr(settings, 'SWIRL_PROVIDER_PLAN_CACHE_SIZE', 256)
+# bound templates kept per plan; credentials can be per user (e.g. bearer tokens) so this is an LRU too
+SWIRL_PROVIDER_PLAN_BOUND_TEMPLATES = 16
+
+# SearchProvider fields the plan is compiled from
+PLAN_PROVIDER_FIELDS = ['query_mappings', 'response_mappings', 'result_mappings', 'date_updated']
+
+########################################
+########################################
+
+class ResultMapping:
+
+    '''
+    One compiled result mapping: swirl_key=source_key, the source field list or template, and a compiled jsonpath per field
+    '''
+
+    __slots__ = ('swirl_key', 'source_key', 'source_field_list', 'is_template', 'lookups')
+
+    def __init__(self, swirl_key, source_key, jsonpath):
+        self.swirl_key = swirl_key
+        self.source_key = source_key
+        self.source_field_list = source_key.split('|')
+        self.is_template = source_key.startswith("'")
+        if self.is_template:
+            template_list = re.findall(r'\{.*?\}', source_key)
+        else:
+            template_list = ['{' + key + '}' for key in self.source_field_list]
+        # (result_dict key, converter, jsonpath, compiled jsonpath); get_key() strips any sw_ directive and must be called once
+        self.lookups = []
+        for k in template_list:
+            converter = ResultMapConverter(f'$.{k[1:-1]}')
+            jxp_key = converter.get_key()
+            self.lookups.append((k[1:-1], converter, jxp_key, jsonpath(jxp_key)))
+
+class ProviderPlan:
+
+    '''
+    Everything derived from a SearchProvider's configuration that doesn't depend on the query:
+    the parsed mapping dicts, bound query templates, compiled jsonpath expressions and the compiled result mappings
+    Plans are shared by every search in the process, so the dicts must be treated as read only
+    '''
+
+    def __init__(self, provider):
+        self.provider_id = provider.id
+        self.query_mappings = get_mappings_dict(provider.query_mappings)
+        self.response_mappings = get_mappings_dict(provider.response_mappings)
+        self.result_mappings = get_mappings_dict(provider.result_mappings)
+        self._result_mapping_source = provider.result_mappings
+        self._result_mapping_list = None
+        self._query_mapping_source = provider.query_mappings
+        self._bound = OrderedDict()
+        self._jsonpaths = {}
+        self._lock = threading.Lock()
+
+    def jsonpath(self, expression):
+
+        '''
+        Returns the compiled jsonpath for expression, parsing it on first use; parse errors are raised, not cached
+        '''
+
+        compiled = self._jsonpaths.get(expression, None)
+        if compiled is None:
+            compiled = parse(expression)
+            self._jsonpaths[expression] = compiled
+        return compiled
+
+    def bind_query(self, query_template, url=None, credentials=None):
+
+        '''
+        bind_query_mappings() for this provider's query_mappings, computed once per template, url and credentials
+        '''
+
+        key = (query_template, url, credentials)
+        with self._lock:
+            if key in self._bound:
+                self._bound.move_to_end(key)
+                return self._bound[key]
+        bound = bind_query_mappings(query_template, self._query_mapping_source, url, credentials)
+        with self._lock:
+            self._bound[key] = bound
+            while len(self._bound) > SWIRL_PROVIDER_PLAN_BOUND_TEMPLATES:
+                self._bound.popitem(last=False)
+        return bound
+
+    def result_mapping_list(self):
+
+        '''
+        Returns the compiled ResultMapping list, skipping control codes; raises the jsonpath error if a mapping doesn't parse
+        '''
+
+        if self._result_mapping_list is None:
+            result_mapping_list = []
+            if self._result_mapping_source:
+                for mapping in self._result_mapping_source.split(','):
+                    stripped_mapping = mapping.strip()
+                    if stripped_mapping in RESULT_MAPPING_COMMANDS:
+                        continue
+                    swirl_key = ""
+                    if '=' in stripped_mapping:
+                        swirl_key = stripped_mapping[:stripped_mapping.find('=')]
+                        source_key = stripped_mapping[stripped_mapping.find('=')+1:]
+                    else:
+                        source_key = stripped_mapping
+                    if swirl_key.isupper():
+                        # control codes e.g. BLOCK
+                        continue
+                    result_mapping_list.append(ResultMapping(swirl_key, source_key, self.jsonpath))
+                # end for
+            self._result_mapping_list = result_mapping_list
+        return self._result_mapping_list
+
+class ProviderPlanCache:
+
+    '''
+    Per-process LRU of ProviderPlans keyed by provider id and the mapping fields, including date_updated
+    Connectors may change the mappings in memory (e.g. the M365 defaults), which simply selects another plan;
+    saving or deleting a SearchProvider drops its plans
+    '''
+
+    def __init__(self, size=SWIRL_PROVIDER_PLAN_CACHE_SIZE):
+        self.size = max(1, size)
+        self.plans = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, provider):
+        key = (provider.id,) + tuple(getattr(provider, field, None) for field in PLAN_PROVIDER_FIELDS)
+        with self._lock:
+            plan = self.plans.get(key, None)
+            if plan:
+                self.plans.move_to_end(key)
+                return plan
+        plan = ProviderPlan(provider)
+        with self._lock:
+            self.plans[key] = plan
+            while len(self.plans) > self.size:
+                self.plans.popitem(last=False)
+        return plan
+
+    def discard(self, provider_id):
+        with self._lock:
+            for key in [k for k in self.plans if k[0] == provider_id]:
+                del self.plans[key]
+
+    def clear(self):
+        with self._lock:
+            self.plans.clear()
+
+provider_plan_cache = ProviderPlanCache()
+
+def provider_plan(provider):
+    return provider_plan_cache.get(provider)
+
+########################################
+
+def invalidate_provider_plans(sender, instance, **kwargs):
+    provider_plan_cache.discard(instance.id)
+
+post_save.connect(invalidate_provider_plans, sender=SearchProvider, dispatch_uid='swirl_provider_plan_save')
+post_delete.connect(invalidate_provider_plans, sender=SearchProvider, dispatch_uid='swirl_provider_plan_delete')
@@ -20,6 +20,7 @@ logger = get_task_logger(__name__)
 
 from swirl.connectors.vdb_connector import VectorDBConnector
 from qdrant_client import QdrantClient
+from qdrant_client.http.exceptions import ResponseHandlingException
 
 
 class QdrantDB(VectorDBConnector):
@@ -36,8 +37,9 @@ class QdrantDB(VectorDBConnector):
             self.error(f"No vector for query: {self.query_string_to_provider}")
             return
 
+        client = None
         try:
-            client = QdrantClient(url=qdrant_url, api_key=api_key)
+            client = self.get_client(lambda: QdrantClient(url=qdrant_url, api_key=api_key))
             response = client.search(
                 collection_name,
                 query_vector=self.vector_to_provider,
@@ -45,6 +47,12 @@ class QdrantDB(VectorDBConnector):
                 with_payload=True,
                 with_vectors=False,
             )
+        except ResponseHandlingException as err:
+            # the request didn't reach Qdrant; errors Qdrant returns leave the shared client in place
+            self.discard_client(client)
+            self.error(f"{err} connecting to {self.type}")
+            self.status = "ERR"
+            return
         except Exception as err:
             self.error(f"{err} connecting to {self.type}")
             self.status = "ERR"
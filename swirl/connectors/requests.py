@@ -9,6 +9,8 @@ from os import environ
 from datetime import datetime
 import time
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import django
 
@@ -17,6 +19,8 @@ path.append(swirl_setdir()) # path to settings.py file
 environ.setdefault('DJANGO_SETTINGS_MODULE', 'swirl_server.settings')
 django.setup()
 
+from django.conf import settings
+
 import requests
 
 from requests.auth import HTTPBasicAuth, HTTPDigestAuth, HTTPProxyAuth
@@ -25,7 +29,6 @@ from requests.exceptions import ConnectionError
 import urllib.parse
 from urllib3.exceptions import NewConnectionError
 
-from jsonpath_ng import parse
 from jsonpath_ng.exceptions import JsonPathParserError
 
 from http import HTTPStatus
@@ -34,14 +37,47 @@ from celery.utils.log import get_task_logger
 logger = get_task_logger(__name__)
 
 from swirl.connectors.mappings import RESPONSE_MAPPING_KEYS
-from swirl.connectors.utils import bind_query_mappings
+from swirl.connectors.provider_plan import provider_plan
 
 from swirl.connectors.connector import Connector
 from swirl.connectors.verify_ssl_common import VerifyCertsCommon
+from swirl.processors.utils import get_tag
 
 import xmltodict
 
+SWIRL_PARALLEL_PAGING = getattr(settings, 'SWIRL_PARALLEL_PAGING', False)
+SWIRL_PAGE_CONCURRENCY = getattr(settings, 'SWIRL_PAGE_CONCURRENCY', 5)
+SWIRL_PAGE_RATE_LIMIT = getattr(settings, 'SWIRL_PAGE_RATE_LIMIT', 0)
+
+########################################
 ########################################
+
+class PageRateLimiter:
+
+    '''
+    Spaces page requests to one provider at most rate per second; 0 means no limit
+    delay() reserves the next slot and returns how long the caller must wait for it
+    '''
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    def delay(self):
+        if not self.interval:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+        return start - now
+
+    def wait(self):
+        delay = self.delay()
+        if delay > 0:
+            time.sleep(delay)
+
 ########################################
 
 class Requests(VerifyCertsCommon):
@@ -50,6 +86,8 @@ class Requests(VerifyCertsCommon):
 
     def __init__(self, provider_id, search_id, update, request_id=''):
         super().__init__(provider_id, search_id, update, request_id)
+        # when set, send_request() hands (method, url, **kwargs) to this callable instead of sending with requests
+        self.transport = None
 
 
     ########################################
@@ -77,9 +115,9 @@ class Requests(VerifyCertsCommon):
         # to do: migrate this to Connector base class?
         query_to_provider = ""
         if self.provider.credentials.startswith('HTTP'):
-            query_to_provider = bind_query_mappings(self.provider.query_template, self.provider.query_mappings, self.provider.url)
+            query_to_provider = provider_plan(self.provider).bind_query(self.provider.query_template, self.provider.url)
         else:
-            query_to_provider = bind_query_mappings(self.provider.query_template, self.provider.query_mappings, self.provider.url, self.provider.credentials)
+            query_to_provider = provider_plan(self.provider).bind_query(self.provider.query_template, self.provider.url, self.provider.credentials)
         # this should leave one item, {query_string}
         if '{query_string}' in query_to_provider:
             query_to_provider = query_to_provider.replace('{query_string}', urllib.parse.quote_plus(self.query_string_to_provider))
@@ -130,9 +168,11 @@ class Requests(VerifyCertsCommon):
             ret_headers.update(headers)
         return ret_headers
 
-    def execute_search(self, session=None):
+    def page_queries(self):
 
-        logger.debug(f"{self}: execute_search()")
+        '''
+        Returns the query to send for each page, one entry unless PAGE is mapped and results_per_query needs more than 10
+        '''
 
         # determine if paging is required
         pages = 1
@@ -144,12 +184,9 @@ class Requests(VerifyCertsCommon):
                 if (int(self.provider.results_per_query) % 10) > 0:
                     pages = pages + 1
 
-        # issue the query
+        page_queries = []
         start = 1
-        mapped_responses = []
-
         for page in range(0, pages):
-
             if 'PAGE' in self.query_mappings:
                 page_query = self.query_to_provider[:self.query_to_provider.rfind('&')]
                 page_spec = None
@@ -158,7 +195,7 @@ class Requests(VerifyCertsCommon):
                 if 'RESULT_ZERO_INDEX' in self.query_mappings['PAGE']:
                     page_spec = self.query_mappings['PAGE'].replace('RESULT_ZERO_INDEX',str(start-1))
                 if 'PAGE_INDEX' in self.query_mappings['PAGE']:
-                    page_spec = self.query_mappings['PAGE'].replace('PAGE_INDEX',page+1)
+                    page_spec = self.query_mappings['PAGE'].replace('PAGE_INDEX',str(page+1))
                 if page_spec:
                     page_query = page_query + '&' + page_spec + self.query_to_provider[self.query_to_provider.rfind('&'):]
                 else:
@@ -166,61 +203,162 @@ class Requests(VerifyCertsCommon):
                     page_query = self.query_to_provider
             else:
                 page_query = self.query_to_provider
+            page_queries.append(page_query)
+            start = start + 10 # get only as many pages as required to satisfy provider results_per_query setting, in increments of 10
+        # end for
 
-            # check the query
-            if page_query == "":
-                self.error("page_query is blank")
-                return
+        return page_queries
+
+    ########################################
+
+    def request_page(self, page_query, session=None):
+
+        '''
+        Sends one page query with the provider's credentials and returns the response
+        '''
+
+        # dictionary of authentication types permitted in the upcoming eval
+        http_auth_dispatch = {'HTTPBasicAuth': HTTPBasicAuth, 'HTTPDigestAuth': HTTPDigestAuth, 'HTTProxyAuth': HTTPProxyAuth}
+
+        if self.provider.credentials:
+            if session and self.provider.eval_credentials and '{credentials}' in self.provider.credentials:
+                credentials = session[self.provider.eval_credentials]
+                self.provider.credentials = self.provider.credentials.replace('{credentials}', credentials)
+            if self.provider.credentials.startswith('HTTP'):
+                # handle HTTPBasicAuth('user', 'pass') etc
+                http_auth = http_auth_parse(self.provider.credentials)
+                return self.send_request(page_query, auth=http_auth_dispatch.get(http_auth[0])(*http_auth[1]),query=self.query_string_to_provider,
+                                         headers=self._put_configured_headers())
+            if self.provider.credentials.startswith('bearer='):
+                # populate with bearer token
+                (username,password,verify_certs,ca_certs,bearer)=self.get_creds(def_verify_certs=True)
+                headers = {
+                    "Authorization": f"Bearer {bearer}"
+                }
+                if ca_certs and os.path.exists(ca_certs):
+                    return self.send_request(page_query, headers=self._put_configured_headers(headers), query=self.query_string_to_provider, verify=ca_certs)
+                return self.send_request(page_query, headers=self._put_configured_headers(headers), query=self.query_string_to_provider, verify=verify_certs)
+            if self.provider.credentials.startswith('X-Api-Key='):
+                headers = {
+                    "X-Api-Key": f"{self.provider.credentials.split('X-Api-Key=')[1]}"
+                }
+                logger.debug(f"{self}: sending request with auth header X-Api-Key")
+                return self.send_request(page_query, headers=self._put_configured_headers(headers), query=self.query_string_to_provider)
+            # all others
+            return self.send_request(page_query, query=self.query_string_to_provider, headers=self._put_configured_headers())
+        # end if
+        return self.send_request(page_query, query=self.query_string_to_provider, headers=self._put_configured_headers())
+
+    ########################################
+
+    def fetch_page(self, page_query, session=None):
 
-            # dictionary of authentication types permitted in the upcoming eval
-            http_auth_dispatch = {'HTTPBasicAuth': HTTPBasicAuth, 'HTTPDigestAuth': HTTPDigestAuth, 'HTTProxyAuth': HTTPProxyAuth}
+        '''
+        Returns the response to page_query, or the exception raised sending it
+        '''
 
-            response = None
-            # issue the query
+        try:
+            return self.request_page(page_query, session)
+        except (NewConnectionError, ConnectionError, requests.exceptions.Timeout, requests.exceptions.InvalidURL) as err:
+            return err
+
+    def paging_limits(self):
+
+        '''
+        Returns (concurrency, rate) for this provider's pages: the page_concurrency:<n> and page_rate:<per second> tags
+        if present, otherwise SWIRL_PAGE_CONCURRENCY and SWIRL_PAGE_RATE_LIMIT
+        '''
+
+        limits = []
+        for tag, default in [('page_concurrency', SWIRL_PAGE_CONCURRENCY), ('page_rate', SWIRL_PAGE_RATE_LIMIT)]:
+            value = get_tag(tag, self.provider.tags)
             try:
-                if self.provider.credentials:
-                    if session and self.provider.eval_credentials and '{credentials}' in self.provider.credentials:
-                        credentials = session[self.provider.eval_credentials]
-                        self.provider.credentials = self.provider.credentials.replace('{credentials}', credentials)
-                    if self.provider.credentials.startswith('HTTP'):
-                        # handle HTTPBasicAuth('user', 'pass') etc
-                        http_auth = http_auth_parse(self.provider.credentials)
-
-                        response = self.send_request(page_query, auth=http_auth_dispatch.get(http_auth[0])(*http_auth[1]),query=self.query_string_to_provider,
-                                                     headers=self._put_configured_headers())
-                    else:
-                        if self.provider.credentials.startswith('bearer='):
-                            # populate with bearer token
-                            (username,password,verify_certs,ca_certs,bearer)=self.get_creds(def_verify_certs=True)
-                            headers = {
-                                "Authorization": f"Bearer {bearer}"
-                            }
-                            if ca_certs and os.path.exists(ca_certs):
-                                response = self.send_request(page_query, headers=self._put_configured_headers(headers), query=self.query_string_to_provider, verify=ca_certs)
-                            else:
-                                response = self.send_request(page_query, headers=self._put_configured_headers(headers), query=self.query_string_to_provider, verify=verify_certs)
-                        elif self.provider.credentials.startswith('X-Api-Key='):
-                            headers = {
-                                "X-Api-Key": f"{self.provider.credentials.split('X-Api-Key=')[1]}"
-                            }
-                            logger.debug(f"{self}: sending request with auth header X-Api-Key")
-                            response = self.send_request(page_query, headers=self._put_configured_headers(headers), query=self.query_string_to_provider)
-                            # all others
-                        else:
-                            response = self.send_request(page_query, query=self.query_string_to_provider, headers=self._put_configured_headers())
-                        # end if
-                    # end if
-                else:
-                    # response = requests.get(page_query)
-                    response = self.send_request(page_query, query=self.query_string_to_provider, headers=self._put_configured_headers())
-            except NewConnectionError as err:
-                self.error(f"requests.{self.get_method()} reports {err} from: {self.provider.connector} -> {page_query}", NewConnectionError)
+                limits.append(float(value) if value and value != tag else float(default))
+            except ValueError:
+                self.warning(f"invalid {tag} tag {value}, ignoring")
+                limits.append(float(default))
+        # end for
+        return max(1, int(limits[0])), limits[1]
+
+    def fetch_pages(self, session=None):
+
+        '''
+        Yields (page_query, response) in page order, so process_pages() can stop before it uses pages it doesn't need
+        Sequentially by default; with SWIRL_PARALLEL_PAGING, all pages are requested up front
+        '''
+
+        page_queries = self.page_queries()
+        concurrency, rate = self.paging_limits()
+        if SWIRL_PARALLEL_PAGING and concurrency > 1 and len(page_queries) > 1 and "" not in page_queries:
+            yield from self.fetch_pages_parallel(page_queries, concurrency, rate, session)
+            return
+
+        for page, page_query in enumerate(page_queries):
+            if page > 0:
+                time.sleep(0.1)
+            if page_query == "":
+                yield page_query, None
                 return
-            except ConnectionError as err:
-                self.error(f"requests.{self.get_method()} reports {err} from: {self.provider.connector} -> {page_query}")
+            yield page_query, self.fetch_page(page_query, session)
+        # end for
+
+    def fetch_pages_parallel(self, page_queries, concurrency, rate, session=None):
+
+        '''
+        Requests every page on up to concurrency threads, optionally rate limited, and yields them in page order
+        Pages not yet started when the consumer stops (e.g. an earlier page came back short) are cancelled
+        '''
+
+        limiter = PageRateLimiter(rate)
+
+        def fetch(page_query):
+            limiter.wait()
+            return self.fetch_page(page_query, session)
+
+        executor = ThreadPoolExecutor(max_workers=min(concurrency, len(page_queries)))
+        try:
+            futures = [executor.submit(fetch, page_query) for page_query in page_queries]
+            for page_query, future in zip(page_queries, futures):
+                yield page_query, future.result()
+            # end for
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    ########################################
+
+    def execute_search(self, session=None):
+
+        logger.debug(f"{self}: execute_search()")
+
+        pages = self.fetch_pages(session)
+        try:
+            self.process_pages(pages)
+        finally:
+            # stops any pages still in flight once process_pages() is done
+            pages.close()
+
+    ########################################
+
+    def process_pages(self, pages):
+
+        '''
+        Normalizes (page_query, response) pairs in page order into self.response, stopping at the first short page
+        '''
+
+        mapped_responses = []
+        found = retrieved = -1
+        # jsonpath expressions are compiled once per provider version, not per page or per result
+        plan = provider_plan(self.provider)
+
+        for page_query, response in pages:
+
+            # check the query
+            if page_query == "":
+                self.error("page_query is blank")
                 return
-            except requests.exceptions.InvalidURL as err:
-                self.error(f"requests.{self.get_method()} reports {err} from: {self.provider.connector} -> {page_query}")
+
+            if isinstance(response, Exception):
+                self.error(f"requests.{self.get_method()} reports {response} from: {self.provider.connector} -> {page_query}")
                 return
             if response.status_code != HTTPStatus.OK:
                 self.error(f"request.{self.get_method()} returned: {response.status_code} {response.reason} from: {self.provider.name} for: {page_query}")
@@ -273,7 +411,7 @@ class Requests(VerifyCertsCommon):
                 if mapping in self.response_mappings:
                     jxp_key = f"$.{self.response_mappings[mapping]}"
                     try:
-                        jxp = parse(jxp_key)
+                        jxp = plan.jsonpath(jxp_key)
                         matches = [match.value for match in jxp.find(json_data)]
                     except JsonPathParserError as err:
                         self.error(f'JsonPathParser: {err} in provider.self.response_mappings: {self.provider.response_mappings}')
@@ -353,9 +491,9 @@ class Requests(VerifyCertsCommon):
                 for result in mapped_response['RESULTS']:
                     try:
                         jxp_key = f"$.{self.response_mappings['RESULT']}"
-                        jxp = parse(jxp_key)
+                        jxp = plan.jsonpath(jxp_key)
                         matches = [match.value for match in jxp.find(result)]
-                    except JsonPathParserError:
+                    except JsonPathParserError as err:
                         self.error(f'JsonPathParser: {err} in self.response_mappings: {self.provider.response_mappings}')
                         return
                     except (NameError, TypeError, ValueError) as err:
@@ -410,10 +548,6 @@ class Requests(VerifyCertsCommon):
                 # no more pages, so don't request any
                 break
 
-            start = start + 10 # get only as many pages as required to satisfy provider results_per_query setting, in increments of 10
-
-            time.sleep(0.1)
-
         # end for
 
         self.found = found
@@ -16,11 +16,10 @@ django.setup()
 from celery.utils.log import get_task_logger
 logger = get_task_logger(__name__)
 
-import requests
-
 from swirl.connectors.utils import bind_query_mappings
 
 from swirl.connectors.requests import Requests
+from swirl.http_sessions import http_session_pool
 
 ########################################
 ########################################
@@ -38,4 +37,6 @@ class RequestsGet(Requests):
         return 'get'
 
     def send_request(self, url, params=None, query=None, **kwargs):
-        return requests.get(url, params=params, **kwargs)
+        if self.transport:
+            return self.transport('get', url, params=params, **kwargs)
+        return http_session_pool.get(url, params=params, **kwargs)
@@ -18,14 +18,13 @@ path.append(swirl_setdir()) # path to settings.py file
 environ.setdefault('DJANGO_SETTINGS_MODULE', 'swirl_server.settings')
 django.setup()
 
-import requests
-
 from celery.utils.log import get_task_logger
 logger = get_task_logger(__name__)
 
-from swirl.connectors.utils import bind_query_mappings
+from swirl.connectors.provider_plan import provider_plan
 
 from swirl.connectors.requests import Requests
+from swirl.http_sessions import http_session_pool
 
 ########################################
 ########################################
@@ -66,7 +65,7 @@ class RequestsPost(Requests):
         post_json_str = json.dumps(self.provider.post_query_template)
 
         if post_json_str and post_json_str != '{}' and post_json_str != '"{}"':
-            post_json_str     = bind_query_mappings(post_json_str, self.provider.query_mappings, self.provider.url)
+            post_json_str     = provider_plan(self.provider).bind_query(post_json_str, self.provider.url)
 
             if 'USE_BODY_AS_QS' in self.provider.query_mappings:
                 post_json_str = self._replace_query(
@@ -86,8 +85,12 @@ class RequestsPost(Requests):
         logger.debug(f"post_json_str:{post_json_str} query:{query} post_json:{post_json}")
 
         if 'USE_X_FORM' in self.provider.query_mappings:
-            return requests.post(url, params=params, data=post_json, **kwargs)
-        return requests.post(url, params=params, json=post_json, **kwargs)
+            if self.transport:
+                return self.transport('post', url, params=params, data=post_json, **kwargs)
+            return http_session_pool.post(url, params=params, data=post_json, **kwargs)
+        if self.transport:
+            return self.transport('post', url, params=params, json=post_json, **kwargs)
+        return http_session_pool.post(url, params=params, json=post_json, **kwargs)
 
     def _replace_query(
         self,
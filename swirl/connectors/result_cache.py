@@ -0,0 +1,77 @@
+'''
+@author:     Sid Probstein
+@contact:    sid@swirl.today
+'''
+
+from sys import path
+from os import environ
+import hashlib
+import json
+
+import django
+
+from swirl.utils import swirl_setdir
+path.append(swirl_setdir()) # path to settings.py file
+environ.setdefault('DJANGO_SETTINGS_MODULE', 'swirl_server.settings')
+django.setup()
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+
+from celery.utils.log import get_task_logger
+logger = get_task_logger(__name__)
+
+from swirl.processors.utils import get_tag
+
+module_name = 'result_cache.py'
+
+SWIRL_RESULT_CACHE = getattr(settings, 'SWIRL_RESULT_CACHE', 'default')
+SWIRL_RESULT_CACHE_TTL = getattr(settings, 'SWIRL_RESULT_CACHE_TTL', 0)
+SWIRL_RESULT_CACHE_TAG = 'result_cache_ttl'
+
+# SearchProvider fields that change what execute_search() and normalize_response() return
+RESULT_CACHE_PROVIDER_FIELDS = [
+    'connector', 'url', 'query_template', 'query_template_json', 'post_query_template', 'query_processors',
+    'query_mappings', 'response_mappings', 'results_per_query', 'eval_credentials', 'credentials', 'http_request_headers'
+]
+
+########################################
+
+def _hash(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+def get_result_cache():
+    try:
+        return caches[SWIRL_RESULT_CACHE]
+    except InvalidCacheBackendError as err:
+        logger.warning(f"{module_name}: result cache {SWIRL_RESULT_CACHE} not configured: {err}")
+        return None
+
+def provider_result_cache_ttl(provider):
+
+    '''
+    Returns the result cache TTL in seconds for a provider: the result_cache_ttl:<seconds> tag if present, otherwise SWIRL_RESULT_CACHE_TTL
+    0 means the provider is not cached
+    '''
+
+    ttl = get_tag(SWIRL_RESULT_CACHE_TAG, provider.tags)
+    if not ttl or ttl == SWIRL_RESULT_CACHE_TAG:
+        return int(SWIRL_RESULT_CACHE_TTL)
+    try:
+        return max(0, int(ttl))
+    except ValueError:
+        logger.warning(f"{module_name}: invalid {SWIRL_RESULT_CACHE_TAG} tag {ttl} for provider {provider.id}, ignoring")
+        return int(SWIRL_RESULT_CACHE_TTL)
+
+def provider_config_hash(provider):
+    return _hash({field: getattr(provider, field, None) for field in RESULT_CACHE_PROVIDER_FIELDS})
+
+def result_cache_key(provider, search, query_string_to_provider, query_to_provider):
+
+    '''
+    Key for one provider's normalized response: provider id, provider config hash, processed query, sort, filters and owner
+    '''
+
+    query_hash = _hash([query_string_to_provider, query_to_provider, search.sort, search.filters, search.owner_id])
+    return f"swirl_result:{provider.id}:{provider_config_hash(provider)}:{query_hash}"
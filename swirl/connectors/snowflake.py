@@ -51,9 +51,12 @@ class Snowflake(DBConnector):
             self.warning("No credentials!")
         account = self.provider.url
 
+        conn = None
+        cursor = None
+        discard = False
         try:
-            # Create a new connection
-            conn = snowflake.connector.connect(user=username, password=password, account=account)
+            # Check out a connection no other search is using
+            conn = self.checkout_connection(lambda: snowflake.connector.connect(user=username, password=password, account=account), health_check=lambda conn: not conn.is_closed())
             cursor = conn.cursor()
             cursor.execute(f"USE WAREHOUSE {warehouse}")
             cursor.execute(f"USE DATABASE {database}")
@@ -75,15 +78,16 @@ class Snowflake(DBConnector):
         except ProgrammingError as err:
             self.error(f"{err} querying {self.type}")
             self.status = 'ERR'
-            cursor.close()
-            conn.close()
+            discard = True
             return
+        finally:
+            if cursor:
+                cursor.close()
+            if conn:
+                self.return_connection(conn, discard=discard)
 
         self.response = list(results)
 
-        cursor.close()
-        conn.close()
-
         self.found = found
         self.retrieved = self.provider.results_per_query
         return
@@ -7,6 +7,7 @@ import os
 from sys import path
 from os import environ
 from datetime import datetime
+from contextlib import closing
 
 import django
 from django.db import DataError
@@ -43,72 +44,73 @@ class Sqlite3(DBConnector):
             self.error(f"db_path does not exist")
             return
 
+        def connect():
+            # checked out by one search at a time, but not always on the thread that opened it
+            connection = sqlite3.connect(db_path, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            return connection
+
         connection = None
         try:
-            connection = sqlite3.connect(db_path)
-            connection.row_factory = sqlite3.Row
+            connection = self.checkout_connection(connect)
         except Error as err:
             self.error(f"{err} connecting to {self.type}: {db_path}")
             return
 
-        # issue the count(*) query
-        cursor = None
-        rows = None
-        found = None
+        discard = False
         try:
-            cursor = connection.cursor()
-            cursor.execute(self.count_query)
-            found = cursor.fetchone()
-        except Error as err:
-            self.error(f"execute_count_query: {err}")
-            self.status = 'ERR'
-            return
-
-        if found == None:
-            found = 0
-        else:
-            found = found[0]
 
-        if 'json' in self.count_query.lower():
-            logger.warning(f"{self}: ignoring 0 return from find, since 'json' appears in the query_string")
-        else:
-            if found == 0:
-                self.message(f"Retrieved 0 of 0 results from: {self.provider.name}")
-                self.status = 'READY'
-                self.found = 0
-                self.retrieved = 0
+            # issue the count(*) query; cursors are closed on every path, the connection is pooled
+            rows = None
+            found = None
+            try:
+                with closing(connection.cursor()) as cursor:
+                    cursor.execute(self.count_query)
+                    found = cursor.fetchone()
+            except Error as err:
+                self.error(f"execute_count_query: {err}")
+                self.status = 'ERR'
                 return
+
+            if found == None:
+                found = 0
+            else:
+                found = found[0]
+
+            if 'json' in self.count_query.lower():
+                logger.warning(f"{self}: ignoring 0 return from find, since 'json' appears in the query_string")
+            else:
+                if found == 0:
+                    self.message(f"Retrieved 0 of 0 results from: {self.provider.name}")
+                    self.status = 'READY'
+                    self.found = 0
+                    self.retrieved = 0
+                    return
             # end if
-        # end if
 
-        # issue the main query
-        cursor = None
-        rows = None
-        try:
-            cursor = connection.cursor()
+            # issue the main query
             rows = None
-            cursor.execute(self.query_to_provider)
-            rows = cursor.fetchall()
-        except Error as err:
-            self.error(f"execute_count_query: {err}")
-            self.status = 'ERR'
-            cursor.close()
-            connection.close()
-            return
+            try:
+                with closing(connection.cursor()) as cursor:
+                    cursor.execute(self.query_to_provider)
+                    rows = cursor.fetchall()
+            except Error as err:
+                self.error(f"execute_count_query: {err}")
+                self.status = 'ERR'
+                discard = True
+                return
 
-        if rows == None:
-            self.warning(f"Retrieved 0 results, but count_query returned {found}")
-            self.message(f"Retrieved 0 of 0 results from: {self.provider.name}")
-            return
+            if rows == None:
+                self.warning(f"Retrieved 0 results, but count_query returned {found}")
+                self.message(f"Retrieved 0 of 0 results from: {self.provider.name}")
+                return
             # end if
-        # end if
 
-        self.response = rows
-        self.found = found
-        self.status = 'READY'
+            self.response = rows
+            self.found = found
+            self.status = 'READY'
 
-        cursor.close()
-        connection.close()
+        finally:
+            self.return_connection(connection, discard=discard)
 
         return
-    
\ No newline at end of file
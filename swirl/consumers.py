@@ -1,8 +1,11 @@
 import json
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from swirl.models import Result, Search
 from swirl.processors import *
+from swirl.mixers import alloc_mixer, Mixer
+from swirl.streaming import search_group_name, search_is_final
 import asyncio
 
 import logging
@@ -84,4 +87,71 @@ class Consumer(AsyncWebsocketConsumer):
             except:
                 await self.send(text_data=json.dumps({
                     'message': 'No data'
-                }))
\ No newline at end of file
+                }))
+##################################################
+
+class SearchStreamConsumer(AsyncWebsocketConsumer):
+
+    '''
+    Streams the mixed result page for one search: a page each time a provider finishes, then a final page after post result processing
+    Connect with ?token=<token>&search_id=<id>, optionally &result_mixer=<mixer>&page=<n>&explain=<true|false>&provider=<id>
+    '''
+
+    async def connect(self):
+        if not self.scope['user'].is_authenticated or not self.scope.get('search_id'):
+            await self.close(code=403)
+            return
+
+        self.search_id = int(self.scope['search_id'])
+        self.group_name = search_group_name(self.search_id)
+        query_params = parse_qs(self.scope.get('query_string', b'').decode('utf-8'))
+        self.result_mixer = query_params.get('result_mixer', [None])[0]
+        try:
+            self.page = int(query_params.get('page', ['1'])[0] or 1)
+        except ValueError:
+            self.page = 0
+        if self.page < 1:
+            await self.close(code=400)
+            return
+        self.explain = query_params.get('explain', ['true'])[0].lower() != 'false'
+        self.provider = query_params.get('provider', [None])[0]
+
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        # some providers may have finished before the socket connected
+        await self.send_page()
+
+    async def disconnect(self, code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    @database_sync_to_async
+    def mix_page(self):
+        try:
+            search = Search.objects.get(id=self.search_id)
+        except Search.DoesNotExist:
+            return 'ERR_SEARCH_NOT_FOUND', None
+        mixer = self.result_mixer or search.result_mixer
+        try:
+            results = alloc_mixer(mixer)(search.id, search.results_requested, self.page, self.explain, self.provider).mix()
+        except (KeyError, TypeError) as err:
+            # interim pages can hold results the post result processors have not scored yet
+            logger.debug(f'SearchStreamConsumer: {mixer} failed on interim results, using arrival order: {err}')
+            results = Mixer(search.id, search.results_requested, self.page, self.explain, self.provider).mix()
+        return search.status, results
+
+    async def send_page(self, provider_id=None, final=False):
+        search_status, results = await self.mix_page()
+        final = final or search_is_final(search_status)
+        await self.send(text_data=json.dumps({
+            'search_id': self.search_id,
+            'status': search_status,
+            'provider_id': provider_id,
+            'final': final,
+            'results': results
+        }, default=str))
+        if final:
+            await self.close()
+
+    async def search_update(self, event):
+        await self.send_page(provider_id=event.get('provider_id'), final=event.get('final', False))
@@ -0,0 +1,200 @@
+'''
+@author:     Sid Probstein
+@contact:    sid@swirl.today
+'''
+
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from celery.utils.log import get_task_logger
+logger = get_task_logger(__name__)
+
+module_name = 'cpu_executor.py'
+
+SWIRL_CPU_POOL = getattr(settings, 'SWIRL_CPU_POOL', False)
+SWIRL_CPU_POOL_SIZE = getattr(settings, 'SWIRL_CPU_POOL_SIZE', 0)
+SWIRL_CPU_POOL_AFFINITY = getattr(settings, 'SWIRL_CPU_POOL_AFFINITY', [])
+SWIRL_CPU_POOL_PRELOAD = getattr(settings, 'SWIRL_CPU_POOL_PRELOAD', ['spacy'])
+SWIRL_CPU_POOL_MIN_BATCH = getattr(settings, 'SWIRL_CPU_POOL_MIN_BATCH', 25)
+
+########################################
+########################################
+
+def split_batches(items, parts, min_batch=1):
+
+    '''
+    Splits items into at most parts contiguous batches of at least min_batch items each, in order
+    '''
+
+    if not items:
+        return []
+    parts = max(1, min(parts, len(items) // max(1, min_batch)))
+    size, extra = divmod(len(items), parts)
+    batches = []
+    start = 0
+    for part in range(parts):
+        end = start + size + (1 if part < extra else 0)
+        batches.append(items[start:end])
+        start = end
+    return batches
+
+def _init_pool_process(affinity, preload):
+    # runs once in each pool process: pin it, set up django and load the models before any batch arrives
+    if affinity and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, affinity)
+        except OSError as err:
+            logger.warning(f"{module_name}: can't set affinity {affinity}: {err}")
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'swirl_server.settings')
+    django.setup()
+    import swirl.processors # registers the models
+    if preload:
+        from swirl.model_registry import preload_models
+        preload_models(preload)
+
+class CpuExecutor:
+
+    '''
+    A warm pool of processes for CPU bound result processing, so one large search can use every core of a node
+    Processes are spawned, not forked, and load the models once at start; batches and results are pickled both ways
+    If the pool can't run here, e.g. inside a daemonic Celery prefork child, map_batches() returns None and callers run inline
+    '''
+
+    def __init__(self, size=SWIRL_CPU_POOL_SIZE, affinity=SWIRL_CPU_POOL_AFFINITY, preload=SWIRL_CPU_POOL_PRELOAD):
+        self.size = size or len(affinity) or os.cpu_count() or 1
+        self.affinity = list(affinity)
+        self.preload = list(preload)
+        self._pool = None
+        self._pid = os.getpid()
+        self._disabled = False
+        self._lock = threading.Lock()
+
+    def pool(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # forked: the parent's pool processes aren't ours
+                self._pool = None
+                self._pid = os.getpid()
+            if self._pool is None and not self._disabled and multiprocessing.current_process().daemon:
+                self._disable("this worker's processes are daemonic (celery prefork) and can't have children")
+            if self._pool is None and not self._disabled:
+                self._pool = ProcessPoolExecutor(max_workers=self.size, mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=_init_pool_process, initargs=(self.affinity, self.preload))
+                logger.info(f"{module_name}: started a pool of {self.size} processes")
+            return self._pool
+
+    def map_batches(self, func, batches, *args):
+
+        '''
+        Returns [func(batch, *args) for batch in batches], computed in the pool, or None if the pool can't be used
+        Exceptions raised by func are raised here
+        '''
+
+        pool = self.pool()
+        if pool is None:
+            return None
+        try:
+            futures = [pool.submit(func, batch, *args) for batch in batches]
+            return [future.result() for future in futures]
+        except AssertionError as err:
+            # daemonic processes are not allowed to have children
+            with self._lock:
+                self._disable(f"{err}")
+        except BrokenProcessPool as err:
+            logger.error(f"{module_name}: process pool broke, running inline: {err}")
+        self.shutdown()
+        return None
+
+    def map_items(self, func, items, *args, min_batch=SWIRL_CPU_POOL_MIN_BATCH):
+
+        '''
+        Splits items into one batch per process and returns the concatenated func(batch, *args) lists,
+        or None if there are too few items to split or the pool can't be used
+        '''
+
+        batches = split_batches(items, self.size, min_batch)
+        if len(batches) < 2:
+            return None
+        outputs = self.map_batches(func, batches, *args)
+        if outputs is None:
+            return None
+        return [output for batch_output in outputs for output in batch_output]
+
+    def _disable(self, reason):
+        # called with the lock held; logged once per process, so operators can see SWIRL_CPU_POOL has no effect here
+        self._disabled = True
+        logger.error(f"{module_name}: SWIRL_CPU_POOL is on, but process {os.getpid()} can't start the pool: {reason}; "
+                     f"result processing runs inline, run celery with -P threads or -P gevent to use the pool")
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+cpu_executor = CpuExecutor()
+
+########################################
+
+def merge_relevancy_feedback(records):
+    from swirl.processors.utils import result_processor_feedback_empty_record
+    merged = result_processor_feedback_empty_record()
+    query = merged['result_processor_feedback']['query']
+    for record in records:
+        for field, lens in record['result_processor_feedback']['query'].get('dict_result_lens', {}).items():
+            query['dict_result_lens'].setdefault(field, []).extend(lens)
+    # every batch records the same query length
+    query['list_query_lens'] = records[0]['result_processor_feedback']['query'].get('list_query_lens', [])
+    return merged
+
+# result processors that treat each item on its own, so a provider's results can be split across processes,
+# with the function that merges the feedback records the batches append, if any
+SPLITTABLE_RESULT_PROCESSORS = {
+    'CosineRelevancyResultProcessor': merge_relevancy_feedback,
+    'RedactPIIResultProcessor': None,
+    'DateFinderResultProcessor': None,
+    'CleanTextResultProcessor': None
+}
+
+def _run_result_processor(results, processor, provider, query_string, request_id, feedback):
+    from swirl.processors import alloc_processor
+    proc = alloc_processor(processor=processor)(results, provider, query_string, request_id=request_id, result_processor_json_feedback=feedback)
+    modified = proc.process()
+    return modified, proc.get_results()
+
+def run_result_processor(processor, results, provider, query_string, request_id='', feedback=None):
+
+    '''
+    Runs a splittable result processor over results in the pool, one batch per process
+    Returns (modified, results) as the processor would inline, with the merged feedback record appended,
+    or None if the processor should run inline
+    '''
+
+    if processor not in SPLITTABLE_RESULT_PROCESSORS:
+        return None
+    batches = split_batches(results, cpu_executor.size, SWIRL_CPU_POOL_MIN_BATCH)
+    if len(batches) < 2:
+        return None
+    outputs = cpu_executor.map_batches(_run_result_processor, batches, processor, provider, query_string, request_id, feedback)
+    if outputs is None:
+        return None
+    modified = 0
+    processed_results = []
+    feedback_records = []
+    for batch_modified, batch_results in outputs:
+        modified = modified + batch_modified
+        if batch_results and 'result_processor_feedback' in batch_results[-1]:
+            feedback_records.append(batch_results.pop(-1))
+        processed_results.extend(batch_results)
+    # end for
+    merge = SPLITTABLE_RESULT_PROCESSORS[processor]
+    if merge and feedback_records:
+        processed_results.append(merge(feedback_records))
+    logger.debug(f"{module_name}: {processor} ran {len(batches)} batches of {len(results)} results")
+    return modified, processed_results
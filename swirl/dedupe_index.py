@@ -0,0 +1,154 @@
+'''
+@author:     Sid Probstein
+@contact:    sid@swirl.today
+'''
+
+import hashlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from django.conf import settings
+
+from celery.utils.log import get_task_logger
+logger = get_task_logger(__name__)
+
+from swirl.models import Result, DedupeKey
+from swirl.result_items import result_item_list
+
+module_name = 'dedupe_index.py'
+
+SWIRL_DEDUPE_INDEX = getattr(settings, 'SWIRL_DEDUPE_INDEX', False)
+SWIRL_DEDUPE_TRACKING_PARAMETERS = getattr(settings, 'SWIRL_DEDUPE_TRACKING_PARAMETERS', ['utm_*', 'gclid', 'fbclid', 'msclkid', 'mc_cid', 'mc_eid', '_ga', 'ref', 'ref_src'])
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+########################################
+########################################
+
+def _tracking(parameter):
+    for pattern in SWIRL_DEDUPE_TRACKING_PARAMETERS:
+        if pattern.endswith('*'):
+            if parameter.startswith(pattern[:-1]):
+                return True
+        elif parameter == pattern:
+            return True
+    return False
+
+def canonical_url(url):
+
+    '''
+    Returns url without scheme, www., default port, fragment, tracking parameters or trailing slash, with sorted parameters
+    Values that aren't http(s) urls are returned stripped
+    '''
+
+    value = url.strip()
+    if not value.lower().startswith(('http://', 'https://', 'www.')):
+        return value
+    if value.lower().startswith('www.'):
+        value = 'http://' + value
+    try:
+        parts = urlsplit(value)
+        port = parts.port
+    except ValueError:
+        return url.strip()
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if port and port != DEFAULT_PORTS.get(parts.scheme.lower(), None):
+        host = f'{host}:{port}'
+    path = parts.path.rstrip('/')
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not _tracking(k.lower())))
+    return urlunsplit(('', host, path, query, ''))[2:]
+
+def dedupe_key(value):
+
+    '''
+    Returns the compact signed 64 bit hash of value's canonical form, or None for empty values
+    '''
+
+    if not value:
+        return None
+    if type(value) != str:
+        value = str(value)
+    canonical = canonical_url(value)
+    if not canonical:
+        return None
+    return int.from_bytes(hashlib.blake2b(canonical.encode(), digest_size=8).digest(), 'big', signed=True)
+
+########################################
+
+class DedupeIndex:
+
+    '''
+    The dedupe keys a search has delivered, persisted as DedupeKey rows
+    A search without rows is seeded from its current results, so searches run before the index existed are covered too
+    '''
+
+    def __init__(self, search_id, field):
+        self.search_id = search_id
+        self.field = field
+        self.keys = None
+        self.new_keys = []
+
+    def value(self, item):
+        value = item.get(self.field, None)
+        if not value and item.get('payload', None):
+            value = item['payload'].get(self.field, None)
+        return value
+
+    def load(self, seed=True):
+        if self.keys is not None:
+            return self.keys
+        # security review for 1.7 - OK, filtered by search ID
+        self.keys = set(DedupeKey.objects.filter(search_id=self.search_id).values_list('key', flat=True))
+        if not self.keys and seed:
+            for result in Result.objects.filter(search_id=self.search_id):
+                for item in result_item_list(result):
+                    self.add(item)
+            # end for
+        return self.keys
+
+    def add(self, item):
+
+        '''
+        Records item's key and returns True, or returns False if an item with the same key was already delivered
+        Items without a value for the field are always new
+        '''
+
+        key = dedupe_key(self.value(item))
+        if key is None:
+            return True
+        keys = self.load()
+        if key in keys:
+            return False
+        keys.add(key)
+        self.new_keys.append(key)
+        return True
+
+    def filter(self, items):
+
+        '''
+        Returns the items not delivered before, recording them
+        '''
+
+        return [item for item in items if self.add(item)]
+
+    def record(self, keys):
+
+        '''
+        Records keys, e.g. those a post result processor kept, without checking them
+        '''
+
+        known = self.load(seed=False)
+        for key in keys:
+            if key not in known:
+                known.add(key)
+                self.new_keys.append(key)
+        # end for
+
+    def save(self):
+        if not self.new_keys:
+            return 0
+        DedupeKey.objects.bulk_create([DedupeKey(search_id_id=self.search_id, key=key) for key in self.new_keys], ignore_conflicts=True)
+        saved = len(self.new_keys)
+        self.new_keys = []
+        return saved
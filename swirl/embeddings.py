@@ -3,21 +3,112 @@
 @contact:    sid@swirl.today
 '''
 
+import threading
+from collections import OrderedDict
+
 import logging
 logger = logging.getLogger(__name__)
 
+from django.conf import settings
+
 from pinecone import Pinecone
 from transformers import AutoModel, AutoTokenizer
 import torch
 
-def get_embedding(text):
-    model_name = "intfloat/e5-small-v2"
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModel.from_pretrained(model_name)
-    # Tokenize and get embeddings
-    inputs = tokenizer(text, return_tensors="pt", padding=True, truncation=True)
-    with torch.no_grad():
-        outputs = model(**inputs)
-    # Mean pooling
-    embeddings = outputs.last_hidden_state.mean(dim=1)
-    return embeddings[0].numpy()
+module_name = 'embeddings.py'
+
+SWIRL_EMBEDDING_DEFAULT_MODEL = getattr(settings, 'SWIRL_EMBEDDING_DEFAULT_MODEL', 'intfloat/e5-small-v2')
+SWIRL_EMBEDDING_MODEL_CACHE_SIZE = getattr(settings, 'SWIRL_EMBEDDING_MODEL_CACHE_SIZE', 2)
+SWIRL_EMBEDDING_QUERY_CACHE_SIZE = getattr(settings, 'SWIRL_EMBEDDING_QUERY_CACHE_SIZE', 1024)
+
+#############################################
+#############################################
+
+def normalize_query(text):
+    return ' '.join(text.split())
+
+class EmbeddingService:
+
+    '''
+    Process-wide cache of embedding models and query embeddings
+    Models are kept in an LRU keyed by model name; embeddings in an LRU keyed by (model name, normalized query)
+    '''
+
+    def __init__(self, model_cache_size=SWIRL_EMBEDDING_MODEL_CACHE_SIZE, query_cache_size=SWIRL_EMBEDDING_QUERY_CACHE_SIZE):
+        self.model_cache_size = max(1, model_cache_size)
+        self.query_cache_size = query_cache_size
+        self.models = OrderedDict()
+        self.embeddings = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    def get_model(self, model_name):
+
+        '''
+        Returns (tokenizer, model) for model_name, loading it at most once per process
+        '''
+
+        with self._lock:
+            if model_name in self.models:
+                self.models.move_to_end(model_name)
+                return self.models[model_name]
+            load_lock = self._load_locks.setdefault(model_name, threading.Lock())
+
+        # load outside the cache lock, one loader per model name
+        with load_lock:
+            with self._lock:
+                if model_name in self.models:
+                    self.models.move_to_end(model_name)
+                    return self.models[model_name]
+            logger.info(f"{module_name}: loading embedding model {model_name}")
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+            model = AutoModel.from_pretrained(model_name)
+            model.eval()
+            with self._lock:
+                self.models[model_name] = (tokenizer, model)
+                while len(self.models) > self.model_cache_size:
+                    evicted, _ = self.models.popitem(last=False)
+                    logger.info(f"{module_name}: evicted embedding model {evicted}")
+                return self.models[model_name]
+
+    def embed(self, text, model_name=SWIRL_EMBEDDING_DEFAULT_MODEL):
+
+        '''
+        Returns the mean pooled embedding of text as a numpy array
+        Repeated queries are served from the cache without inference
+        '''
+
+        query = normalize_query(text)
+        key = (model_name, query)
+        with self._lock:
+            if key in self.embeddings:
+                self.embeddings.move_to_end(key)
+                self.hits = self.hits + 1
+                return self.embeddings[key].copy()
+            self.misses = self.misses + 1
+
+        tokenizer, model = self.get_model(model_name)
+        inputs = tokenizer(query, return_tensors="pt", padding=True, truncation=True)
+        with torch.no_grad():
+            outputs = model(**inputs)
+        # Mean pooling
+        embedding = outputs.last_hidden_state.mean(dim=1)[0].numpy()
+
+        if self.query_cache_size > 0:
+            with self._lock:
+                self.embeddings[key] = embedding
+                while len(self.embeddings) > self.query_cache_size:
+                    self.embeddings.popitem(last=False)
+        return embedding.copy()
+
+    def clear(self):
+        with self._lock:
+            self.models.clear()
+            self.embeddings.clear()
+
+embedding_service = EmbeddingService()
+
+def get_embedding(text, model_name=SWIRL_EMBEDDING_DEFAULT_MODEL):
+    return embedding_service.embed(text, model_name)
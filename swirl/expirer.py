@@ -8,10 +8,12 @@ from os import environ
 import logging
 logger = logging.getLogger(__name__)
 
+import time
 from datetime import timedelta
 
 import django
 from django.utils import timezone
+from django.conf import settings
 
 from swirl.utils import swirl_setdir
 path.append(swirl_setdir()) # path to settings.py file
@@ -22,43 +24,69 @@ from swirl.models import Search
 
 module_name = 'expirer.py'
 
+SWIRL_EXPIRER_BATCH_SIZE = getattr(settings, 'SWIRL_EXPIRER_BATCH_SIZE', 500)
+SWIRL_EXPIRER_TIME_BUDGET = getattr(settings, 'SWIRL_EXPIRER_TIME_BUDGET', 60)
+
+# how long a search is kept after its last update, by Search.retention
+RETENTION_PERIODS = {
+    1: timedelta(hours=1),
+    2: timedelta(days=1),
+    3: timedelta(days=30)
+}
+
 ##################################################
 ##################################################
 
-def expirer():
+def retention_cutoffs(now=None):
+
+    '''
+    Returns {retention: cutoff}; searches of that retention last updated before the cutoff are expired
+    '''
+
+    now = now or timezone.now()
+    return {retention: now - period for retention, period in RETENTION_PERIODS.items()}
+
+def expirer(batch_size=SWIRL_EXPIRER_BATCH_SIZE, time_budget=SWIRL_EXPIRER_TIME_BUDGET):
 
     '''
     This fires whenever a Celery Beat event arrives
     Remove searches that are past expiration date, if expiration is not 0
+    Expired searches are selected per retention class with the (retention, date_updated) index and deleted
+    batch_size at a time, cascading to their results; the run stops after time_budget seconds and the rest waits for the next
+    Returns the number of searches deleted per retention class, and of all objects deleted per model
     '''
 
+    start_time = time.time()
+    counts = {'searches': {}, 'deleted': {}, 'complete': True}
+
     # security review for 1.7 - OK - system function
-    searches = Search.objects.filter(retention__gt=0)
-    for search in searches:
-        logger.debug(f"{module_name}: expirer checking: {search.id}")
-        if search.retention == 0:
-            # don't delete - this should not happen because of the filter above
-            logger.warning(f"{module_name}: filter error, reviewed a search with retention = {search.retention}")
-            continue
-        else:
-            expired = False
-            if search.retention == 1:
-                if search.date_updated + timedelta(hours=1) < timezone.now():
-                    expired = True
-            elif search.retention == 2:
-                if search.date_updated + timedelta(days=1) < timezone.now():
-                    expired = True
-            elif search.retention == 3:
-                if search.date_updated + timedelta(month=1) < timezone.now():
-                    expired = True
-            else:
-                logger.error(f"{module_name}: unexpected retention setting: {search.retention}")
-            if expired:
-                # to do: fix this to show local time, someday P4
-                logger.info(f"{module_name}: expirer deleted {search.id}")
-                search.delete()
-            # end if
-        # end if
+    unexpected = Search.objects.filter(retention__gt=0).exclude(retention__in=list(RETENTION_PERIODS)).count()
+    if unexpected:
+        logger.error(f"{module_name}: {unexpected} searches have an unexpected retention setting")
+
+    for retention, cutoff in retention_cutoffs().items():
+        counts['searches'][retention] = 0
+        while True:
+            if time.time() - start_time > time_budget:
+                counts['complete'] = False
+                break
+            ids = list(Search.objects.filter(retention=retention, date_updated__lt=cutoff).order_by().values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            # to do: fix this to show local time, someday P4
+            logger.debug(f"{module_name}: expirer deleting {ids}")
+            _, deleted = Search.objects.filter(id__in=ids).delete()
+            counts['searches'][retention] = counts['searches'][retention] + len(ids)
+            for model, count in deleted.items():
+                counts['deleted'][model] = counts['deleted'].get(model, 0) + count
+            if len(ids) < batch_size:
+                break
+        # end while
+        if not counts['complete']:
+            break
     # end for
 
-    return True
\ No newline at end of file
+    if not counts['complete']:
+        logger.warning(f"{module_name}: expirer stopped after {time_budget}s, the rest expires next run")
+    logger.info(f"{module_name}: expirer deleted {counts['searches']} searches in {time.time() - start_time:.1f}s: {counts['deleted']}")
+    return counts
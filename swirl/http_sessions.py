@@ -0,0 +1,144 @@
+'''
+@author:     Sid Probstein
+@contact:    sid@swirl.today
+'''
+
+import os
+import threading
+from collections import OrderedDict
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import logging
+logger = logging.getLogger(__name__)
+
+from django.conf import settings
+
+module_name = 'http_sessions.py'
+
+SWIRL_HTTP_POOL_SIZE = getattr(settings, 'SWIRL_HTTP_POOL_SIZE', 10)
+SWIRL_HTTP_MAX_SESSIONS = getattr(settings, 'SWIRL_HTTP_MAX_SESSIONS', 64)
+SWIRL_HTTP_KEEPALIVE = getattr(settings, 'SWIRL_HTTP_KEEPALIVE', True)
+SWIRL_HTTP_RETRIES = getattr(settings, 'SWIRL_HTTP_RETRIES', 0)
+SWIRL_HTTP_BACKOFF = getattr(settings, 'SWIRL_HTTP_BACKOFF', 0.2)
+SWIRL_HTTP_RETRY_STATUS = getattr(settings, 'SWIRL_HTTP_RETRY_STATUS', [502, 503, 504])
+
+#############################################
+#############################################
+
+def host_key(url):
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}".lower()
+
+class HttpSessionPool:
+
+    '''
+    Per-process pool of requests.Session objects, one per host, so repeated requests reuse TCP and TLS connections
+    Sessions are kept in an LRU of max_sessions hosts; cookies are never stored, since a session is shared by every user
+    '''
+
+    def __init__(self, pool_size=SWIRL_HTTP_POOL_SIZE, max_sessions=SWIRL_HTTP_MAX_SESSIONS, keepalive=SWIRL_HTTP_KEEPALIVE,
+                 retries=SWIRL_HTTP_RETRIES, backoff=SWIRL_HTTP_BACKOFF, retry_status=SWIRL_HTTP_RETRY_STATUS):
+        self.pool_size = max(1, pool_size)
+        self.max_sessions = max(1, max_sessions)
+        self.keepalive = keepalive
+        self.retries = retries
+        self.backoff = backoff
+        self.retry_status = retry_status
+        self.sessions = OrderedDict()
+        self.requests = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _new_session(self):
+        session = requests.Session()
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        # connection failures are retried for every method; status retries only for idempotent methods
+        # Retry-After is ignored: the request timeout doesn't cover the sleep, and a provider may ask for minutes
+        # with retries off, failures are raised at once, as with requests.get() and requests.post()
+        retry = 0
+        if self.retries:
+            retry = Retry(total=self.retries, connect=self.retries, read=0, status=self.retries, backoff_factor=self.backoff,
+                          status_forcelist=self.retry_status, raise_on_status=False, respect_retry_after_header=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not self.keepalive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def session(self, url):
+
+        '''
+        Returns the session for url's host, creating it if needed
+        '''
+
+        key = host_key(url)
+        with self._lock:
+            if self._pid != os.getpid():
+                # forked: the parent's connections can't be shared
+                self.sessions.clear()
+                self.requests.clear()
+                self._pid = os.getpid()
+            if key in self.sessions:
+                self.sessions.move_to_end(key)
+            else:
+                self.sessions[key] = self._new_session()
+                while len(self.sessions) > self.max_sessions:
+                    # not closed: another thread may still be sending on it; its connections close when it is collected
+                    evicted, session = self.sessions.popitem(last=False)
+                    logger.debug(f"{module_name}: evicted session for {evicted}")
+            return self.sessions[key]
+
+    def request(self, method, url, **kwargs):
+        session = self.session(url)
+        key = host_key(url)
+        with self._lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+        return session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    ########################################
+
+    def stats(self):
+
+        '''
+        Returns per host request, connection and reuse counts for the sessions in the pool
+        '''
+
+        report = {}
+        with self._lock:
+            for key, session in self.sessions.items():
+                connections = 0
+                for adapter in set(session.adapters.values()):
+                    for pool_key in adapter.poolmanager.pools.keys():
+                        connections = connections + adapter.poolmanager.pools[pool_key].num_connections
+                requests_sent = self.requests.get(key, 0)
+                report[key] = {
+                    'requests': requests_sent,
+                    'connections': connections,
+                    'reused': max(0, requests_sent - connections)
+                }
+        return report
+
+    def log_stats(self):
+        for key, entry in self.stats().items():
+            logger.info(f"{module_name}: {key} requests={entry['requests']} connections={entry['connections']} reused={entry['reused']}")
+
+    def close(self):
+        with self._lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
+            self.requests.clear()
+
+http_session_pool = HttpSessionPool()
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.3 on 2026-10-16 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('swirl', '0003_result_filters_search_filters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultItem',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('position', models.IntegerField(default=0)),
+                ('swirl_score', models.FloatField(blank=True, db_index=True, null=True)),
+                ('date_published', models.CharField(blank=True, db_index=True, max_length=64, null=True)),
+                ('url', models.CharField(blank=True, db_index=True, max_length=2048, null=True)),
+                ('item', models.JSONField(default=dict)),
+                ('payload', models.JSONField(blank=True, null=True)),
+                ('explain', models.JSONField(blank=True, null=True)),
+                ('result', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='swirl.result')),
+                ('search_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='swirl.search')),
+            ],
+            options={
+                'ordering': ['result', 'position'],
+            },
+        ),
+    ]
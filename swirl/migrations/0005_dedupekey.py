@@ -0,0 +1,25 @@
+# Generated by Django 5.1.3 on 2026-10-16 11:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('swirl', '0004_resultitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DedupeKey',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('key', models.BigIntegerField()),
+                ('search_id', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='swirl.search')),
+            ],
+            options={
+                'unique_together': {('search_id', 'key')},
+            },
+        ),
+    ]
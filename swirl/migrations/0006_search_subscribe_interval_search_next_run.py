@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-16 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('swirl', '0005_dedupekey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='search',
+            name='subscribe_interval',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='search',
+            name='next_run',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-16 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('swirl', '0006_search_subscribe_interval_search_next_run'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='search',
+            index=models.Index(fields=['retention', 'date_updated'], name='swirl_search_retention_idx'),
+        ),
+    ]
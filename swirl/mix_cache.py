@@ -0,0 +1,108 @@
+'''
+@author:     Sid Probstein
+@contact:    sid@swirl.today
+'''
+
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models.signals import post_save, post_delete
+
+from celery.utils.log import get_task_logger
+logger = get_task_logger(__name__)
+
+from swirl.models import Result
+
+module_name = 'mix_cache.py'
+
+SWIRL_MIX_CACHE = getattr(settings, 'SWIRL_MIX_CACHE', 'swirl_results')
+SWIRL_MIX_CACHE_TTL = getattr(settings, 'SWIRL_MIX_CACHE_TTL', 0)
+
+# each process would only see its own version bumps and serve stale mixes, so these backends disable the mix cache
+PROCESS_LOCAL_CACHES = (LocMemCache, DummyCache)
+_refused = set()
+
+########################################
+########################################
+
+def get_mix_cache():
+    if not SWIRL_MIX_CACHE_TTL:
+        return None
+    try:
+        cache = caches[SWIRL_MIX_CACHE]
+    except InvalidCacheBackendError as err:
+        logger.warning(f"{module_name}: mix cache {SWIRL_MIX_CACHE} not configured: {err}")
+        return None
+    if isinstance(cache, PROCESS_LOCAL_CACHES):
+        if SWIRL_MIX_CACHE not in _refused:
+            _refused.add(SWIRL_MIX_CACHE)
+            logger.error(f"{module_name}: mix cache disabled, {SWIRL_MIX_CACHE} is a {type(cache).__name__}; results saved by other workers wouldn't invalidate it, use a shared backend such as redis")
+        return None
+    return cache
+
+def results_version_key(search_id):
+    return f"swirl_mix_version:{search_id}"
+
+def results_version(search_id):
+    cache = get_mix_cache()
+    if cache is None:
+        return 0
+    return cache.get(results_version_key(search_id), 0)
+
+def bump_results_version(search_id):
+
+    '''
+    Invalidates every cached mix of search_id; call whenever its Results or their items are written
+    '''
+
+    cache = get_mix_cache()
+    if cache is None:
+        return
+    try:
+        cache.set(results_version_key(search_id), time.time_ns(), None)
+    except Exception as err:
+        logger.warning(f"{module_name}: version update failed for search {search_id}: {err}")
+
+def mix_cache_key(search, mixer, provider=None, base_url=''):
+
+    '''
+    Key for one mix of a search: search id and date_updated, mixer, provider filter, the url the links are built from and the results version
+    '''
+
+    variant = hashlib.sha256(json.dumps([provider, base_url], default=str).encode()).hexdigest()[:16]
+    return f"swirl_mix:{search.id}:{search.date_updated.timestamp()}:{mixer}:{variant}:{results_version(search.id)}"
+
+def get_mix(key):
+    cache = get_mix_cache()
+    if cache is None:
+        return None
+    try:
+        return cache.get(key, None)
+    except Exception as err:
+        logger.warning(f"{module_name}: get failed: {err}")
+        return None
+
+def set_mix(key, entry):
+    cache = get_mix_cache()
+    if cache is None:
+        return False
+    try:
+        cache.set(key, entry, SWIRL_MIX_CACHE_TTL)
+    except Exception as err:
+        logger.warning(f"{module_name}: set failed: {err}")
+        return False
+    return True
+
+########################################
+
+def invalidate_search_mixes(sender, instance, **kwargs):
+    bump_results_version(instance.search_id_id)
+
+post_save.connect(invalidate_search_mixes, sender=Result, dispatch_uid='swirl_mix_cache_save')
+post_delete.connect(invalidate_search_mixes, sender=Result, dispatch_uid='swirl_mix_cache_delete')
@@ -15,8 +15,6 @@ path.append(swirl_setdir()) # path to settings.py file
 environ.setdefault('DJANGO_SETTINGS_MODULE', 'swirl_server.settings')
 django.setup()
 
-from operator import itemgetter
-
 from django.urls import reverse
 
 import logging
@@ -47,7 +45,7 @@ class DateMixer(Mixer):
         self.found = int(self.found) - int(unknown)
         self.mix_wrapper['info']['results']['retrieved_total'] = self.found
 
-        self.mixed_results = sorted(dated_results, key=itemgetter('date_published'), reverse=True)
+        self.mix_top_k([dated_results], date_key)
 
 #############################################
 
@@ -62,18 +60,17 @@ class DateNewItemsMixer(Mixer):
 
         # clear new flag if requested
         if self.mark_all_read:
-            marked = 0
+            marked_items = []
             for result in self.results:
-                sv = False
-                for item in result.json_results:
+                for item in self.result_items.items(result):
                     if 'new' in item:
                         del item['new']
-                        marked = marked + 1
-                        sv = True
+                        marked_items.append(item)
                 # end for
-                if sv:
-                    result.save()
             # end for
+            marked = len(marked_items)
+            if marked_items:
+                self.result_items.save(fields=['item'], changed=marked_items)
             self.mix_wrapper['messages'].append(f"[{datetime.now()}] DateNewItemsMixer marked {marked} results as read")
         # end if
 
@@ -95,4 +92,4 @@ class DateNewItemsMixer(Mixer):
         else:
             self.mix_wrapper['messages'].append(f"[{datetime.now()}] DateNewItemsMixer hid {len(self.all_results) - int(self.found)} old results")
 
-        self.mixed_results = sorted(dated_results, key=itemgetter('date_published'), reverse=True)
+        self.mix_top_k([dated_results], date_key)
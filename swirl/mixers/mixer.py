@@ -5,6 +5,8 @@
 '''
 import json
 from urllib.parse import urlparse
+from itertools import chain
+from copy import deepcopy
 
 from sys import path
 from os import environ
@@ -27,7 +29,10 @@ logger = logging.getLogger(__name__)
 from natsort import natsorted
 
 from swirl.models import Search, Result
+from swirl.result_items import ResultItemSet, result_items_at
+from swirl.mix_cache import get_mix_cache, mix_cache_key, get_mix, set_mix
 from swirl.banner import SWIRL_BANNER_TEXT
+from swirl.mixers.utils import top_k
 
 ########################################
 ########################################
@@ -50,13 +55,20 @@ class Mixer:
         self.search = None
         self.mix_wrapper = {}
         self.all_results = []
+        self.result_lists = []
         self.mixed_results = None
+        # number of ranked results before mixed_results[0], when order() only materializes the requested page
+        self.mixed_offset = 0
         self.found = 0
         self.stack = 0
         self.result_mixer = None
         self.mark_all_read = mark_all_read
         self.status = "INIT"
         self.request = request
+        # key and entry of the materialized mix, see mix()
+        self.mix_cache_key = None
+        self.mix_cache_entry = None
+        self.item_refs = None
 
         try:
             if self.provider:
@@ -80,13 +92,26 @@ class Mixer:
 
         self.result_mixer = self.type
 
+        scheme, hostname, port = get_url_details(self.request)
+
+        # a finished search's mix is cached; on a hit mix() loads only the requested page's items, so skip the join below
+        if not self.mark_all_read and self.search.status.endswith('_READY') and get_mix_cache() is not None:
+            self.mix_cache_key = mix_cache_key(self.search, self.type, self.provider, f'{scheme}://{hostname}:{port}')
+            self.mix_cache_entry = get_mix(self.mix_cache_key)
+            if self.mix_cache_entry:
+                self.mix_wrapper = deepcopy(self.mix_cache_entry['wrapper'])
+                self.found = self.mix_cache_entry['found']
+                self.status = 'READY'
+                return
+            self.item_refs = {}
+        # end if
+
         self.mix_wrapper = {}
         self.mix_wrapper['messages'] = [ SWIRL_BANNER_TEXT ]
         self.mix_wrapper['info'] = {}
         self.mix_wrapper['info']['results'] = {}
         self.mix_wrapper['results'] = None
 
-        scheme, hostname, port = get_url_details(self.request)
         messages = []
         self.mix_wrapper['info']['results']['found_total'] = 0
         for result in self.results:
@@ -124,10 +149,15 @@ class Mixer:
         self.mix_wrapper['info']['search']['query_string_processed'] = self.search.query_string_processed
         self.mix_wrapper['info']['search']['rerun_url'] = f'{scheme}://{hostname}:{port}/swirl/search/?rerun={self.search.id}'
 
-        # join json_results
+        # join json_results, or the ResultItem rows if the items are stored that way
+        self.result_items = ResultItemSet(self.results)
         for result in self.results:
-            if type(result.json_results) == list:
-                self.all_results = self.all_results + result.json_results
+            if type(self.result_items.items(result)) == list:
+                self.result_lists.append(self.result_items.items(result))
+                self.all_results.extend(self.result_items.items(result))
+                if self.item_refs is not None:
+                    for position, item in enumerate(self.result_items.items(result)):
+                        self.item_refs[id(item)] = (result.id, position)
 
         self.found = len(self.all_results)
 
@@ -159,14 +189,68 @@ class Mixer:
 
         '''
         Executes the workflow for a given mixer
+        When the mix cache is on, the full order of a finished search is computed once and cached with the wrapper;
+        every page after that is a slice of the cached order
         '''
 
-        self.order()
+        if self.mix_cache_entry:
+            self.order_from_cache()
+        elif self.mix_cache_key:
+            self.order_to_cache()
+        else:
+            self.order()
         self.finalize()
         return self.mix_wrapper
 
     ########################################
 
+    def mix_page(self, ranked, blocked=[]):
+
+        '''
+        Sets mixed_results to the ranked results up to the requested page, which starts at mixed_offset, plus all blocked results
+        '''
+
+        self.mixed_offset = min((int(self.page)-1)*int(self.results_requested), len(ranked))
+        self.mixed_results = ranked[self.mixed_offset:int(self.results_needed)] + blocked
+
+    def order_to_cache(self):
+
+        '''
+        Orders all results, caches the order as (result id, position) refs with the unfinalized wrapper, then takes the page
+        '''
+
+        page, results_needed = self.page, self.results_needed
+        self.page, self.results_needed = 1, len(self.all_results)
+        self.order()
+        self.page, self.results_needed = page, results_needed
+
+        ranked = [result for result in self.mixed_results if 'result_block' not in result]
+        blocked = [result for result in self.mixed_results if 'result_block' in result]
+        entry = {
+            'wrapper': deepcopy(self.mix_wrapper),
+            'found': self.found,
+            'ranked': [self.item_refs[id(result)] for result in ranked],
+            'blocked': [self.item_refs[id(result)] for result in blocked]
+        }
+        if set_mix(self.mix_cache_key, entry):
+            logger.debug(f"{self}: cached mix of {len(entry['ranked'])} results")
+        self.mix_page(ranked, blocked)
+
+    def order_from_cache(self):
+
+        '''
+        Loads the requested page of the cached order
+        '''
+
+        ranked = self.mix_cache_entry['ranked']
+        start = min((int(self.page)-1)*int(self.results_requested), len(ranked))
+        refs = ranked[start:int(self.results_needed)]
+        items = result_items_at(self.search_id, refs + self.mix_cache_entry['blocked'])
+        self.mixed_offset = start
+        self.mixed_results = items
+
+    ########################################
+
     def order(self):
 
         '''
@@ -174,7 +258,29 @@ class Mixer:
         Base class, intended to be overriden!
         '''
 
-        self.mixed_results = self.all_results[(self.page-1)*self.results_requested:(self.page)*self.results_requested]
+        self.mix_page(self.all_results)
+
+    ########################################
+
+    def mix_top_k(self, result_lists, key):
+
+        '''
+        Orders result_lists by key into mixed_results, materializing only the requested page, which starts at mixed_offset
+        Uses a heap over the lists, so page N costs O(n log (N * results_requested)) instead of sorting everything
+        result_block results are all kept, in key order, since finalize() moves them to their blocks on every page
+        '''
+
+        blocked = []
+
+        def unblocked():
+            for result in chain.from_iterable(result_lists):
+                if 'result_block' in result:
+                    blocked.append(result)
+                else:
+                    yield result
+
+        ranked = top_k([unblocked()], int(self.results_needed), key)
+        self.mix_page(ranked, sorted(blocked, key=key))
 
     ########################################
 
@@ -185,14 +291,14 @@ class Mixer:
         '''
 
         # check for overrun
-        if (int(self.page)-1)*int(self.results_requested) > len(self.mixed_results):
+        if (int(self.page)-1)*int(self.results_requested) > self.mixed_offset + len(self.mixed_results):
             self.error("Page not found, results exhausted")
             self.mix_wrapper['results'] = []
             self.mix_wrapper['messages'].append(f"[{datetime.now()}] Results exhausted for {self.search_id}")
             return
 
         # number all result blocks
-        mixed_result_number = 1
+        mixed_result_number = self.mixed_offset + 1
         mixed_results = []
         block_dict = {}
         for result in self.mixed_results:
@@ -247,7 +353,7 @@ class Mixer:
 
         # extract the page of mixed results
         self.mixed_results = mixed_results
-        self.mix_wrapper['results'] = self.mixed_results[(int(self.page)-1)*int(self.results_requested):int(self.results_needed)]
+        self.mix_wrapper['results'] = self.mixed_results[(int(self.page)-1)*int(self.results_requested)-self.mixed_offset:int(self.results_needed)-self.mixed_offset]
         self.mix_wrapper['info']['results']['retrieved'] = len(self.mix_wrapper['results'])
 
         scheme, hostname, port = get_url_details(self.request)
@@ -18,8 +18,6 @@ django.setup()
 import logging
 logger = logging.getLogger(__name__)
 
-from operator import itemgetter
-
 from swirl.mixers.mixer import Mixer
 from swirl.mixers.utils import *
 
@@ -32,8 +30,8 @@ class RelevancyMixer(Mixer):
 
     def order(self):
 
-        # sort by score
-        self.mixed_results = sorted(sorted(sorted(self.all_results, key=itemgetter('searchprovider_rank')), key=itemgetter('date_published'), reverse=True), key=itemgetter('swirl_score'), reverse=True)
+        # sort by score, then date, then provider rank
+        self.mix_top_k(self.result_lists, relevancy_key)
 
 #############################################
 
@@ -48,18 +46,17 @@ class RelevancyNewItemsMixer(Mixer):
 
         # clear new flag if requested
         if self.mark_all_read:
-            marked = 0
+            marked_items = []
             for result in self.results:
-                sv = False
-                for item in result.json_results:
+                for item in self.result_items.items(result):
                     if 'new' in item:
                         del item['new']
-                        marked = marked + 1
-                        sv = True
+                        marked_items.append(item)
                 # end for
-                if sv:
-                    result.save()
             # end for
+            marked = len(marked_items)
+            if marked_items:
+                self.result_items.save(fields=['item'], changed=marked_items)
             self.mix_wrapper['messages'].append(f"[{datetime.now()}] RelevancyNewItemsMixer marked {marked} results as read")
         # end if
 
@@ -70,5 +67,5 @@ class RelevancyNewItemsMixer(Mixer):
         else:
             self.mix_wrapper['messages'].append(f"[{datetime.now()}] RelevancyNewItemsMixer hid {len(self.all_results) - int(self.found)} old results")
 
-        # sort by score
-        self.mixed_results = sorted(sorted(sorted(self.new_results, key=itemgetter('searchprovider_rank')), key=itemgetter('date_published'), reverse=True), key=itemgetter('swirl_score'), reverse=True)
+        # sort by score, then date, then provider rank
+        self.mix_top_k([self.new_results], relevancy_key)
@@ -32,7 +32,7 @@ class StackNMixer(Mixer):
     def order(self):
 
         # sort the json_results by score
-        ranked_results = sorted(sorted(self.all_results, key=itemgetter('searchprovider_rank')), key=itemgetter('swirl_score'), reverse=True)
+        ranked_results = sorted(self.all_results, key=lambda result: (-result['swirl_score'], result['searchprovider_rank']))
         # organize results by provider
         dict_ranked_by_provider = {}
         for result in ranked_results:
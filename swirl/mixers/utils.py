@@ -15,6 +15,9 @@ django.setup()
 
 from django.conf import settings
 
+import heapq
+from itertools import chain
+
 #############################################    
 
 SWIRL_BANNER_TEXT = getattr(settings, 'SWIRL_BANNER_TEXT', '__S_W_I_R_L__1_._X_______________________________________________________________')
@@ -37,3 +40,39 @@ def create_mix_wrapper(result_sets):
         mix_wrapper['info'][result_set.searchprovider]['result_processor']=result_set.result_processor
     mix_wrapper['results'] = None
     return mix_wrapper
+
+#############################################
+
+class Descending:
+
+    '''
+    Sort key wrapper that orders any comparable value, e.g. a date string, largest first
+    '''
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+def relevancy_key(result):
+    # one composite key for swirl_score desc, date_published desc, searchprovider_rank asc
+    return (-result['swirl_score'], Descending(result['date_published']), result['searchprovider_rank'])
+
+def date_key(result):
+    return Descending(result['date_published'])
+
+def top_k(result_lists, k, key):
+
+    '''
+    accepts: lists of results (e.g. one per provider), the number needed and a sort key
+    returns: the first k results in key order, ties kept in input order, i.e. sorted(chain(*result_lists), key=key)[:k]
+    uses a heap, O(n log k), without joining the lists
+    '''
+
+    return heapq.nsmallest(k, chain.from_iterable(result_lists), key=key)
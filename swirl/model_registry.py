@@ -0,0 +1,122 @@
+'''
+@author:     Sid Probstein
+@contact:    sid@swirl.today
+'''
+
+import threading
+import time
+
+import logging
+logger = logging.getLogger(__name__)
+
+module_name = 'model_registry.py'
+
+#############################################
+#############################################
+
+class LazyModel:
+
+    '''
+    Stands in for a heavy model (spaCy, Presidio, NLTK corpora, ...) until it is first used
+    The model is then loaded once per process; calls, attributes, `in` and iteration are forwarded to it
+    '''
+
+    def __init__(self, name, loader, module=''):
+        self._name = name
+        self._loader = loader
+        self._module = module
+        self._model = None
+        self._loaded = False
+        self._load_time = 0.0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"LazyModel({self._name}, loaded={self._loaded})"
+
+    def load(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    start_time = time.time()
+                    self._model = self._loader()
+                    self._load_time = time.time() - start_time
+                    self._loaded = True
+                    logger.info(f"{module_name}: loaded {self._name} for {self._module} in {self._load_time:.2f}s")
+        return self._model
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def __getattr__(self, attr):
+        # private names are never forwarded; this also protects half-built instances (copy, pickle)
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        return getattr(self.load(), attr)
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+    def __contains__(self, item):
+        return item in self.load()
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        return len(self.load())
+
+#############################################
+
+MODEL_REGISTRY = {}
+
+def register_model(name, loader, module=''):
+
+    '''
+    Registers a loader under name and returns the LazyModel standing in for it
+    Registering the same name again returns the existing LazyModel
+    '''
+
+    if name in MODEL_REGISTRY:
+        return MODEL_REGISTRY[name]
+    MODEL_REGISTRY[name] = LazyModel(name, loader, module=module)
+    return MODEL_REGISTRY[name]
+
+def preload_models(names=None):
+
+    '''
+    Loads the named models, or all registered models, now
+    Call before forking (e.g. Celery worker_init) so prefork children share the pages copy-on-write
+    '''
+
+    for name, model in MODEL_REGISTRY.items():
+        if names and name not in names:
+            continue
+        try:
+            model.load()
+        except Exception as err:
+            logger.error(f"{module_name}: failed to preload {name}: {err}")
+    return startup_report()
+
+def startup_report():
+
+    '''
+    Returns one entry per registered model with the module that uses it, whether it is loaded and the load time
+    '''
+
+    return [
+        {
+            'model': name,
+            'module': model._module,
+            'loaded': model.loaded,
+            'load_time': round(model._load_time, 4)
+        }
+        for name, model in MODEL_REGISTRY.items()
+    ]
+
+def log_startup_report():
+    total = 0.0
+    for entry in startup_report():
+        total = total + entry['load_time']
+        logger.info(f"{module_name}: {entry['module']}: {entry['model']} loaded={entry['loaded']} load_time={entry['load_time']}s")
+    logger.info(f"{module_name}: total model load time {total:.2f}s")
@@ -169,6 +169,9 @@ class Search(models.Model):
     results_requested = models.IntegerField(default=10)
     searchprovider_list = models.JSONField(default=list, blank=True)
     subscribe = models.BooleanField(default=False)
+    # seconds between subscription updates, 0 for SWIRL_SUBSCRIBE_INTERVAL; next_run is set by the subscription scheduler
+    subscribe_interval = models.IntegerField(default=0)
+    next_run = models.DateTimeField(null=True, blank=True, db_index=True)
     status = models.CharField(max_length=50, default='NEW_SEARCH')
     time = models.FloatField(default=0.0)
     PRE_QUERY_PROCESSOR_CHOICES = [
@@ -213,6 +216,8 @@ class Search(models.Model):
 
     class Meta:
         ordering = ['-date_updated']
+        # the expirer selects by retention class and cutoff
+        indexes = [models.Index(fields=['retention', 'date_updated'], name='swirl_search_retention_idx')]
 
     def get_absolute_url(self):
         # Returns the URL to access
@@ -255,6 +260,39 @@ class Result(models.Model):
         signature = str(self.id) + ':' + str(self.search_id) + ':' + str(self.searchprovider)
         return signature
 
+class ResultItem(models.Model):
+    # one Result.json_results item, used instead of json_results when SWIRL_RESULT_ITEM_STORAGE is on
+    # item holds every field but payload and explain; swirl_score, date_published and url are indexed copies
+    id = models.BigAutoField(primary_key=True)
+    result = models.ForeignKey(Result, on_delete=models.CASCADE, related_name='items')
+    search_id = models.ForeignKey(Search, on_delete=models.CASCADE)
+    position = models.IntegerField(default=0)
+    swirl_score = models.FloatField(null=True, blank=True, db_index=True)
+    date_published = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    url = models.CharField(max_length=2048, null=True, blank=True, db_index=True)
+    item = models.JSONField(default=dict)
+    payload = models.JSONField(null=True, blank=True)
+    explain = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['result', 'position']
+
+    def __str__(self):
+        signature = str(self.id) + ':' + str(self.result_id) + ':' + str(self.position)
+        return signature
+
+class DedupeKey(models.Model):
+    # hash of a canonical dedupe field value (e.g. url) already delivered by a search, see swirl/dedupe_index.py
+    id = models.BigAutoField(primary_key=True)
+    search_id = models.ForeignKey(Search, on_delete=models.CASCADE)
+    key = models.BigIntegerField()
+
+    class Meta:
+        unique_together = [['search_id', 'key']]
+
+    def __str__(self):
+        return str(self.search_id_id) + ':' + str(self.key)
+
 class QueryTransform(models.Model) :
     id = models.BigAutoField(primary_key=True)
     name = models.CharField(max_length=255)
@@ -0,0 +1,123 @@
+'''
+@author:     Sid Probstein
+@contact:    sid@swirl.today
+'''
+
+import re
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+module_name = 'near_dupes.py'
+
+# 2^31 - 1, so (a * x + b) stays within uint64 for 31 bit a, b and x
+MINHASH_PRIME = np.uint64((1 << 31) - 1)
+MINHASH_SEED = 1717
+
+WORD_PATTERN = re.compile(r'\w+')
+
+#############################################
+#############################################
+
+@lru_cache(maxsize=8)
+def _hash_functions(permutations):
+    rng = np.random.RandomState(MINHASH_SEED)
+    a = rng.randint(1, int(MINHASH_PRIME), size=(permutations, 1)).astype(np.uint64)
+    b = rng.randint(0, int(MINHASH_PRIME), size=(permutations, 1)).astype(np.uint64)
+    return a, b
+
+def shingles(text, size=3):
+
+    '''
+    Returns the set of lower cased word size-grams in text; texts shorter than size are one shingle
+    '''
+
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < size:
+        return set([' '.join(words)]) if words else set()
+    return set(' '.join(words[i:i+size]) for i in range(len(words) - size + 1))
+
+class NearDuplicateIndex:
+
+    '''
+    MinHash signatures with LSH banding: texts whose estimated Jaccard similarity (word shingles) reaches threshold are near duplicates
+    Each signature is split into bands; only texts sharing a band are compared, so a lookup doesn't scan every indexed text
+    '''
+
+    def __init__(self, threshold=0.8, permutations=128, bands=32, shingle_size=3):
+        if permutations % bands != 0:
+            raise ValueError(f"{module_name}: permutations ({permutations}) must be a multiple of bands ({bands})")
+        self.threshold = threshold
+        self.permutations = permutations
+        self.bands = bands
+        self.rows = permutations // bands
+        self.shingle_size = shingle_size
+        self.a, self.b = _hash_functions(permutations)
+        self.buckets = [{} for _ in range(bands)]
+        self.signatures = []
+
+    def signature(self, text):
+
+        '''
+        Returns text's MinHash signature, or None if it has no words
+        '''
+
+        text_shingles = shingles(text, self.shingle_size)
+        if not text_shingles:
+            return None
+        hashes = np.fromiter((zlib.crc32(shingle.encode()) for shingle in text_shingles), dtype=np.uint64, count=len(text_shingles))
+        hashes = hashes % MINHASH_PRIME
+        return ((self.a * hashes + self.b) % MINHASH_PRIME).min(axis=1)
+
+    def _band_keys(self, signature):
+        return [signature[band*self.rows:(band+1)*self.rows].tobytes() for band in range(self.bands)]
+
+    def match(self, signature):
+
+        '''
+        Returns the id of an indexed signature similar to signature, or None
+        '''
+
+        if signature is None:
+            return None
+        checked = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            for candidate in self.buckets[band].get(key, []):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                if np.count_nonzero(self.signatures[candidate] == signature) / self.permutations >= self.threshold:
+                    return candidate
+            # end for
+        # end for
+        return None
+
+    def add(self, signature):
+
+        '''
+        Indexes signature and returns its id; None signatures are not indexed
+        '''
+
+        if signature is None:
+            return None
+        candidate = len(self.signatures)
+        self.signatures.append(signature)
+        for band, key in enumerate(self._band_keys(signature)):
+            self.buckets[band].setdefault(key, []).append(candidate)
+        return candidate
+
+    def add_unique(self, text):
+
+        '''
+        Indexes text and returns True, or returns False without indexing it if it is a near duplicate of an indexed text
+        '''
+
+        signature = self.signature(text)
+        if self.match(signature) is not None:
+            return False
+        self.add(signature)
+        return True
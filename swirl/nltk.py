@@ -8,17 +8,23 @@ logger = logging.getLogger(__name__)
 
 from django.conf import settings
 
-from nltk.corpus import stopwords
+from nltk.corpus import stopwords as nltk_stopwords
+
+from swirl.model_registry import register_model
 
 module_name = 'nltk.py'
 
-try:
-    SWIRL_DEFAULT_QUERY_LANGUAGE = getattr(settings, 'SWIRL_DEFAULT_QUERY_LANGUAGE', 'english')
-    stopwords = set(stopwords.words(SWIRL_DEFAULT_QUERY_LANGUAGE))
-except OSError:
-    logger.warning(f"{module_name}: Warning: No stopwords for language: {SWIRL_DEFAULT_QUERY_LANGUAGE}, check SWIRL_DEFAULT_QUERY_LANGUAGE in swirl_server/settings.py")
-    logger.warning(f"{module_name}: Warning: Using english stopwords")
-    stopwords = set(stopwords.words('english'))
+SWIRL_DEFAULT_QUERY_LANGUAGE = getattr(settings, 'SWIRL_DEFAULT_QUERY_LANGUAGE', 'english')
+
+def _load_stopwords():
+    try:
+        return set(nltk_stopwords.words(SWIRL_DEFAULT_QUERY_LANGUAGE))
+    except OSError:
+        logger.warning(f"{module_name}: Warning: No stopwords for language: {SWIRL_DEFAULT_QUERY_LANGUAGE}, check SWIRL_DEFAULT_QUERY_LANGUAGE in swirl_server/settings.py")
+        logger.warning(f"{module_name}: Warning: Using english stopwords")
+        return set(nltk_stopwords.words('english'))
+
+stopwords = register_model('nltk_stopwords', _load_stopwords, module=module_name)
 
 from nltk.stem import PorterStemmer
 ps = PorterStemmer()
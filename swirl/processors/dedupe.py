@@ -6,6 +6,9 @@
 from swirl.processors.processor import *
 from django.conf import settings
 from swirl.spacy import nlp
+from swirl.vectors import vector_engine
+from swirl.near_dupes import NearDuplicateIndex
+from swirl.dedupe_index import SWIRL_DEDUPE_INDEX, DedupeIndex, dedupe_key
 
 from celery.utils.log import get_task_logger
 logger = get_task_logger(__name__)
@@ -16,6 +19,11 @@ logger = get_task_logger(__name__)
 SWIRL_DEDUPE_FIELD = getattr(settings, 'SWIRL_DEDUPE_FIELD', 'url')
 SWIRL_DEDUPE_SIMILARITY_FIELDS = getattr(settings, 'SWIRL_DEDUPE_SIMILARITY_FIELDS', ['title', 'body'])
 SWIRL_DEDUPE_SIMILARITY_MINIMUM = getattr(settings, 'SWIRL_DEDUPE_SIMILARITY_MINIMUM', 0.95)
+SWIRL_DEDUPE_MINHASH = getattr(settings, 'SWIRL_DEDUPE_MINHASH', False)
+SWIRL_DEDUPE_MINHASH_MINIMUM = getattr(settings, 'SWIRL_DEDUPE_MINHASH_MINIMUM', 0.8)
+SWIRL_DEDUPE_MINHASH_PERMUTATIONS = getattr(settings, 'SWIRL_DEDUPE_MINHASH_PERMUTATIONS', 128)
+SWIRL_DEDUPE_MINHASH_BANDS = getattr(settings, 'SWIRL_DEDUPE_MINHASH_BANDS', 32)
+SWIRL_DEDUPE_VECTORS = getattr(settings, 'SWIRL_DEDUPE_VECTORS', False)
 
 def _get_field_value_top_level_or_payload (item, field):
     """
@@ -26,10 +34,12 @@ def _get_field_value_top_level_or_payload (item, field):
         ret = item['payload'].get(field, None)
     return ret
 
-def _dedup_results (results, dedupe_key_dict, deduped_item_list, grouping_field):
+def _dedup_results (results, dedupe_key_dict, deduped_item_list, grouping_field, key=None):
     n_dups = 0
     for item in results:
         f_value = _get_field_value_top_level_or_payload(item, grouping_field)
+        if f_value and key:
+            f_value = key(f_value)
         if f_value:
             if f_value in dedupe_key_dict:
                 n_dups = n_dups + 1
@@ -49,6 +59,7 @@ class DedupeByFieldResultProcessor(ResultProcessor):
     """
 
     type="DedupeByFieldResultProcessor"
+    mutates_results = False
 
     def __init__(self, results, provider, query_string, request_id='', **kwargs):
         super().__init__(results, provider, query_string, request_id=request_id, **kwargs)
@@ -82,12 +93,19 @@ class DedupeByFieldPostResultProcessor(PostResultProcessor):
 
         dupes = 0
         dedupe_key_dict = {}
+        # with the dedupe index, compare canonical url hashes, and record the kept ones so updates don't append them again
+        key = dedupe_key if SWIRL_DEDUPE_INDEX else None
         for result in self.results:
             deduped_item_list = []
-            dupes = dupes + _dedup_results(result.json_results, dedupe_key_dict, deduped_item_list, SWIRL_DEDUPE_FIELD)
-            result.json_results = deduped_item_list
-            result.save()
+            dupes = dupes + _dedup_results(self.result_items.items(result), dedupe_key_dict, deduped_item_list, SWIRL_DEDUPE_FIELD, key=key)
+            self.result_items.replace(result, deduped_item_list)
         # end for
+        # only deletes the dropped items
+        self.result_items.save(fields=[])
+        if SWIRL_DEDUPE_INDEX:
+            index = DedupeIndex(self.search_id, SWIRL_DEDUPE_FIELD)
+            index.record(dedupe_key_dict)
+            index.save()
 
         if dupes > 0:
             self.results_updated = -1 * dupes
@@ -102,21 +120,94 @@ class DedupeBySimilarityPostResultProcessor(PostResultProcessor):
 
     type="DedupeBySimilarityPostResultProcessor"
 
+    def _item_content(self, item):
+        content = ""
+        for field in SWIRL_DEDUPE_SIMILARITY_FIELDS:
+            if field in item:
+                if field:
+                    content = content + ' ' + item[field].strip()
+                # end if
+        # end for
+        return content.strip()
+
+    def _process_vectors(self):
+
+        '''
+        Same greedy dedupe as process(), scored from the vector table: each item against the items kept so far, as one dot product
+        '''
+
+        dupes = 0
+        contents = []
+        for result in self.results:
+            for item in self.result_items.items(result):
+                contents.append(self._item_content(item))
+        text_vectors = vector_engine.text_vectors(contents)
+        vectors = vector_engine.normalized_matrix(text_vectors)
+
+        kept = []
+        kept_orths = set()
+        i = 0
+        for result in self.results:
+            deduped_item_list = []
+            for item in self.result_items.items(result):
+                max_sim = 0.0
+                if kept:
+                    # identical token sequences are identical, as in TextVector.similarity()
+                    max_sim = 1.0 if text_vectors[i].orths in kept_orths else float((vectors[kept] @ vectors[i]).max())
+                if max_sim > SWIRL_DEDUPE_SIMILARITY_MINIMUM:
+                    dupes = dupes + 1
+                else:
+                    kept.append(i)
+                    kept_orths.add(text_vectors[i].orths)
+                    deduped_item_list.append(item)
+                i = i + 1
+            # end for
+            self.result_items.replace(result, deduped_item_list)
+        # end for
+        logger.debug(f"{self}: result_items.save()")
+        self.result_items.save(fields=[])
+        return dupes
+
+    def _process_minhash(self):
+
+        '''
+        Greedy dedupe across all providers by MinHash/LSH near duplicate lookup, without spaCy
+        '''
+
+        dupes = 0
+        index = NearDuplicateIndex(threshold=SWIRL_DEDUPE_MINHASH_MINIMUM, permutations=SWIRL_DEDUPE_MINHASH_PERMUTATIONS, bands=SWIRL_DEDUPE_MINHASH_BANDS)
+        for result in self.results:
+            deduped_item_list = []
+            for item in self.result_items.items(result):
+                if index.add_unique(self._item_content(item)):
+                    deduped_item_list.append(item)
+                else:
+                    dupes = dupes + 1
+            # end for
+            self.result_items.replace(result, deduped_item_list)
+        # end for
+        logger.debug(f"{self}: result_items.save()")
+        self.result_items.save(fields=[])
+        return dupes
+
     def process(self):
 
+        if SWIRL_DEDUPE_MINHASH:
+            dupes = self._process_minhash()
+            self.results_updated = -1 * dupes
+            return self.results_updated
+
+        if SWIRL_DEDUPE_VECTORS:
+            dupes = self._process_vectors()
+            self.results_updated = -1 * dupes
+            return self.results_updated
+
         dupes = 0
         nlp_list = []
         for result in self.results:
             deduped_item_list = []
-            for item in result.json_results:
-                content = ""
-                for field in SWIRL_DEDUPE_SIMILARITY_FIELDS:
-                    if field in item:
-                        if field:
-                            content = content + ' ' + item[field].strip()
-                        # end if
-                # end for
-                content = content.strip()
+            for item in self.result_items.items(result):
+                content = self._item_content(item)
                 nlp_content = nlp(content)
                 dupe = False
                 max_sim = 0.0
@@ -137,10 +228,10 @@ class DedupeBySimilarityPostResultProcessor(PostResultProcessor):
                     deduped_item_list.append(item)
                 # end if
             # end for
-            result.json_results = deduped_item_list
-            logger.debug(f"{self}: result.save()")
-            result.save()
+            self.result_items.replace(result, deduped_item_list)
         # end for
+        logger.debug(f"{self}: result_items.save()")
+        self.result_items.save(fields=[])
 
         if dupes > 0:
             self.results_updated = -1 * dupes
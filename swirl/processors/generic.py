@@ -39,6 +39,7 @@ class TestQueryProcessor(QueryProcessor):
 class GenericResultProcessor(ResultProcessor):
 
     type="GenericResultProcessor"
+    mutates_results = False
 
     def __init__(self, results, provider, query_string, request_id='', **kwargs):
         super().__init__(results, provider, query_string, request_id=request_id, **kwargs)
@@ -230,6 +231,7 @@ from swirl.processors.utils import match_all, remove_tags
 class RequireQueryStringInTitleResultProcessor(ResultProcessor):
 
     type="RequireQueryStringInTitleResultProcessor"
+    mutates_results = False
 
     def __init__(self, results, provider, query_string, request_id='', **kwargs):
         super().__init__(results, provider, query_string, request_id=request_id, **kwargs)
@@ -274,6 +276,7 @@ class TestResultProcessor(ResultProcessor):
 class DuplicateHalfResultProcessor(ResultProcessor):
 
     type="DuplicateHalfResultProcessor"
+    mutates_results = False
 
     def __init__(self, results, provider, query_string, request_id='', **kwargs):
         super().__init__(results, provider, query_string, request_id=request_id, **kwargs)
@@ -6,13 +6,10 @@ import json as stdjson
 
 
 from datetime import datetime
-from jsonpath_ng import parse
 from jsonpath_ng.exceptions import JsonPathParserError
 
 from swirl.processors.processor import ResultProcessor
-from swirl.processors.result_map_converter import ResultMapConverter
 from swirl.processors.utils import create_result_dictionary, extract_text_from_tags, str_safe_format, result_processor_feedback_provider_query_terms,date_str_to_timestamp
-from swirl.swirl_common import RESULT_MAPPING_COMMANDS
 
 from celery.utils.log import get_task_logger
 logger = get_task_logger(__name__)
@@ -22,12 +19,10 @@ logger = get_task_logger(__name__)
 #############################################
 
 
-import re
-from re import error as re_error
-
 class MappingResultProcessor(ResultProcessor):
 
     type="MappingResultProcessor"
+    mutates_results = False
 
     def __init__(self, results, provider, query_string, request_id='', **kwargs):
         super().__init__(results, provider, query_string, request_id=request_id, **kwargs)
@@ -60,6 +55,20 @@ class MappingResultProcessor(ResultProcessor):
         if 'FILE_SYSTEM' in self.provider.result_mappings:
             file_system = True
 
+        # mappings are parsed, and their jsonpaths compiled, once per provider version rather than per result
+        result_mapping_list = []
+        if self.results:
+            from swirl.connectors.provider_plan import provider_plan
+            try:
+                result_mapping_list = provider_plan(self.provider).result_mapping_list()
+            except JsonPathParserError as err:
+                self.error(f'JsonPathParser: {err} in result_mappings: {self.provider.result_mappings}')
+                return []
+            except (NameError, TypeError, ValueError) as err:
+                self.error(f'{err.args}, {err} in result_mappings: {self.provider.result_mappings}')
+                return []
+            # end try
+
         result_number = 1
         for result in self.results:
             swirl_result = create_result_dictionary()
@@ -69,160 +78,112 @@ class MappingResultProcessor(ResultProcessor):
             swirl_result['date_retrieved'] = str(datetime.now())
             #############################################
             # mappings are in form swirl_key=source_key, where source_key can be a json_string e.g. _source.customer_full_name
-            if self.provider.result_mappings:
-                mappings = self.provider.result_mappings.split(',')
-                for mapping in mappings:
-                    stripped_mapping = mapping.strip()
-                    # control codez NO_PAYLOAD, FILE_SYSTEM
-                    if stripped_mapping in RESULT_MAPPING_COMMANDS:
-                        # ignore, values were set above
-                        continue
-                    # extract source_key=swirl_key
-                    swirl_key = ""
-                    if '=' in stripped_mapping:
-                        # no need to switch to rfind, since multiple = is not allowed
-                        # source key may be a json path
-                        swirl_key = stripped_mapping[:stripped_mapping.find('=')]
-                        source_key = stripped_mapping[stripped_mapping.find('=')+1:]
+            for result_mapping in result_mapping_list:
+                swirl_key = result_mapping.swirl_key
+                source_key = result_mapping.source_key
+                source_field_list = result_mapping.source_field_list
+                # search for source_keys & construct a result_dict
+                result_dict = {}
+                for k, uc, jxp_key, jxp in result_mapping.lookups:
+                    try:
+                        # search result for this
+                        matches = [uc.get_value(match.value) for match in jxp.find(result)]
+                    except (NameError, TypeError, ValueError) as err:
+                        self.error(f'{err.args}, {err} in jsonpath_ng.find: {jxp_key}')
+                        return []
+                    # end try
+                    if len(matches) == 1:
+                        result_dict[k] = matches[0]
                     else:
-                        source_key = stripped_mapping
-                    # control codez
-                    if swirl_key.isupper():
-                        # to do: check the result mappings list???
-                        # if swirl_key == 'BLOCK':
-                        #     result_block = source_key
-                        # else:
-                            # ignore for now
-                        continue
-                    # check for field list |
-                    source_field_list = []
-                    if '|' in source_key:
-                        source_field_list = source_key.split('|')
-                        # self.warning(f"source_field_list! {source_field_list}")
-                    if len(source_field_list) == 0:
-                        source_field_list.append(source_key)
-                    #############################################
-                    # check for template
-                    template_list = []
-                    if source_key.startswith("'"):
-                        try:
-                            template_list = re.findall(r'\{.*?\}', source_key)
-                        except re_error as err:
-                            self.error(f"re: {err} while finding all in source key : {source_key}")
-                            return []
-                        # end try
-                    else:
-                        for key in source_field_list:
-                            template_list.append('{' + key + '}')
-                    # search for source_keys & construct a result_dict
-                    result_dict = {}
-                    # self.warning(f"template_list: {template_list}")
-                    for k in template_list:
-                        uc = ResultMapConverter(f'$.{k[1:-1]}')  # Use the new combined class
-                        jxp_key = uc.get_key()
-                        try:
-                            jxp = parse(jxp_key)
-                            # search result for this
-                            matches = [uc.get_value(match.value) for match in jxp.find(result)]
-                        except JsonPathParserError as err:
-                            self.error(f'JsonPathParser: {err} in jsonpath_ng.find: {jxp_key}')
-                            return []
-                        except (NameError, TypeError, ValueError) as err:
-                            self.error(f'{err.args}, {err} in jsonpath_ng.find: {jxp_key}')
-                            return []
-                        # end try
-                        if len(matches) == 1:
-                            result_dict[k[1:-1]] = matches[0]
-                        else:
-                            result_dict[k[1:-1]] = matches
-                    if source_key.startswith("'"):
-                        # template
-                        bound_template =  str_safe_format(source_key, result_dict)
-                        if swirl_key:
-                            if swirl_key in swirl_result:
-                                swirl_result[swirl_key] = bound_template[1:-1]
-                            # end if
+                        result_dict[k] = matches
+                # end for
+                if result_mapping.is_template:
+                    # template
+                    bound_template =  str_safe_format(source_key, result_dict)
+                    if swirl_key:
+                        if swirl_key in swirl_result:
+                            swirl_result[swirl_key] = bound_template[1:-1]
                         # end if
-                    else:
-                        #############################################
-                        # single mapping
-                        for source_key in source_field_list:
-                            if source_key in result_dict:
-                                if not result_dict[source_key]:
-                                    # blank key
-                                    continue
-                                if swirl_key:
-                                    # provider specifies the target
-                                    if swirl_key in swirl_result:
-                                        if not type(result_dict[source_key]) in json_types:
-                                            if 'date' in source_key.lower():
-                                                # parser.parse will fill-in a missing time portion etc
-                                                result_dict[source_key] = date_str_to_timestamp(result_dict[source_key])
-                                            else:
-                                                result_dict[source_key] = str(result_dict[source_key])
-                                            # end if
+                    # end if
+                else:
+                    #############################################
+                    # single mapping
+                    for source_key in source_field_list:
+                        if source_key in result_dict:
+                            if not result_dict[source_key]:
+                                # blank key
+                                continue
+                            if swirl_key:
+                                # provider specifies the target
+                                if swirl_key in swirl_result:
+                                    if not type(result_dict[source_key]) in json_types:
+                                        if 'date' in source_key.lower():
+                                            # parser.parse will fill-in a missing time portion etc
+                                            result_dict[source_key] = date_str_to_timestamp(result_dict[source_key])
+                                        else:
+                                            result_dict[source_key] = str(result_dict[source_key])
                                         # end if
-                                        if type(swirl_result[swirl_key]) == type(result_dict[source_key]):
-                                            # same type, copy it
-                                            if 'date' in swirl_key.lower() and not 'display' in swirl_key.lower():
-                                                if swirl_result[swirl_key] == "":
-                                                    swirl_result[swirl_key] = date_str_to_timestamp(result_dict[source_key])
-                                                else:
-                                                    payload[swirl_key+"_"+source_key] = date_str_to_timestamp(result_dict[source_key])
-                                                # end if
+                                    # end if
+                                    if type(swirl_result[swirl_key]) == type(result_dict[source_key]):
+                                        # same type, copy it
+                                        if 'date' in swirl_key.lower() and not 'display' in swirl_key.lower():
+                                            if swirl_result[swirl_key] == "":
+                                                swirl_result[swirl_key] = date_str_to_timestamp(result_dict[source_key])
                                             else:
-                                                if not swirl_result[swirl_key]:
-                                                    swirl_result[swirl_key] = result_dict[source_key]
-                                                    self.put_query_terms_from_provider(swirl_key,
-                                                                                   swirl_result[swirl_key],
-                                                                                   provider_query_term_results)
-                                                else:
-                                                    payload[swirl_key+"_"+source_key] = result_dict[source_key]
-                                                # end if
+                                                payload[swirl_key+"_"+source_key] = date_str_to_timestamp(result_dict[source_key])
+                                            # end if
                                         else:
-                                            # not same type, convert it
-                                            if 'date' in swirl_key.lower() and not 'display' in swirl_key.lower():
-                                                if swirl_result[swirl_key] == "":
-                                                    if type(result_dict[source_key]) == int:
-                                                        # check for int vs long fix for DS-320
-                                                        if result_dict[source_key] > 2147483647:
-                                                            swirl_result[swirl_key] = str(datetime.fromtimestamp(result_dict[source_key]/1000))
-                                                        else:
-                                                            swirl_result[swirl_key] = str(datetime.fromtimestamp(result_dict[source_key]))
-                                                        # end if
-                                                    if type(result_dict[source_key]) == float:
-                                                        swirl_result[swirl_key] = str(datetime.fromtimestamp(result_dict[source_key]))
-                                                # end if
-                                            if type(swirl_result[swirl_key]) == str and type(result_dict[source_key]) == list:
-                                                swirl_result[swirl_key] = ' '.join(result_dict[source_key])
-                                            # different type, so payload it
-                                            if use_payload:
-                                                payload[swirl_key] = result_dict[source_key]
-                                        # end if
+                                            if not swirl_result[swirl_key]:
+                                                swirl_result[swirl_key] = result_dict[source_key]
+                                                self.put_query_terms_from_provider(swirl_key,
+                                                                               swirl_result[swirl_key],
+                                                                               provider_query_term_results)
+                                            else:
+                                                payload[swirl_key+"_"+source_key] = result_dict[source_key]
+                                            # end if
                                     else:
+                                        # not same type, convert it
+                                        if 'date' in swirl_key.lower() and not 'display' in swirl_key.lower():
+                                            if swirl_result[swirl_key] == "":
+                                                if type(result_dict[source_key]) == int:
+                                                    # check for int vs long fix for DS-320
+                                                    if result_dict[source_key] > 2147483647:
+                                                        swirl_result[swirl_key] = str(datetime.fromtimestamp(result_dict[source_key]/1000))
+                                                    else:
+                                                        swirl_result[swirl_key] = str(datetime.fromtimestamp(result_dict[source_key]))
+                                                    # end if
+                                                if type(result_dict[source_key]) == float:
+                                                    swirl_result[swirl_key] = str(datetime.fromtimestamp(result_dict[source_key]))
+                                            # end if
+                                        if type(swirl_result[swirl_key]) == str and type(result_dict[source_key]) == list:
+                                            swirl_result[swirl_key] = ' '.join(result_dict[source_key])
+                                        # different type, so payload it
                                         if use_payload:
-                                            # to do: check type!!!
-                                            if type(result_dict[source_key]) not in [str, int, list, dict]:
-                                                payload[swirl_key] = str(result_dict[source_key])
-                                            else:
-                                                payload[swirl_key] = result_dict[source_key]
-                                        # end if
+                                            payload[swirl_key] = result_dict[source_key]
                                     # end if
                                 else:
-                                    # no target key specified, so it will go into payload with that name
-                                    # since it was specified we do not check NO_PAYLOAD
-                                    if type(result_dict[source_key]) not in [str, int, list, dict]:
-                                        payload[source_key] = str(result_dict[source_key])
-                                    else:
-                                        payload[source_key] = result_dict[source_key]
+                                    if use_payload:
+                                        # to do: check type!!!
+                                        if type(result_dict[source_key]) not in [str, int, list, dict]:
+                                            payload[swirl_key] = str(result_dict[source_key])
+                                        else:
+                                            payload[swirl_key] = result_dict[source_key]
+                                    # end if
                                 # end if
                             else:
-                                # no results for this mapping were found - normal
-                                pass
+                                # no target key specified, so it will go into payload with that name
+                                # since it was specified we do not check NO_PAYLOAD
+                                if type(result_dict[source_key]) not in [str, int, list, dict]:
+                                    payload[source_key] = str(result_dict[source_key])
+                                else:
+                                    payload[source_key] = result_dict[source_key]
                             # end if
-                        # end for
-                # end for
-            # end if
+                        else:
+                            # no results for this mapping were found - normal
+                            pass
+                        # end if
+                    # end for
+            # end for
 
             #############################################
             # copy remaining fields, avoiding collisions
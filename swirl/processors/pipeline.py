@@ -0,0 +1,42 @@
+'''
+@author:     Sid Probstein
+@contact:    sid@swirl.today
+'''
+
+from django.conf import settings
+
+from celery.utils.log import get_task_logger
+logger = get_task_logger(__name__)
+
+from swirl.models import Result
+from swirl.result_items import ResultItemSet
+
+module_name = 'pipeline.py'
+
+SWIRL_POST_RESULT_PIPELINE = getattr(settings, 'SWIRL_POST_RESULT_PIPELINE', False)
+
+########################################
+########################################
+
+class PostResultPipeline:
+
+    '''
+    Runs a search's post result processors over one in-memory copy of its Results:
+    the Results are loaded once, every processor changes the same objects, and save() writes them back with bulk updates
+    Pass the pipeline to each processor as pipeline=
+    '''
+
+    def __init__(self, search, request_id=''):
+        self.search = search
+        self.request_id = request_id
+        # security review for 1.7 - OK, filtered by search ID
+        self.results = list(Result.objects.filter(search_id=search.id))
+        self.result_count = 0
+        for result in self.results:
+            self.result_count = self.result_count + result.retrieved
+        self.result_items = ResultItemSet(self.results, deferred=True)
+
+    def save(self):
+        written = self.result_items.flush()
+        logger.debug(f"{module_name}: search {self.search.id}: wrote {written} results or items")
+        return written
@@ -119,6 +119,9 @@ class QueryProcessor(Processor):
 class ResultProcessor(Processor):
 
     type = "ResultProcessor"
+    # True if process() changes the items in self.results in place, False if it only builds a new list
+    # results pass from one processor to the next without copies; SWIRL_RESULT_PROCESSOR_SNAPSHOTS checks this
+    mutates_results = True
 
     ########################################
 
@@ -174,6 +177,7 @@ class ResultProcessor(Processor):
 ########################################
 
 from swirl.models import Search, Result
+from swirl.result_items import ResultItemSet
 
 class PostResultProcessor(Processor):
 
@@ -181,7 +185,7 @@ class PostResultProcessor(Processor):
 
     ########################################
 
-    def __init__(self, search_id, request_id='', should_get_results=False, rag_query_items=False):
+    def __init__(self, search_id, request_id='', should_get_results=False, rag_query_items=False, pipeline=None):
 
         self.search_id = search_id
         self.search = None
@@ -189,6 +193,15 @@ class PostResultProcessor(Processor):
         self.result_count = -1
         self.request_id = request_id
         self.rag_query_items = rag_query_items
+        self.result_items = None
+
+        if pipeline:
+            # share the pipeline's search, results and items instead of loading them again; it saves them at the end
+            self.search = pipeline.search
+            self.results = pipeline.results
+            self.result_count = pipeline.result_count
+            self.result_items = pipeline.result_items
+            return
 
         # security review for 1.7 - OK, filtered by search ID
         if not Search.objects.filter(id=search_id).exists():
@@ -202,6 +215,8 @@ class PostResultProcessor(Processor):
             self.result_count = 0
             for result in self.results:
                 self.result_count = self.result_count + result.retrieved
+            # read and write items through this, they may be stored as ResultItem rows
+            self.result_items = ResultItemSet(self.results)
         else:
             logger.warning(f"search.status {self.search.status}, this processor requires: status == 'POST_RESULT_PROCESSING'")
             return 0
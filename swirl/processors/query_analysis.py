@@ -0,0 +1,105 @@
+'''
+@author:     Sid Probstein
+@contact:    sid@swirl.today
+'''
+
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from swirl.processors.utils import parse_query
+
+module_name = 'query_analysis.py'
+
+SWIRL_QUERY_ANALYSIS_CACHE_SIZE = getattr(settings, 'SWIRL_QUERY_ANALYSIS_CACHE_SIZE', 64)
+SWIRL_QUERY_ANALYSIS_VECTORS = getattr(settings, 'SWIRL_QUERY_ANALYSIS_VECTORS', 256)
+
+#############################################
+#############################################
+
+def provider_query_terms(results_processor_feedback):
+    if not results_processor_feedback:
+        return []
+    return results_processor_feedback.get('result_processor_feedback', []).get('query', []).get('provider_query_terms', [])
+
+class QueryAnalysis:
+
+    '''
+    The query side of relevancy for one processed query, computed once and shared by every provider's relevancy processor:
+    the parsed query (tokens, stems, n-gram targets, NOT list), and the vector of each capitalization variant of the query
+    and its targets, kept as they are first needed, up to vectors_size of them, least recently used first out
+    '''
+
+    def __init__(self, query_string, query_terms=(), vectors_size=SWIRL_QUERY_ANALYSIS_VECTORS):
+        self.query_string = query_string
+        self.query_terms = tuple(query_terms)
+        feedback = None
+        if self.query_terms:
+            feedback = {'result_processor_feedback': {'query': {'provider_query_terms': list(self.query_terms)}}}
+        self.parsed_query = parse_query(query_string, feedback)
+        self.stems = ' '.join(self.parsed_query.query_stemmed_list)
+        self.targets = list(zip(self.parsed_query.query_stemmed_target_list, self.parsed_query.query_target_list))
+        self.vectors_size = max(1, vectors_size)
+        self._vectors = OrderedDict()
+        # the analysis is shared by every thread of the worker
+        self._lock = threading.Lock()
+
+    def has_vector(self, text):
+        with self._lock:
+            return text in self._vectors
+
+    def vector(self, text, doc_for):
+
+        '''
+        Returns doc_for(text) for a query text, e.g. a capitalized query or query window, computing it only once
+        '''
+
+        with self._lock:
+            doc = self._vectors.get(text, None)
+            if doc is not None:
+                self._vectors.move_to_end(text)
+                return doc
+        # vectorize outside the lock; two threads may compute the same text, the last one is kept
+        doc = doc_for(text)
+        with self._lock:
+            self._vectors[text] = doc
+            while len(self._vectors) > self.vectors_size:
+                self._vectors.popitem(last=False)
+        return doc
+
+class QueryAnalysisCache:
+
+    '''
+    Per-process LRU of QueryAnalysis by processed query and provider query terms
+    Providers federated by the same worker, e.g. all the async HTTP providers of a search, share one analysis
+    '''
+
+    def __init__(self, size=SWIRL_QUERY_ANALYSIS_CACHE_SIZE):
+        self.size = max(1, size)
+        self.analyses = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, query_string, results_processor_feedback=None):
+        key = (query_string, tuple(provider_query_terms(results_processor_feedback)))
+        with self._lock:
+            analysis = self.analyses.get(key, None)
+            if analysis:
+                self.analyses.move_to_end(key)
+                return analysis
+        # parse errors, e.g. an all stopword query, are raised and not cached
+        analysis = QueryAnalysis(key[0], key[1])
+        with self._lock:
+            self.analyses[key] = analysis
+            while len(self.analyses) > self.size:
+                self.analyses.popitem(last=False)
+        return analysis
+
+    def clear(self):
+        with self._lock:
+            self.analyses.clear()
+
+query_analysis_cache = QueryAnalysisCache()
+
+def query_analysis(query_string, results_processor_feedback=None):
+    return query_analysis_cache.get(query_string, results_processor_feedback)
@@ -83,8 +83,8 @@ class RAGPostResultProcessor(PostResultProcessor):
 
     type="RAGPostResultProcessor"
 
-    def __init__(self, search_id, request_id='', should_get_results=False, rag_query_items=False):
-        super().__init__(search_id=search_id, request_id=request_id, should_get_results=should_get_results, rag_query_items=rag_query_items)
+    def __init__(self, search_id, request_id='', should_get_results=False, rag_query_items=False, pipeline=None):
+        super().__init__(search_id=search_id, request_id=request_id, should_get_results=should_get_results, rag_query_items=rag_query_items, pipeline=pipeline)
         self.tasks = None
         self.stop_background_thread = False
         try:
@@ -110,8 +110,8 @@ class RAGPostResultProcessor(PostResultProcessor):
         rag_item_list = []
         rag_query_items = self.rag_query_items or []
         for result in self.results:
-            if result.json_results:
-                for item in result.json_results:
+            if self.result_items.items(result):
+                for item in self.result_items.items(result):
                     if rag_query_items:
                         if 'swirl_id' in item and str(item['swirl_id']) in rag_query_items:
                             rag_item_list.append(item)
@@ -4,6 +4,7 @@
 '''
 import time
 
+from functools import lru_cache
 from math import sqrt
 from statistics import median
 
@@ -11,8 +12,11 @@ from django.conf import settings
 
 # to do: detect language and load all stopwords? P1
 from swirl.nltk import sent_tokenize
-from swirl.processors.utils import capitalize, capitalize_search, clean_string, has_numeric, highlight_list, match_any, match_all, json_to_flat_string, parse_query, position_dict, remove_numeric, remove_tags, result_processor_feedback_empty_record, result_processor_feedback_merge_records, stem_string
-from swirl.spacy import nlp
+from swirl.processors.utils import capitalize, capitalize_search, clean_string, has_numeric, highlight_list, match_any, match_all, json_to_flat_string, position_dict, remove_numeric, remove_tags, result_processor_feedback_empty_record, result_processor_feedback_merge_records, stem_string
+from swirl.spacy import nlp, SWIRL_VECTOR_ENGINE
+from swirl.vectors import vector_engine
+from swirl.processors.query_analysis import query_analysis
+from swirl.cpu_executor import SWIRL_CPU_POOL, cpu_executor
 
 from swirl.processors.processor import PostResultProcessor, ResultProcessor
 
@@ -37,15 +41,157 @@ SWIRL_MIN_SIMILARITY = getattr(settings, 'SWIRL_MIN_SIMILARITY', 0.01)
 SWIRL_MAX_MATCHES = getattr(settings, 'SWIRL_MAX_MATCHES', 5)
 SWIRL_HIGHLIGHT_START_CHAR = getattr(settings, 'SWIRL_HIGHLIGHT_START_CHAR', '*')
 SWIRL_HIGHLIGHT_END_CHAR = getattr(settings, 'SWIRL_HIGHLIGHT_END_CHAR', '*')
+SWIRL_RELEVANCY_BATCH_NLP = getattr(settings, 'SWIRL_RELEVANCY_BATCH_NLP', True)
+SWIRL_RELEVANCY_NLP_BATCH_SIZE = getattr(settings, 'SWIRL_RELEVANCY_NLP_BATCH_SIZE', 256)
 
 #############################################
 #############################################
 
+class NlpDocCache:
+
+    '''
+    Vectorizes texts in batches with nlp.pipe, keeping the resulting Doc by text
+    Only the tokenizer and the static vectors are used; the rest of the pipeline is turned off
+    Texts that were not prefetched are vectorized on demand
+    '''
+
+    def __init__(self, batch_size=SWIRL_RELEVANCY_NLP_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.docs = {}
+
+    def prefetch(self, texts):
+        pending = [text for text in dict.fromkeys(texts) if text not in self.docs]
+        if not pending:
+            return 0
+        for text, doc in zip(pending, nlp.pipe(pending, batch_size=self.batch_size, disable=nlp.pipe_names)):
+            self.docs[text] = doc
+        return len(pending)
+
+    def __call__(self, text):
+        if not text in self.docs:
+            self.prefetch([text])
+        return self.docs[text]
+
+#############################################
+
+def relevancy_field_string(field_value):
+
+    '''
+    Returns the cleaned version of a (flattened) result field that relevancy scores
+    URLs are split on - so the words can match
+    '''
+
+    result_field = clean_string(field_value).strip()
+    if result_field.startswith('http'):
+        # the field is a URL, split it on -
+        if '-' in result_field:
+            result_field = result_field.replace('-', ' ')
+    return result_field
+
+def query_match_windows(query_slice_stemmed_list, query_target, result_field_list, result_field_stemmed_list, query_has_numeric):
+
+    '''
+    Finds each match of a query target in a result field, and extracts the window around it
+    Returns a list of (match, extracted_match_list, rw_list, qw_list) tuples, in match order
+    qw_list is capitalized to follow the matches seen so far
+    '''
+
+    query_slice_stemmed_len = len(query_slice_stemmed_list)
+    # match_all returns a list of result_field_list indexes that match
+    match_list = match_all(query_slice_stemmed_list, result_field_stemmed_list)
+    # truncate the match list, if longer than configured
+    if len(match_list) > SWIRL_MAX_MATCHES:
+        match_list = match_list[:SWIRL_MAX_MATCHES-1]
+    windows = []
+    qw_list = query_target
+    for match in match_list:
+        extracted_match_list = result_field_list[match:match+query_slice_stemmed_len]
+        # if the extracted match is capitalized, then capitalize the query
+        qw_list = capitalize(qw_list, extracted_match_list)
+        # extract query window qw around the match
+        if (match-(2*query_slice_stemmed_len)-1) < 0:
+            rw_list = result_field_list[match:match+(3*query_slice_stemmed_len)+1]
+        else:
+            rw_list = result_field_list[match-(2*query_slice_stemmed_len)-1:match+(2*query_slice_stemmed_len)+1]
+        # end if
+        if not query_has_numeric and has_numeric(rw_list):
+            rw_list = remove_numeric(rw_list)
+            if not rw_list:
+                rw_list = result_field_list[match:match+(3*query_slice_stemmed_len)+1]
+        # end if
+        windows.append((match, extracted_match_list, rw_list, qw_list))
+    # end for
+    return windows
+
+class RelevancyField:
+
+    '''
+    What pass 1 needs from one result field besides vectors: the field, its token and stem lists, and the query matches in it
+    Computed once per field, before anything is vectorized, so the texts to vectorize can be batched
+    '''
+
+    __slots__ = ('result_field', 'result_field_list', 'result_field_stemmed_list', 'query', 'sentences', 'target_windows')
+
+    def __init__(self, result_field, analysis):
+        parsed_query = analysis.parsed_query
+        self.result_field = result_field
+        self.result_field_list = result_field.strip().split()
+        # fix for https://github.com/swirlai/swirl-search/issues/34
+        self.result_field_stemmed_list = stem_string(result_field).strip().split()
+        self.query = None
+        self.sentences = []
+        if match_any(parsed_query.query_stemmed_list, self.result_field_stemmed_list):
+            # capitalize search terms that are capitalied in the result field
+            self.query = ' '.join(capitalize_search(parsed_query.query_list, self.result_field_list))
+            self.sentences = sent_tokenize(result_field)
+        self.target_windows = [
+            (stemmed_query_target, query_target, query_match_windows(stemmed_query_target, query_target, self.result_field_list, self.result_field_stemmed_list, parsed_query.query_has_numeric))
+            for stemmed_query_target, query_target in analysis.targets
+        ]
+
+    def nlp_texts(self):
+
+        '''
+        Returns every text pass 1 may vectorize for this field
+        May include a few it ends up not needing, e.g. the sentences of a field with a zero vector
+        '''
+
+        texts = [self.result_field]
+        if self.query is not None:
+            texts.append(self.query)
+            if len(self.sentences) > 1:
+                texts.extend(self.sentences)
+        for stemmed_query_target, query_target, windows in self.target_windows:
+            for match, extracted_match_list, rw_list, qw_list in windows:
+                texts.append(' '.join(rw_list))
+                texts.append(' '.join(qw_list))
+        return texts
+
+#############################################
+
 class CosineRelevancyResultProcessor(ResultProcessor):
 
     def __init__(self, results, provider, query_string, request_id='', **kwargs):
         super().__init__(results, provider, query_string, request_id=request_id, **kwargs)
 
+    def _prepare_fields(self, item, analysis):
+
+        '''
+        Pass 1 collect phase for one item: flattens each relevancy field to a string and returns its RelevancyField, by field
+        '''
+
+        fields = {}
+        for field in SWIRL_RELEVANCY_CONFIG:
+            if field in item:
+                if type(item[field]) == list:
+                    # to do: handle this better
+                    item[field] = item[field][0]
+                # item[field] needs to be a string from this point forward.
+                # code expects this and blows up otherwise.
+                item[field] = json_to_flat_string(item[field],deadman=100)
+                fields[field] = RelevancyField(relevancy_field_string(item[field]), analysis)
+        return fields
+
     def process(self):
 
         logger.debug(f'{self}  processor called with logger name {logger.name}')
@@ -60,12 +206,31 @@ class CosineRelevancyResultProcessor(ResultProcessor):
         if not self.results:
             return self.modified
 
-        parsed_query = parse_query(self.query_string, self.result_processor_json_feedback)
+        # the query side is analyzed once per processed query and shared with the other providers
+        analysis = query_analysis(self.query_string, self.result_processor_json_feedback)
+        parsed_query = analysis.parsed_query
         if len(parsed_query.query_stemmed_target_list) != len(parsed_query.query_target_list):
             pass # self.info(f"parsed query [un]stemmed mismatch : {parsed_query.query_stemmed_target_list} != {parsed_query.query_target_list}")
 
+        # collect phase: everything but the vectors, once per field; items with an explain are scored as they are
+        prepared = [None if 'explain' in item else self._prepare_fields(item, analysis) for item in self.results]
+
+        # doc_for vectorizes a text: from the vector table, from one batched nlp.pipe call, or one nlp() call at a time
+        if SWIRL_VECTOR_ENGINE:
+            doc_for = lru_cache(maxsize=None)(vector_engine.text_vector)
+        elif SWIRL_RELEVANCY_BATCH_NLP:
+            doc_for = NlpDocCache()
+            # query texts the analysis already has a vector for are left out
+            nlp_texts = [text for fields in prepared if fields for prepared_field in fields.values() for text in prepared_field.nlp_texts() if not analysis.has_vector(text)]
+            swrel_logger.start_nlp(sum(len(text) for text in nlp_texts))
+            doc_for.prefetch(nlp_texts)
+            swrel_logger.end_nlp()
+        else:
+            doc_for = nlp
+
+        # scoring phase
         list_query_lens.append(len(parsed_query.query_list))
-        for item in self.results:
+        for item, fields in zip(self.results, prepared):
             dict_score = {}
             if 'explain' in item:
                 dict_score = item['explain']
@@ -111,35 +276,19 @@ class CosineRelevancyResultProcessor(ResultProcessor):
             if not 'hits' in item:
                 item['hits'] = {}
 
-            dict_score['stems'] = ' '.join(parsed_query.query_stemmed_list)
+            dict_score['stems'] = analysis.stems
             dict_len = {}
             notted = ""
             for field in RELEVANCY_CONFIG:
-                if field in item:
-                    if type(item[field]) == list:
-                        # to do: handle this better
-                        item[field] = item[field][0]
-                    # result_field is shorthand for item[field]
-                    # item[field] needs to be a string from this point forward.
-                    # code expects this and blows up otherwise.
-                    item[field] = json_to_flat_string(item[field],deadman=100)
-                    result_field = clean_string(item[field]).strip()
-                    # check for zero-length result
-                    if result_field:
-                        if len(result_field) == 0:
-                            continue
-                    # prepare result field
-                    if result_field.startswith('http'):
-                        # the field is a URL, split it on -
-                        if '-' in result_field:
-                            result_field = result_field.replace('-', ' ')
+                if field in fields:
+                    prepared_field = fields[field]
+                    # result_field is shorthand for item[field], prepared by _prepare_fields()
+                    result_field = prepared_field.result_field
                     swrel_logger.start_nlp(len(result_field))
-                    result_field_nlp = nlp(result_field)
+                    result_field_nlp = doc_for(result_field)
                     swrel_logger.end_nlp()
-                    result_field_list = result_field.strip().split()
-                    # fix for https://github.com/swirlai/swirl-search/issues/34
-                    result_field_stemmed = stem_string(result_field)
-                    result_field_stemmed_list = result_field_stemmed.strip().split()
+                    result_field_list = prepared_field.result_field_list
+                    result_field_stemmed_list = prepared_field.result_field_stemmed_list
                     if len(result_field_list) != len(result_field_stemmed_list):
                         pass # (f"result field [un]stemmed mismatch : {result_field_list} != {result_field_stemmed_list}")
                     # NOT test
@@ -164,11 +313,10 @@ class CosineRelevancyResultProcessor(ResultProcessor):
                     match_stems = []
                     ###########################################
                     # query vs result_field
-                    if match_any(parsed_query.query_stemmed_list, result_field_stemmed_list):
-                        # capitalize search terms that are capitalied in the result field
-                        query = ' '.join(capitalize_search(parsed_query.query_list, result_field_list))
+                    if prepared_field.query is not None:
+                        query = prepared_field.query
                         swrel_logger.start_nlp(len(query))
-                        query_nlp = nlp(query)
+                        query_nlp = analysis.vector(query, doc_for)
                         swrel_logger.end_nlp()
                         # check for zero vector
                         empty_query_vector = False
@@ -184,11 +332,11 @@ class CosineRelevancyResultProcessor(ResultProcessor):
                             # end if
                         else:
                             swrel_logger.start_sim()
-                            if len(sent_tokenize(result_field)) > 1:
+                            if len(prepared_field.sentences) > 1:
                                 # by sentence, take highest
                                 max_similarity = 0.0
-                                for sent in sent_tokenize(result_field):
-                                    result_sent_nlp = nlp(sent)
+                                for sent in prepared_field.sentences:
+                                    result_sent_nlp = doc_for(sent)
                                     if not result_sent_nlp.has_vector:
                                         qvs = 0.0
                                     else:
@@ -208,48 +356,24 @@ class CosineRelevancyResultProcessor(ResultProcessor):
                             logger.debug(f"{self}: item below SWIRL_MIN_SIMILARITY: {'_'.join(parsed_query.query_list)+label} ~?= {item}")
                     ############################################
                     # score each query target
-                    for stemmed_query_target, query_target in zip(parsed_query.query_stemmed_target_list, parsed_query.query_target_list):
+                    for stemmed_query_target, query_target, match_windows in prepared_field.target_windows:
                         query_slice_stemmed_list = stemmed_query_target
-                        query_slice_stemmed_len = len(query_slice_stemmed_list)
                         if '_'.join(query_target) in dict_score[field]:
                             # already have this query slice in dict_score - should not happen?
                             self.warning(f"{query_target} already in dict_score")
                             continue
                         ####### MATCH
-                        # iterate across all matches, match on stem
-                        # match_all returns a list of result_field_list indexes that match
-                        match_list = match_all(query_slice_stemmed_list, result_field_stemmed_list)
-                        # truncate the match list, if longer than configured
-                        if len(match_list) > SWIRL_MAX_MATCHES:
-                            match_list = match_list[:SWIRL_MAX_MATCHES-1]
-                        qw_list = query_target
-                        if match_list:
+                        # iterate across all matches, matched on stem by _prepare_fields()
+                        if match_windows:
                             key = ''
-                            for match in match_list:
-                                extracted_match_list = result_field_list[match:match+query_slice_stemmed_len]
-                                # if the extracted match is capitalized, then capitalize the query
-                                qw_list = capitalize(qw_list, extracted_match_list)
+                            for match, extracted_match_list, rw_list, qw_list in match_windows:
                                 key = '_'.join(extracted_match_list)+'_'+str(match)
-                                # extract query window qw around the match
-                                if (match-(2*query_slice_stemmed_len)-1) < 0:
-                                #     if (match-query_slice_stemmed_len-1) < 0:
-                                #         rw_list = result_field_list_rel[match-query_slice_stemmed_len-1:match+(2*query_slice_stemmed_len)+1]
-                                #     else:
-                                    rw_list = result_field_list[match:match+(3*query_slice_stemmed_len)+1]
-                                else:
-                                    rw_list = result_field_list[match-(2*query_slice_stemmed_len)-1:match+(2*query_slice_stemmed_len)+1]
-                                # end if
-                                if not parsed_query.query_has_numeric and has_numeric(rw_list):
-                                    rw_list = remove_numeric(rw_list)
-                                    if not rw_list:
-                                        rw_list = result_field_list[match:match+(3*query_slice_stemmed_len)+1]
-                                # end if
                                 dict_score[field][key] = 0.0
                                 ######## SIMILARITY vs WINDOW
-                                rw_nlp = nlp(' '.join(rw_list))
+                                rw_nlp = doc_for(' '.join(rw_list))
                                 if rw_nlp.vector.all() == 0:
                                     dict_score[field][key] = 0.31 + 1/3
-                                qw_nlp = nlp(' '.join(qw_list))
+                                qw_nlp = analysis.vector(' '.join(qw_list), doc_for)
                                 if qw_nlp.vector.all() == 0:
                                     dict_score[field][key] = 0.32 + 1/3
                                 if dict_score[field][key] == 0.0:
@@ -269,7 +393,7 @@ class CosineRelevancyResultProcessor(ResultProcessor):
                                 if '_'.join(query_slice_stemmed_list) not in match_stems:
                                     match_stems.append('_'.join(query_slice_stemmed_list))
                             # end for
-                        # end if match_list
+                        # end if match_windows
                     # end for
                     if dict_score[field] == {}:
                         del dict_score[field]
@@ -315,6 +439,111 @@ class CosineRelevancyResultProcessor(ResultProcessor):
 
 #############################################
 
+def score_item(item, query_string_to_provider, dict_len_median, list_query_lens):
+
+    '''
+    Pass 2 for one item: combines its pass 1 similarities into swirl_score, adjusted for field, query and rank, and sets explain
+    Returns the item, or None if it has no pass 1 scores
+    '''
+
+    RELEVANCY_CONFIG = SWIRL_RELEVANCY_CONFIG
+
+    # retrieve the scores and lens from pass 1
+    dict_score = None
+    dict_len = {}
+    if 'dict_score' in item:
+        dict_score = item['dict_score']
+        del item['dict_score']
+    else:
+        logger.debug("Missing dict_score!")
+    if 'dict_len' in item:
+        logger.debug("Found dict_len")
+        dict_len = item['dict_len']
+        del item['dict_len']
+    else:
+        logger.debug("Missing dict_len!")
+    if 'explain' in item:
+        logger.debug("Found explain")
+        dict_score = item['explain']
+        del item['explain']
+
+    # Check if dict_score is still not defined
+    if dict_score is None:
+        return None
+
+    relevancy_model = ""
+    # check for _relevancy_model
+    if '_relevancy_model' in item:
+        relevancy_model = item['_relevancy_model']
+        del item['_relevancy_model']
+    fs_flag_boost_body = False
+    if relevancy_model:
+        if relevancy_model == 'FILE_SYSTEM':
+            # if title has no matches, and body does, copy body to title; delete it from explain
+            if not 'title' in dict_score:
+                # no matches on title
+                if 'body' in dict_score:
+                    if len(item['body']) > 0:
+                        # match on body, none on title -> use title boost on body
+                        fs_flag_boost_body = True
+    # score the item
+    dict_len_adjust = {}
+    for f in dict_score:
+        if f in RELEVANCY_CONFIG:
+            weight = RELEVANCY_CONFIG[f]['weight']
+            if f == 'body':
+                if fs_flag_boost_body:
+                    # without a title weight the caller warns, since this may run in the cpu pool
+                    if 'title' in RELEVANCY_CONFIG:
+                        weight = RELEVANCY_CONFIG['title']['weight']
+        else:
+            continue
+        if f not in dict_len:
+            logger.debug(f"no pass 1 length for {f}, not scored - {item['url']}")
+            continue
+        len_adjust = float(dict_len_median[f] / dict_len[f])
+        dict_len_adjust[f] = len_adjust
+        qlen_adjust = float(median(list_query_lens) / len(query_string_to_provider.strip().split()))
+        logger.debug(f"score loop driver - {f} - {dict_score[f]} - {item['url']}")
+        for k in dict_score[f]:
+            if k.startswith('_') or k in ('result_length_adjust', 'query_length_adjust'):
+                continue
+            if not dict_score[f][k]:
+                continue
+            if dict_score[f][k] >= float(SWIRL_MIN_SIMILARITY):
+                rank_adjust = 1.0 + (1.0 / sqrt(item['searchprovider_rank']))
+                logger.debug(f"calc swirl_score BEFORE - {item['swirl_score']} - {item['url']}")
+                if k.endswith('_*') or k.endswith('_s*'):
+                    item['swirl_score'] = item['swirl_score'] + (weight * dict_score[f][k]) * (len(k) * len(k))
+                else:
+                    item['swirl_score'] = item['swirl_score'] + (weight * dict_score[f][k]) * (len(k) * len(k)) * len_adjust * qlen_adjust * rank_adjust
+                logger.debug(f"calc swirl_score AFTER - {item['swirl_score']} - {item['url']}")
+            # end if
+        # end for
+    # end for
+    for f in dict_score:
+        if f in dict_len_adjust:
+            dict_score[f]['result_length_adjust'] = dict_len_adjust[f]
+            dict_score[f]['query_length_adjust'] = qlen_adjust
+    ####### explain
+    item['explain'] = dict_score
+    item['dict_len'] = dict_len
+    possible_hits = item.get('hits', None)
+    if possible_hits:
+        item['explain']['hits'] = item['hits']
+        del item['hits']
+    else:
+        logger.debug('no hits to move')
+    if fs_flag_boost_body:
+        item['explain']['boosts'] = 'FILE_SYSTEM'
+    return item
+
+def score_items(work, dict_len_median, list_query_lens):
+    # work is a list of (item, query_string_to_provider); runs in the cpu pool when SWIRL_CPU_POOL is on
+    return [score_item(item, query_string_to_provider, dict_len_median, list_query_lens) for item, query_string_to_provider in work]
+
+#############################################
+
 class CosineRelevancyPostResultProcessor(PostResultProcessor):
 
     type = 'CosineRelevancyPostResultProcessor'
@@ -322,9 +551,9 @@ class CosineRelevancyPostResultProcessor(PostResultProcessor):
 
     ############################################
 
-    def __init__(self, search_id, request_id = ''):
+    def __init__(self, search_id, request_id = '', pipeline=None):
         self.include_pass_1 = False
-        return super().__init__(search_id, request_id=request_id)
+        return super().__init__(search_id, request_id=request_id, pipeline=pipeline)
 
 
     def _pass_2_extract_result_len_stats(self):
@@ -338,8 +567,6 @@ class CosineRelevancyPostResultProcessor(PostResultProcessor):
 
     def process(self):
 
-        RELEVANCY_CONFIG = SWIRL_RELEVANCY_CONFIG
-
         updated = 0
         dict_result_lens = {}
         list_query_lens = []
@@ -365,13 +592,13 @@ class CosineRelevancyPostResultProcessor(PostResultProcessor):
         # PASS 2
 
         # score results by field, adjusting for field length
-        highlighted_json_results = []
         swrel_logger.start_pass_2()
+        work = []
         swirl_id = 1
         for results in self.results:
-            if not results.json_results:
+            if not self.result_items.items(results):
                 continue
-            for item in results.json_results:
+            for item in self.result_items.items(results):
                 item['swirl_id'] = swirl_id
                 swirl_id = swirl_id + 1
                 if 'swirl_score' in item:
@@ -383,99 +610,27 @@ class CosineRelevancyPostResultProcessor(PostResultProcessor):
                     item['explain'] = { 'NOT': item['NOT'] }
                     del item['NOT']
                     break
-                # retrieve the scores and lens from pass 1
-                dict_score = None
-                if 'dict_score' in item:
-                    dict_score = item['dict_score']
-                    del item['dict_score']
-                else:
-                    logger.debug("Missing dict_score!")
-                if 'dict_len' in item:
-                    logger.debug("Found dict_len")
-                    dict_len = item['dict_len']
-                    del item['dict_len']
-                else:
-                    logger.debug("Missing dict_len!")
-                if 'explain' in item:
-                    logger.debug("Found explain")
-                    dict_score = item['explain']
-                    del item['explain']
-
-                # Check if dict_score is still not defined
-                if dict_score is None:
-                    self.warning("dict_score is still missing after all attempts to define it!")
-                    continue  # Skip to the next iteration
-
-                relevancy_model = ""
-                # check for _relevancy_model
-                if '_relevancy_model' in item:
-                    relevancy_model = item['_relevancy_model']
-                    del item['_relevancy_model']
-                fs_flag_boost_body = False
-                if relevancy_model:
-                    if relevancy_model == 'FILE_SYSTEM':
-                        # if title has no matches, and body does, copy body to title; delete it from explain
-                        if not 'title' in dict_score:
-                            # no matches on title
-                            if 'body' in dict_score:
-                                if len(item['body']) > 0:
-                                    # match on body, none on title -> use title boost on body
-                                    fs_flag_boost_body = True
-                # score the item
-                dict_len_adjust = {}
-                for f in dict_score:
-                    if f in RELEVANCY_CONFIG:
-                        weight = RELEVANCY_CONFIG[f]['weight']
-                        if f == 'body':
-                            if fs_flag_boost_body:
-                                if 'title' in RELEVANCY_CONFIG:
-                                    weight = RELEVANCY_CONFIG['title']['weight']
-                                else:
-                                    self.warning(f"title field missing when applying relevancy model: FILE_SYSTEM")
-                    else:
-                        continue
-                    len_adjust = float(dict_len_median[f] / dict_len[f])
-                    dict_len_adjust[f] = len_adjust
-                    qlen_adjust = float(median(list_query_lens) / len(results.query_string_to_provider.strip().split()))
-                    logger.debug(f"score loop driver - {f} - {dict_score[f]} - {item['url']}")
-                    for k in dict_score[f]:
-                        if k.startswith('_') or k in ('result_length_adjust', 'query_length_adjust'):
-                            continue
-                        if not dict_score[f][k]:
-                            continue
-                        if dict_score[f][k] >= float(SWIRL_MIN_SIMILARITY):
-                            rank_adjust = 1.0 + (1.0 / sqrt(item['searchprovider_rank']))
-                            logger.debug(f"calc swirl_score BEFORE - {item['swirl_score']} - {item['url']}")
-                            if k.endswith('_*') or k.endswith('_s*'):
-                                item['swirl_score'] = item['swirl_score'] + (weight * dict_score[f][k]) * (len(k) * len(k))
-                            else:
-                                item['swirl_score'] = item['swirl_score'] + (weight * dict_score[f][k]) * (len(k) * len(k)) * len_adjust * qlen_adjust * rank_adjust
-                            logger.debug(f"calc swirl_score AFTER - {item['swirl_score']} - {item['url']}")
-                        # end if
-                    # end for
-                # end for
-                for f in dict_score:
-                    if f in dict_len_adjust:
-                        dict_score[f]['result_length_adjust'] = dict_len_adjust[f]
-                        dict_score[f]['query_length_adjust'] = qlen_adjust
-                ####### explain
-                item['explain'] = dict_score
-                item['dict_len'] = dict_len
-                possible_hits = item.get('hits', None)
-                if possible_hits:
-                    item['explain']['hits'] = item['hits']
-                    del item['hits']
-                else:
-                    logger.debug('no hits to move')
-                if fs_flag_boost_body:
-                    item['explain']['boosts'] = 'FILE_SYSTEM'
-
-                updated = updated + 1
-                # save highlighted version
-                highlighted_json_results.append(item)
+                work.append((item, results.query_string_to_provider))
             # end for
-            results.save()
         # end for
+        scored = None
+        if SWIRL_CPU_POOL:
+            # scored copies come back from the pool; they are copied into the original items below
+            scored = cpu_executor.map_items(score_items, work, dict_len_median, list_query_lens)
+        if scored is None:
+            scored = score_items(work, dict_len_median, list_query_lens)
+        for (item, query_string_to_provider), scored_item in zip(work, scored):
+            if scored_item is None:
+                self.warning("dict_score is still missing after all attempts to define it!")
+                continue
+            if scored_item is not item:
+                item.clear()
+                item.update(scored_item)
+            if item['explain'].get('boosts', None) == 'FILE_SYSTEM' and 'body' in SWIRL_RELEVANCY_CONFIG and not 'title' in SWIRL_RELEVANCY_CONFIG:
+                self.warning(f"title field missing when applying relevancy model: FILE_SYSTEM")
+            updated = updated + 1
+        # end for
+        self.result_items.save(fields=['item', 'explain'])
         ############################################
 
         self.results_updated = int(updated)
@@ -494,10 +649,10 @@ class DropIrrelevantPostResultProcessor(PostResultProcessor):
         modified = 0
 
         for results in self.results:
-            if not results.json_results:
+            if not self.result_items.items(results):
                 continue
             relevant_results = []
-            for item in results.json_results:
+            for item in self.result_items.items(results):
                 # to do: override from tag
                 if 'swirl_score' in item:
                     if item['swirl_score'] > settings.MIN_SWIRL_SCORE:
@@ -507,7 +662,9 @@ class DropIrrelevantPostResultProcessor(PostResultProcessor):
                 else:
                     modified = modified - 1
 
-            results.json_results = relevant_results
-            results.save()
+            self.result_items.replace(results, relevant_results)
+        # end for
+        # only deletes the irrelevant items
+        self.result_items.save(fields=[])
 
         return modified
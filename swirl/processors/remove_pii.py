@@ -10,11 +10,19 @@ logger = get_task_logger(__name__)
 
 from swirl.processors.generic import QueryProcessor, ResultProcessor, PostResultProcessor
 
-from presidio_analyzer import AnalyzerEngine
 from presidio_anonymizer import AnonymizerEngine, OperatorConfig
 
-# Instantiate Presidio Analyzer and Anonymizer
-analyzer = AnalyzerEngine()
+from swirl.model_registry import register_model
+from swirl.cpu_executor import SWIRL_CPU_POOL, cpu_executor
+
+module_name = 'remove_pii.py'
+
+def _load_analyzer():
+    from presidio_analyzer import AnalyzerEngine
+    return AnalyzerEngine()
+
+# Presidio Analyzer loads its NLP models on first use, Anonymizer is cheap
+analyzer = register_model('presidio_analyzer', _load_analyzer, module=module_name)
 anonymizer = AnonymizerEngine()
 
 #############################################
@@ -71,6 +79,43 @@ def remove_pii(text: str, query_string=None, redact=False) -> str:
 
     return anonymized_text
 
+def redact_item(item, query_string=None) -> bool:
+    """
+    Redacts PII from the title, body and string payload fields of a result item, in place.
+
+    :return: True if the item was changed.
+    """
+
+    pii_modified = False
+    if 'title' in item:
+        cleaned_title = redact_pii(item['title'], query_string)
+        if cleaned_title != item['title']:
+            item['title'] = cleaned_title
+            pii_modified = True
+    if 'body' in item:
+        cleaned_body = redact_pii(item['body'], query_string)
+        if cleaned_body != item['body']:
+            item['body'] = cleaned_body
+            pii_modified = True
+    if 'payload' in item:
+        for key in item['payload']:
+            if type(item['payload'][key]) is not str:
+                continue
+            cleaned_payload = redact_pii(item['payload'][key], query_string)
+            if cleaned_payload != item['payload'][key]:
+                item['payload'][key] = cleaned_payload
+                pii_modified = True
+    return pii_modified
+
+def redact_items(items, query_string=None):
+    """
+    Redacts each item in place; a batch function for the cpu pool.
+
+    :return: A (modified, item) pair per item.
+    """
+
+    return [(redact_item(item, query_string), item) for item in items]
+
 #############################################
 
 class RemovePIIQueryProcessor(QueryProcessor):
@@ -108,31 +153,8 @@ class RedactPIIResultProcessor(ResultProcessor):
 
         modified = 0
         for item in self.results:
-            pii_modified = False
-
-            # Remove PII from 'title' and 'body' fields of each result
-            if 'title' in item:
-                cleaned_title = redact_pii(item['title'], self.query_string)
-                if cleaned_title != item['title']:
-                    item['title'] = cleaned_title
-                    pii_modified = True
-
-            if 'body' in item:
-                cleaned_body = redact_pii(item['body'], self.query_string)
-                if cleaned_body != item['body']:
-                    item['body'] = cleaned_body
-                    pii_modified = True
-
-            if 'payload' in item:
-                for key in item['payload']:
-                    if type(item['payload'][key]) is not str:
-                        continue
-                    cleaned_payload = redact_pii(item['payload'][key], self.query_string)
-                    if cleaned_payload != item['payload'][key]:
-                        item['payload'][key] = cleaned_payload
-                        pii_modified = True
-
-            if pii_modified:
+            # Remove PII from 'title', 'body' and 'payload' fields of each result
+            if redact_item(item, self.query_string):
                 modified += 1
 
         self.processed_results = self.results
@@ -156,31 +178,25 @@ class RedactPIIPostResultProcessor(PostResultProcessor):
         """
 
         modified = 0
-
-        for result in self.results:
-            for item in result.json_results:
-                pii_modified = False
-                if 'title' in item:
-                    cleaned_title = redact_pii(item['title'], self.search.query_string_processed)
-                    if cleaned_title != item['title']:
-                        item['title'] = cleaned_title
-                        pii_modified = True
-                if 'body' in item:
-                    cleaned_body = redact_pii(item['body'], self.search.query_string_processed)
-                    if cleaned_body != item['body']:
-                        item['body'] = cleaned_body
-                        pii_modified = True
-                if 'payload' in item:
-                    for key in item['payload']:
-                        if type(item['payload'][key]) is not str:
-                            continue
-                        cleaned_payload = redact_pii(item['payload'][key], self.search.query_string_processed)
-                        if cleaned_payload != item['payload'][key]:
-                            item['payload'][key] = cleaned_payload
-                            pii_modified = True
-                if pii_modified:
-                    modified += 1
-            result.save()
+        modified_items = []
+
+        items = [item for result in self.results for item in self.result_items.items(result)]
+        redacted = None
+        if SWIRL_CPU_POOL:
+            # redacted copies come back from the pool; they are copied into the original items below
+            redacted = cpu_executor.map_items(redact_items, items, self.search.query_string_processed)
+        if redacted is None:
+            redacted = redact_items(items, self.search.query_string_processed)
+        for item, (pii_modified, redacted_item) in zip(items, redacted):
+            if not pii_modified:
+                continue
+            if redacted_item is not item:
+                item.clear()
+                item.update(redacted_item)
+            modified += 1
+            modified_items.append(item)
+        # end for
+        self.result_items.save(fields=['item', 'payload'], changed=modified_items)
 
         self.results_updated = modified
         return self.results_updated
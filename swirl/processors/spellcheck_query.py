@@ -7,7 +7,13 @@
 from celery.utils.log import get_task_logger
 logger = get_task_logger(__name__)
 
-from textblob import TextBlob
+from swirl.model_registry import register_model
+
+def _load_textblob():
+    from textblob import TextBlob
+    return TextBlob
+
+TextBlob = register_model('textblob', _load_textblob, module='spellcheck_query.py')
 
 #############################################    
 #############################################     
@@ -0,0 +1,248 @@
+'''
+@author:     Sid Probstein
+@contact:    sid@swirl.today
+'''
+
+from django.conf import settings
+from django.utils import timezone
+
+from celery.utils.log import get_task_logger
+logger = get_task_logger(__name__)
+
+from swirl.models import Result, ResultItem
+from swirl.mix_cache import bump_results_version
+
+module_name = 'result_items.py'
+
+SWIRL_RESULT_ITEM_STORAGE = getattr(settings, 'SWIRL_RESULT_ITEM_STORAGE', False)
+SWIRL_RESULT_ITEM_BATCH_SIZE = getattr(settings, 'SWIRL_RESULT_ITEM_BATCH_SIZE', 500)
+
+# item fields kept in their own ResultItem columns, loaded and written separately from the rest of the item
+ITEM_HEAVY_FIELDS = ['payload', 'explain']
+# ResultItem columns written for each logical field passed to ResultItemSet.save()
+ITEM_FIELD_COLUMNS = {
+    'item': ['item', 'swirl_score', 'date_published', 'url'],
+    'payload': ['payload'],
+    'explain': ['explain']
+}
+ITEM_FIELDS = list(ITEM_FIELD_COLUMNS)
+
+########################################
+########################################
+
+def _column_str(value, max_length):
+    if type(value) != str:
+        return None
+    return value[:max_length]
+
+def set_row_fields(row, item, fields=ITEM_FIELDS):
+    if 'item' in fields:
+        row.item = {key: value for key, value in item.items() if key not in ITEM_HEAVY_FIELDS}
+        score = item.get('swirl_score', None)
+        row.swirl_score = float(score) if type(score) in [int, float] else None
+        row.date_published = _column_str(item.get('date_published', None), ResultItem._meta.get_field('date_published').max_length)
+        row.url = _column_str(item.get('url', None), ResultItem._meta.get_field('url').max_length)
+    for field in ITEM_HEAVY_FIELDS:
+        if field in fields:
+            setattr(row, field, item.get(field, None))
+    return row
+
+def item_to_row(result, position, item):
+    return set_row_fields(ResultItem(result=result, search_id_id=result.search_id_id, position=position), item)
+
+def row_to_item(row):
+    item = dict(row.item)
+    for field in ITEM_HEAVY_FIELDS:
+        value = getattr(row, field)
+        if value is not None:
+            item[field] = value
+    return item
+
+def add_result_items(result, items):
+
+    '''
+    Appends items to result's ResultItem rows; any json_results are moved into rows first, so the caller must save result
+    '''
+
+    start = ResultItem.objects.filter(result=result).count()
+    if result.json_results:
+        items = result.json_results + items
+        result.json_results = []
+    ResultItem.objects.bulk_create([item_to_row(result, start + i, item) for i, item in enumerate(items)], batch_size=SWIRL_RESULT_ITEM_BATCH_SIZE)
+    return len(items)
+
+def result_item_list(result):
+
+    '''
+    Returns result's items from whichever layout it was stored in
+    '''
+
+    if result.json_results or not SWIRL_RESULT_ITEM_STORAGE:
+        return result.json_results
+    return [row_to_item(row) for row in ResultItem.objects.filter(result=result).order_by('position')]
+
+def result_items_at(search_id, refs):
+
+    '''
+    Returns the items at refs, a list of (result id, position) pairs, in that order, loading only those items
+    Refs that no longer resolve are skipped
+    '''
+
+    result_ids = set(result_id for result_id, _ in refs)
+    # security review for 1.7 - OK, filtered by search ID
+    results = {result.id: result for result in Result.objects.filter(search_id=search_id, id__in=result_ids)}
+    stored = {}
+    if SWIRL_RESULT_ITEM_STORAGE:
+        wanted = [ref for ref in refs if ref[0] in results and not results[ref[0]].json_results]
+        if wanted:
+            rows = ResultItem.objects.filter(result__in=set(result_id for result_id, _ in wanted), position__in=set(position for _, position in wanted))
+            for row in rows:
+                stored[(row.result_id, row.position)] = row
+    items = []
+    for result_id, position in refs:
+        result = results.get(result_id, None)
+        if result is None:
+            continue
+        if (result_id, position) in stored:
+            items.append(row_to_item(stored[(result_id, position)]))
+        elif position < len(result.json_results):
+            items.append(result.json_results[position])
+    # end for
+    return items
+
+########################################
+
+class ResultItemSet:
+
+    '''
+    The items of several Results, read and written the same way whether a Result keeps them in json_results or in ResultItem rows
+    Processors change, drop or reorder the item dicts from items(), then call save() once with the fields they changed:
+    json_results Results are saved whole as before; ResultItem Results delete dropped rows and bulk update only those columns
+    '''
+
+    def __init__(self, results, deferred=False):
+        self.results = list(results)
+        # deferred: save() only records what changed, flush() writes it all at once
+        self.deferred = deferred
+        self._pending = False
+        self._pending_fields = set()
+        self._pending_changed = set()
+        self._items = {}
+        self._rows = {}
+        self._dropped = []
+        if SWIRL_RESULT_ITEM_STORAGE and self.results:
+            for row in ResultItem.objects.filter(result__in=[result.id for result in self.results]).order_by('result_id', 'position'):
+                item = row_to_item(row)
+                self._items.setdefault(row.result_id, []).append(item)
+                self._rows[id(item)] = row
+            # end for
+
+    def stored(self, result):
+        return result.id in self._items
+
+    def items(self, result):
+        if self.stored(result):
+            return self._items[result.id]
+        return result.json_results
+
+    def replace(self, result, items):
+
+        '''
+        Sets result's items, e.g. after dedupe; items not in the new list are deleted on save()
+        '''
+
+        if not self.stored(result):
+            result.json_results = items
+            return
+        kept = set(id(item) for item in items)
+        for item in self._items[result.id]:
+            if id(item) not in kept and id(item) in self._rows:
+                self._dropped.append(self._rows.pop(id(item)).id)
+        self._items[result.id] = items
+
+    def save(self, fields=ITEM_FIELDS, changed=None):
+
+        '''
+        Writes back fields (see ITEM_FIELD_COLUMNS) of the changed items, or of every item if changed is None
+        '''
+
+        if self.deferred:
+            self._pending = True
+            self._pending_fields.update(fields)
+            if changed is None:
+                self._pending_changed = None
+            elif self._pending_changed is not None:
+                self._pending_changed.update(id(item) for item in changed)
+            return 0
+        return self._write(fields, None if changed is None else set(id(item) for item in changed))
+
+    def flush(self):
+
+        '''
+        Writes everything save() recorded since the last flush(), with one bulk update per table
+        '''
+
+        if not self._pending:
+            return 0
+        written = self._write([field for field in ITEM_FIELDS if field in self._pending_fields], self._pending_changed, bulk=True)
+        self._pending = False
+        self._pending_fields = set()
+        self._pending_changed = set()
+        return written
+
+    def _write(self, fields, changed_ids, bulk=False):
+        columns = []
+        for field in fields:
+            columns = columns + ITEM_FIELD_COLUMNS[field]
+        updated_rows = []
+        moved_rows = []
+        new_rows = []
+        saved_results = []
+        for result in self.results:
+            if not self.stored(result):
+                if changed_ids is None or any(id(item) in changed_ids for item in result.json_results):
+                    saved_results.append(result)
+                continue
+            for position, item in enumerate(self._items[result.id]):
+                row = self._rows.get(id(item), None)
+                if row is None:
+                    row = item_to_row(result, position, item)
+                    self._rows[id(item)] = row
+                    new_rows.append(row)
+                    continue
+                moved = row.position != position
+                row.position = position
+                if columns and (changed_ids is None or id(item) in changed_ids):
+                    updated_rows.append(set_row_fields(row, item, fields))
+                elif moved:
+                    moved_rows.append(row)
+            # end for
+        # end for
+
+        if bulk:
+            if saved_results:
+                # bulk_update skips auto_now, so date_updated moves here as it would with save()
+                now = timezone.now()
+                for result in saved_results:
+                    result.date_updated = now
+                Result.objects.bulk_update(saved_results, ['json_results', 'date_updated'], batch_size=SWIRL_RESULT_ITEM_BATCH_SIZE)
+        else:
+            for result in saved_results:
+                result.save()
+        dropped = len(self._dropped)
+        if self._dropped:
+            ResultItem.objects.filter(id__in=self._dropped).delete()
+            logger.debug(f"{module_name}: deleted {len(self._dropped)} items")
+            self._dropped = []
+        if updated_rows:
+            ResultItem.objects.bulk_update(updated_rows, columns + ['position'], batch_size=SWIRL_RESULT_ITEM_BATCH_SIZE)
+        if moved_rows:
+            ResultItem.objects.bulk_update(moved_rows, ['position'], batch_size=SWIRL_RESULT_ITEM_BATCH_SIZE)
+        if new_rows:
+            ResultItem.objects.bulk_create(new_rows, batch_size=SWIRL_RESULT_ITEM_BATCH_SIZE)
+        written = len(saved_results) + len(updated_rows) + len(moved_rows) + len(new_rows)
+        if written or dropped:
+            # bulk writes don't send post_save, so cached mixes must be invalidated here
+            for search_id in set(result.search_id_id for result in self.results):
+                bump_results_version(search_id)
+        return written
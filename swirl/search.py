@@ -12,6 +12,7 @@ from celery import group, current_task
 from celery.exceptions import TimeoutError as CeleryTimeoutError
 
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import Error
 from django.contrib.auth.models import User, Group
 from django.conf import settings
 
@@ -22,17 +23,23 @@ from celery.utils.log import get_task_logger
 logger = get_task_logger(__name__)
 
 from swirl.models import Search, SearchProvider, Result
-from swirl.tasks import federate_task
+from swirl.tasks import federate_signature, federate_http_task, search_complete_task, search_deadline_task
+from swirl.connectors.async_http import SWIRL_ASYNC_HTTP, federate_http, is_async_http_connector
 from swirl.processors import *
+from swirl.processors.pipeline import SWIRL_POST_RESULT_PIPELINE, PostResultPipeline
 from swirl.processors.transform_query_processor_utils import get_pre_query_processor_or_transform
 from swirl.utils import select_providers,get_url_details
 from swirl.performance_logger import SwirlQueryRequestLogger
+from swirl.streaming import notify_search_update
 
 ##################################################
 ##################################################
 
 module_name = 'search.py'
 
+SWIRL_SPLIT_FEDERATION = getattr(settings, 'SWIRL_SPLIT_FEDERATION', False)
+SWIRL_SEARCH_CHORD = getattr(settings, 'SWIRL_SEARCH_CHORD', False)
+
 def get_query_selectd_provder_list(search):
     """
     Get the list of providers from the query, taking
@@ -93,10 +100,11 @@ def get_query_selectd_provder_list(search):
     return selected_provider_list
 
 
-def search(id, session=None, request=None):
+def search(id, session=None, request=None, chord=False):
 
     '''
     Execute the search task workflow
+    With chord, or SWIRL_SEARCH_CHORD, a search run in a Celery task returns once federation starts; see federate_chord()
     '''
 
     update = False
@@ -200,23 +208,36 @@ def search(id, session=None, request=None):
         return False
     else:
         from celery import group, current_task
-        tasks_list = [federate_task.s(search.id, provider.id, provider.connector, update, session, swqrx_logger.request_id) for provider in providers]
-        results = group(*tasks_list).delay()
-        if current_task:
+        # the Requests family can share one event loop in this process; everything else goes to celery
+        http_providers = []
+        if SWIRL_ASYNC_HTTP:
+            http_providers = [provider for provider in providers if is_async_http_connector(provider.connector)]
+        celery_providers = [provider for provider in providers if provider not in http_providers]
+        tasks_list = [federate_signature(search.id, provider.id, provider.connector, update, session, swqrx_logger.request_id, split=SWIRL_SPLIT_FEDERATION) for provider in celery_providers]
+        if (chord or SWIRL_SEARCH_CHORD) and current_task:
+            # in a worker: don't wait on the federate tasks, they complete the search
+            return federate_chord(search, tasks_list, http_providers, update, session, start_time, swqrx_logger)
+        federate_start_time = time.time()
+        results = group(*tasks_list).delay() if tasks_list else []
+        http_results = []
+        if http_providers:
+            http_results = list(federate_http(search.id, [(provider.id, provider.connector) for provider in http_providers], update, session, swqrx_logger.request_id).values())
+        timeout = max(0.1, settings.SWIRL_TIMEOUT - (time.time() - federate_start_time))
+        if tasks_list and current_task:
             logger.debug(f'in current_task about to get {search.id}')
             with allow_join_result():
                 logger.debug(f'allow_join about to get {search.id}')
                 try:
-                    results = results.get(interval=0.05, timeout=settings.SWIRL_TIMEOUT)
+                    results = results.get(interval=0.05, timeout=timeout)
                 except CeleryTimeoutError as err:
                     logger.warning(f"Timeout:{err} in allow_join context, query results may still be returned")
                 except Exception as err:
                     logger.error(f"Unexpected:{err}")
                 logger.debug(f'in current_task got my results {search.id}')
-        else:
+        elif tasks_list:
             logger.debug(f'NOT in the current task about to get {search.id}')
             try:
-                results = results.get(interval=0.05, timeout=settings.SWIRL_TIMEOUT)
+                results = results.get(interval=0.05, timeout=timeout)
             except CeleryTimeoutError as err:
                 logger.warning(f"Timeout:{err} query results may still be returned")
             except Exception as err:
@@ -224,9 +245,59 @@ def search(id, session=None, request=None):
             logger.debug(f'NOT in the current task got my result {search.id}')
 
 
-    search.status = 'FULL_RESULTS'
+    return complete_search(search, update, start_time, swqrx_logger, list(results) + http_results, request=request)
+
+def federate_chord(search, tasks_list, http_providers, update, session, start_time, swqrx_logger):
+
+    '''
+    Federates without blocking: the federate tasks run as a chord whose callback, search_complete_task, completes the search
+    search_deadline_task completes it with the results saved so far if the providers are still running after SWIRL_TIMEOUT
+    '''
 
+    from celery import chord
+    if http_providers:
+        tasks_list = tasks_list + [federate_http_task.s(search.id, [(provider.id, provider.connector) for provider in http_providers], update, session, swqrx_logger.request_id)]
+    provider_ids = [provider.id for provider in swqrx_logger.providers]
+    chord(tasks_list)(search_complete_task.s(search.id, update, start_time, swqrx_logger.request_id, provider_ids))
+    search_deadline_task.apply_async((search.id, update, start_time, swqrx_logger.request_id, provider_ids), countdown=settings.SWIRL_TIMEOUT)
+    logger.debug(f"{module_name}_{search.id}: federating {len(tasks_list)} tasks, deadline in {settings.SWIRL_TIMEOUT}s")
+    return True
+
+def finish_search(search_id, update, start_time, request_id, provider_ids, results, timed_out=False):
+
+    '''
+    Completes a search federated by federate_chord(), from the chord callback or the deadline, whichever comes first
+    '''
 
+    status = 'PARTIAL_RESULTS' if timed_out else 'FULL_RESULTS'
+    # only one of them gets the search out of FEDERATING
+    if not Search.objects.filter(id=search_id, status='FEDERATING').update(status=status):
+        logger.debug(f"{module_name}_{search_id}: already completed")
+        return False
+    search = Search.objects.get(id=search_id)
+    providers = list(SearchProvider.objects.filter(id__in=provider_ids))
+    swqrx_logger = SwirlQueryRequestLogger(search.query_string, providers, start_time, request_id=request_id)
+    if timed_out:
+        logger.warning(f"{module_name}_{search_id}: timeout after {settings.SWIRL_TIMEOUT}s, query results may still be returned")
+        swqrx_logger.timeout_execution()
+    retrieved = []
+    for result in results:
+        # the async HTTP task returns one value per provider
+        retrieved.extend(result if isinstance(result, list) else [result])
+    completed = complete_search(search, update, start_time, swqrx_logger, retrieved, status=status)
+    if not completed and update:
+        from swirl.subscriber import subscription_failed
+        subscription_failed(search)
+    return completed
+
+def complete_search(search, update, start_time, swqrx_logger, results, request=None, status='FULL_RESULTS'):
+
+    '''
+    Finishes a search after federation: result urls, post result processing, and the *_READY status
+    results are the values the federate tasks returned
+    '''
+
+    search.status = status
     logger.info(f"{module_name}: {search.status}")
     ########################################
     # fix the result url
@@ -257,20 +328,30 @@ def search(id, session=None, request=None):
         search.save()
 
         processor_list = search.post_result_processors
-        
+        # pipeline: load the results once, run every processor on the same objects, then save once
+        pipeline = None
+        if SWIRL_POST_RESULT_PIPELINE:
+            pipeline = PostResultPipeline(search, request_id=swqrx_logger.request_id)
+        stage_times = []
+
         for processor in processor_list:
             logger.debug(f"{module_name}: invoking processor: {processor}")
+            stage_start = time.time()
             try:
-                post_result_processor = alloc_processor(processor=processor)(search_id=search.id, request_id=swqrx_logger.request_id)
+                if pipeline:
+                    post_result_processor = alloc_processor(processor=processor)(search_id=search.id, request_id=swqrx_logger.request_id, pipeline=pipeline)
+                else:
+                    post_result_processor = alloc_processor(processor=processor)(search_id=search.id, request_id=swqrx_logger.request_id)
                 if post_result_processor.validate():
                     results_modified = post_result_processor.process()
                 else:
-                    error_return(f"{module_name}_{search.id}: {processor}.validate() failed", swqrx_logger)
+                    error_return(f"{module_name}_{search.id}: {processor}.validate() failed", swqrx_logger, search_id=search.id)
                     return False
                 # end if
             except (NameError, TypeError, ValueError) as err:
-                error_return(f'{module_name}_{search.id}: {processor}: {err.args}, {err}', swqrx_logger)
+                error_return(f'{module_name}_{search.id}: {processor}: {err.args}, {err}', swqrx_logger, search_id=search.id)
                 return False
+            stage_times.append((processor, time.time() - stage_start))
             if results_modified < 0:
                 message = f"[{datetime.now()}] {processor} deleted {-1*results_modified} results"
             else:
@@ -286,6 +367,15 @@ def search(id, session=None, request=None):
                 # end if
             # end if
         # end for
+        if pipeline:
+            stage_start = time.time()
+            try:
+                pipeline.save()
+            except Error as err:
+                error_return(f'{module_name}_{search.id}: post result pipeline save failed: {err.args}, {err}', swqrx_logger, search_id=search.id)
+                return False
+            stage_times.append(('save', time.time() - stage_start))
+        logger.info(f"{module_name}_{search.id}: post result processing: " + ', '.join([f"{name} {elapsed:.3f}s" for name, elapsed in stage_times]))
         search.status = last_status
     if search.status == 'PARTIAL_RESULTS':
         if update:
@@ -303,6 +393,7 @@ def search(id, session=None, request=None):
     logger.debug(f"{module_name}: search time: {search.time}")
     swqrx_logger.complete_execution()
     search.save()
+    notify_search_update(search.id, final=True)
 
     # log info
     retrieved = 0
@@ -310,7 +401,7 @@ def search(id, session=None, request=None):
     for current_retrieved in results:
         if isinstance(current_retrieved, int) and current_retrieved > 0:
             retrieved = retrieved + current_retrieved
-    logger.info(f"{user} search {search.id} {search.status} {retrieved} {search.time}")
+    logger.info(f"{search.owner} search {search.id} {search.status} {retrieved} {search.time}")
 
     return True
 
@@ -326,6 +417,9 @@ def run_processor_if_tag_in_request(tag, processor_name, request, search, swqrx_
     except Exception as err:
         logger.warning(f'{err} while adding {processor_name} for {tag}')
 
-def error_return(msg, swqrx_logger):
+def error_return(msg, swqrx_logger, search_id=None):
     logger.error(msg)
     swqrx_logger.error_execution(msg)
+    if search_id:
+        # release any streaming clients waiting on the final page
+        notify_search_update(search_id, final=True)
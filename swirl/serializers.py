@@ -3,9 +3,13 @@
 @contact:    sid@swirl.today
 '''
 
+from django.conf import settings
 from django.contrib.auth.models import User, Group
 from rest_framework import serializers
 from swirl.models import SearchProvider, Search, Result,QueryTransform
+from swirl.result_items import result_item_list
+
+SWIRL_SUBSCRIBE_TICK = getattr(settings, 'SWIRL_SUBSCRIBE_TICK', 600)
 
 class UserSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
@@ -33,7 +37,17 @@ class SearchSerializer(serializers.ModelSerializer):
     owner = serializers.ReadOnlyField(source='owner.username')
     class Meta:
         model = Search
-        fields = ['id', 'owner', 'date_created', 'date_updated', 'query_string', 'query_string_processed', 'sort', 'results_requested', 'searchprovider_list', 'subscribe', 'status', 'pre_query_processors', 'post_result_processors', 'result_url', 'new_result_url', 'messages', 'result_mixer', 'retention', 'tags']
+        fields = ['id', 'owner', 'date_created', 'date_updated', 'query_string', 'query_string_processed', 'sort', 'results_requested', 'searchprovider_list', 'subscribe', 'subscribe_interval', 'next_run', 'status', 'pre_query_processors', 'post_result_processors', 'result_url', 'new_result_url', 'messages', 'result_mixer', 'retention', 'tags']
+        # set by the subscription scheduler
+        read_only_fields = ['next_run']
+
+    def validate_subscribe_interval(self, value):
+        # 0 uses SWIRL_SUBSCRIBE_INTERVAL; the scheduler can't run a search more often than once per tick
+        if value < 0:
+            raise serializers.ValidationError("subscribe_interval must be 0 or more seconds")
+        if value and value < SWIRL_SUBSCRIBE_TICK:
+            raise serializers.ValidationError(f"subscribe_interval must be 0 or at least {SWIRL_SUBSCRIBE_TICK} seconds")
+        return value
 
 class ResultSerializer(serializers.ModelSerializer):
     owner = serializers.ReadOnlyField(source='owner.username')
@@ -41,6 +55,12 @@ class ResultSerializer(serializers.ModelSerializer):
         model = Result
         fields = ['id', 'owner', 'date_created', 'date_updated', 'search_id', 'searchprovider', 'query_to_provider', 'query_processors', 'result_processors', 'result_processor_json_feedback', 'messages', 'status', 'retrieved', 'found', 'time', 'json_results', 'tags']
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # items may be stored as ResultItem rows
+        data['json_results'] = result_item_list(instance)
+        return data
+
 class QueryTransformSerializer(serializers.ModelSerializer):
     owner = serializers.ReadOnlyField(source='owner.username')
     class Meta:
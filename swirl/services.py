@@ -6,8 +6,13 @@
 import logging
 logger = logging.getLogger(__name__)
 
+from swirl_server import settings
+
 module_name = 'services.py'
 
+# prefork children can't start the SWIRL_CPU_POOL processes, so the worker runs its tasks in threads when the pool is on
+SWIRL_CELERY_WORKER_POOL = ' -P threads' if getattr(settings, 'SWIRL_CPU_POOL', False) else ''
+
 # NOTE: ORDER BELOW IS IMPORTANT!!!
 # NOTE: FIRST IN LIST IS FIRST STARTED
 # NOTE: FIRST IN LIST IS LAST STOPPED
@@ -27,7 +32,7 @@ SWIRL_SERVICES = [
     },
     {
         'name': 'celery-worker',
-        'path': 'celery -A swirl_server worker',
+        'path': f'celery -A swirl_server worker{SWIRL_CELERY_WORKER_POOL}',
         'default': True,
         'retired': False
     },
@@ -62,7 +67,7 @@ SWIRL_SERVICES_DEBUG = [
     },
     {
         'name': 'celery-worker',
-        'path': 'celery -A swirl_server worker --loglevel DEBUG',
+        'path': f'celery -A swirl_server worker{SWIRL_CELERY_WORKER_POOL} --loglevel DEBUG',
         'default': True,
         'retired': False
     },
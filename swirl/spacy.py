@@ -3,6 +3,21 @@
 @contact:    sid@swirl.today
 '''
 
-import spacy
+from django.conf import settings
 
-nlp = spacy.load('en_core_web_lg')
\ No newline at end of file
+from swirl.model_registry import register_model
+
+module_name = 'spacy.py'
+
+SWIRL_VECTOR_ENGINE = getattr(settings, 'SWIRL_VECTOR_ENGINE', False)
+
+# the en_core_web_lg components that relevancy and dedupe never need when scoring from the vector table
+SPACY_PIPELINE_COMPONENTS = ['tok2vec', 'tagger', 'parser', 'senter', 'attribute_ruler', 'lemmatizer', 'ner']
+
+def _load_nlp():
+    import spacy
+    if SWIRL_VECTOR_ENGINE:
+        return spacy.load('en_core_web_lg', exclude=SPACY_PIPELINE_COMPONENTS)
+    return spacy.load('en_core_web_lg')
+
+nlp = register_model('spacy', _load_nlp, module=module_name)
@@ -0,0 +1,53 @@
+'''
+@author:     Sid Probstein
+@contact:    sid@swirl.today
+'''
+
+from django.conf import settings
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from celery.utils.log import get_task_logger
+logger = get_task_logger(__name__)
+
+module_name = 'streaming.py'
+
+SWIRL_STREAM_RESULTS = getattr(settings, 'SWIRL_STREAM_RESULTS', False)
+
+##################################################
+##################################################
+
+def search_is_final(search_status):
+    return search_status.endswith('_READY') or search_status.startswith('ERR')
+
+def search_group_name(search_id):
+    return f'swirl_search_{search_id}'
+
+def notify_search_update(search_id, provider_id=None, final=False):
+
+    '''
+    Tells the websocket consumers watching search_id that a provider finished (provider_id) or that the search is done (final)
+    The consumer re-mixes the page itself, so only the ids are sent over the channel layer
+    '''
+
+    if not SWIRL_STREAM_RESULTS:
+        return False
+    try:
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return False
+        async_to_sync(channel_layer.group_send)(
+            search_group_name(search_id),
+            {
+                'type': 'search.update',
+                'search_id': search_id,
+                'provider_id': provider_id,
+                'final': final
+            }
+        )
+    except Exception as err:
+        # streaming is best effort, the search itself must not fail
+        logger.warning(f"{module_name}: notify failed for search {search_id}: {err}")
+        return False
+    return True
@@ -14,6 +14,7 @@ import jwt
 import django
 from django.utils import timezone
 from django.conf import settings
+from django.db.models import F, Q
 
 from swirl.utils import swirl_setdir
 path.append(swirl_setdir()) # path to settings.py file
@@ -23,12 +24,20 @@ django.setup()
 from swirl.models import Search, OauthToken
 from swirl.authenticators import *
 from swirl.search import search as run_search, get_query_selectd_provder_list
-from datetime import datetime
+from datetime import datetime, timedelta
 
 
 module_name = 'subscriber.py'
 
 SWIRL_SUBSCRIBE_WAIT = getattr(settings, 'SWIRL_SUBSCRIBE_WAIT', 20)
+SWIRL_SUBSCRIBE_SCHEDULER = getattr(settings, 'SWIRL_SUBSCRIBE_SCHEDULER', False)
+SWIRL_SUBSCRIBE_INTERVAL = getattr(settings, 'SWIRL_SUBSCRIBE_INTERVAL', 14400)
+SWIRL_SUBSCRIBE_CONCURRENCY = getattr(settings, 'SWIRL_SUBSCRIBE_CONCURRENCY', 10)
+SWIRL_SUBSCRIBE_STALE = getattr(settings, 'SWIRL_SUBSCRIBE_STALE', 3600)
+
+# a search in one of these is being run; after SWIRL_SUBSCRIBE_STALE seconds without a save it's assumed to have died
+SEARCH_IN_FLIGHT_STATUSES = ['NEW_SEARCH', 'UPDATE_SEARCH', 'PRE_PROCESSING', 'PRE_QUERY_PROCESSING', 'FEDERATING',
+                             'FULL_RESULTS', 'PARTIAL_RESULTS', 'POST_RESULT_PROCESSING', 'RESCORING']
 
 ##################################################
 ##################################################
@@ -100,44 +109,151 @@ def _get_session_for_oauth_providers(search, owner, session_data):
             logger.error(f"Unexpected error for {idp} and owner {owner}: {str(e)}")
             search.messages.append(f"[{datetime.now()}] Unexpected error for {idp} and owner {owner}: {str(e)}")
 
+def _check_subscription_permissions(search):
+    """
+    Returns True if the owner may update the search, otherwise disables the subscription
+    """
+    owner = search.owner # User(search.owner)
+    if owner.has_perm('swirl.change_search') and owner.has_perm('swirl.change_result'):
+        return True
+    logger.warning(f"{module_name}: User {owner} needs permissions change_search({owner.has_perm('swirl.change_search')}), change_result({owner.has_perm('swirl.change_result')})")
+    search.status = 'ERR_SUBSCRIBE_PERMISSIONS'
+    if search.subscribe:
+        search.messages.append(f'[{datetime.now()}] Subscriber disabled updates due to permission error')
+        search.subscribe = False
+    search.save()
+    return False
+
+def _update_subscription(search, chord=False):
+    """
+    Runs one update of a subscribed search whose status is UPDATE_SEARCH; disables the subscription if it fails
+    With chord, returns once federation starts, and the chord callback handles failures
+    """
+    owner = search.owner
+    # Update oauth tokens if necessary
+    session_data = dict()
+    logger.debug(f"{module_name}: update session: {search.id}")
+    _get_session_for_oauth_providers(search=search,owner=owner, session_data=session_data)
+    search.status = 'UPDATE_SEARCH'
+    search.save()
+    # to do: better than below and renaming upon import
+    success = run_search(search.id, session_data, chord=chord)
+    if success:
+        logger.debug(f"{module_name}: subscriber: updated {search.id}")
+    else:
+        subscription_failed(search)
+    # end if
+    return success
+
+def subscription_failed(search):
+    """
+    Disables the subscription of a search whose update failed
+    """
+    search.refresh_from_db()
+    logger.error(f"{module_name}: subscriber: error {search.status} updating {search.id}")
+    if search.subscribe:
+        search.messages.append(f'[{datetime.now()}] Subscriber disabled updates due to error {search.status}')
+        search.subscribe = False
+    search.save()
+
 def subscriber():
     '''
     This is fired whenever a Celery Beat event arrives
     Re-run searches that have subscribe = True, setting date:sort
     Mark new results unretrieved
+    With SWIRL_SUBSCRIBE_SCHEDULER, only due searches are run, each as its own task; see schedule_subscriptions()
     '''
+    if SWIRL_SUBSCRIBE_SCHEDULER:
+        return schedule_subscriptions()
+
     searches = Search.objects.filter(subscribe=True)
     logger.debug(f"START {module_name}")
     for search in searches:
         logger.debug(f"{module_name}: subscriber: {search.id}")
-        owner = search.owner # User(search.owner)
         # check permissions
-        if not (owner.has_perm('swirl.change_search') and owner.has_perm('swirl.change_result')):
-            logger.warning(f"{module_name}: User {owner} needs permissions change_search({owner.has_perm('swirl.change_search')}), change_result({owner.has_perm('swirl.change_result')})")
-            search.status = 'ERR_SUBSCRIBE_PERMISSIONS'
-            if search.subscribe:
-                search.messages.append(f'[{datetime.now()}] Subscriber disabled updates due to permission error')
-                search.subscribe = False
-            search.save()
+        if not _check_subscription_permissions(search):
             continue
-        # Update oauth tokens if necessary
-        session_data = dict()
-        logger.debug(f"{module_name}: update session: {search.id}")
-        _get_session_for_oauth_providers(search=search,owner=owner, session_data=session_data)
-        search.status = 'UPDATE_SEARCH'
-        search.save()
-        # to do: better than below and renaming upon import
-        success = run_search(search.id, session_data)
-        if success:
-            logger.debug(f"{module_name}: subscriber: updated {search.id}")
-        else:
-            logger.error(f"{module_name}: subscriber: error {search.status} updating {search.id}")
-            if search.subscribe:
-                search.messages.append(f'[{datetime.now()}] Subscriber disabled updates due to error {search.status}')
-                search.subscribe = False
-            search.save()
-        # end if
+        _update_subscription(search)
         # time.sleep(SWIRL_SUBSCRIBE_WAIT)
     # end for
     logger.debug(f"END {module_name}")
-    return True
\ No newline at end of file
+    return True
+
+##################################################
+
+def subscription_interval(search):
+    return search.subscribe_interval or SWIRL_SUBSCRIBE_INTERVAL
+
+def _in_flight(queryset, now):
+    stale = now - timedelta(seconds=SWIRL_SUBSCRIBE_STALE)
+    return queryset.filter(status__in=SEARCH_IN_FLIGHT_STATUSES, date_updated__gt=stale)
+
+def subscription_metrics(now=None):
+
+    '''
+    Returns the subscriptions' lag: how many are due, how many are running, and how late the due ones are, in seconds
+    '''
+
+    now = now or timezone.now()
+    subscribed = Search.objects.filter(subscribe=True)
+    due = subscribed.filter(Q(next_run__isnull=True) | Q(next_run__lte=now))
+    lags = [(now - next_run).total_seconds() for next_run in due.exclude(next_run__isnull=True).values_list('next_run', flat=True)]
+    return {
+        'subscribed': subscribed.count(),
+        'due': due.count(),
+        'in_flight': _in_flight(subscribed, now).count(),
+        'max_lag': round(max(lags), 1) if lags else 0.0,
+        'mean_lag': round(sum(lags) / len(lags), 1) if lags else 0.0
+    }
+
+def schedule_subscriptions(now=None):
+
+    '''
+    Sends every due subscription, most overdue first, to its own subscription_update task, keeping at most
+    SWIRL_SUBSCRIBE_CONCURRENCY running; searches whose last run is still in flight are skipped, the rest wait for the next tick
+    Each search is claimed by moving its next_run, so overlapping ticks can't send it twice
+    Returns subscription_metrics() for the tick plus what was sent, skipped and deferred
+    '''
+
+    from swirl.tasks import subscription_update_task
+
+    now = now or timezone.now()
+    metrics = subscription_metrics(now)
+    slots = max(0, SWIRL_SUBSCRIBE_CONCURRENCY - metrics['in_flight'])
+    in_flight = set(_in_flight(Search.objects.filter(subscribe=True), now).values_list('id', flat=True))
+    metrics.update({'sent': 0, 'skipped_in_flight': 0, 'deferred': 0})
+    due = Search.objects.filter(subscribe=True).filter(Q(next_run__isnull=True) | Q(next_run__lte=now)).order_by(F('next_run').asc(nulls_first=True))
+    for search in due:
+        if search.id in in_flight:
+            metrics['skipped_in_flight'] = metrics['skipped_in_flight'] + 1
+            continue
+        if metrics['sent'] >= slots:
+            metrics['deferred'] = metrics['deferred'] + 1
+            continue
+        if not _check_subscription_permissions(search):
+            continue
+        claimed = Search.objects.filter(id=search.id, subscribe=True, status=search.status, next_run=search.next_run).update(
+            next_run=now + timedelta(seconds=subscription_interval(search)), status='UPDATE_SEARCH', date_updated=now)
+        if not claimed:
+            continue
+        subscription_update_task.delay(search.id)
+        metrics['sent'] = metrics['sent'] + 1
+    # end for
+    logger.info(f"{module_name}: subscriptions: {metrics}")
+    return metrics
+
+def subscription_update(search_id):
+    '''
+    Runs one update claimed by schedule_subscriptions()
+    Always as a chord: waiting on its federate tasks would hold a worker slot they may need, and with
+    SWIRL_SUBSCRIBE_CONCURRENCY updates at once, every slot; the update stays in flight until the chord completes it
+    '''
+    try:
+        search = Search.objects.get(id=search_id)
+    except Search.DoesNotExist:
+        logger.warning(f"{module_name}: subscription_update: search {search_id} not found")
+        return False
+    if search.status != 'UPDATE_SEARCH':
+        logger.warning(f"{module_name}: subscription_update: search {search_id} has status {search.status}")
+        return False
+    return _update_subscription(search, chord=True)
@@ -30,6 +30,7 @@ from swirl.models import SearchProvider
 from swirl.performance_logger import *
 from swirl.web_page import PageFetcherFactory
 from swirl.authenticators import SWIRL_AUTHENTICATORS_DISPATCH
+from swirl.streaming import notify_search_update
 
 # use these to have the same options set for all fetches
 # while developing
@@ -123,13 +124,96 @@ def federate_task(search_id, provider_id, provider_connector, update, session, r
     try:
         with ProviderQueryRequestLogger(provider_connector+'_'+str(provider_id), request_id):
             connector = alloc_connector(connector=provider_connector)(provider_id, search_id, update, request_id=request_id)
-            return connector.federate(session)
+            federated = connector.federate(session)
+        # let streaming clients re-mix as soon as this provider's results are saved
+        notify_search_update(search_id, provider_id=provider_id)
+        return federated
     except NameError as err:
         message = f'Error: NameError: {err}'
         logger.error(f'{module_name}: {message}')
     except TypeError as err:
         message = f'Error: TypeError: {err}'
         logger.error(f'{module_name}: {message}')
+    except Exception as err:
+        # a chord only completes when every task returns, so a provider failure must not raise
+        logger.error(f'{module_name}: Error: {type(err).__name__}: {err}')
+    return False
+
+@shared_task(name='federate_fetch', ignore_result=False)
+def federate_fetch_task(search_id, provider_id, provider_connector, update, session, request_id):
+    logger.debug(f"{module_name}: federate_fetch_task: {search_id}_{provider_id}_{provider_connector} update: {update} request_id {request_id}")
+    try:
+        with ProviderQueryRequestLogger(provider_connector+'_'+str(provider_id), request_id):
+            connector = alloc_connector(connector=provider_connector)(provider_id, search_id, update, request_id=request_id)
+            return connector.fetch(session)
+    except NameError as err:
+        message = f'Error: NameError: {err}'
+        logger.error(f'{module_name}: {message}')
+    except TypeError as err:
+        message = f'Error: TypeError: {err}'
+        logger.error(f'{module_name}: {message}')
+    except Exception as err:
+        logger.error(f'{module_name}: Error: {type(err).__name__}: {err}')
+    return False
+
+@shared_task(name='federate_process', ignore_result=False)
+def federate_process_task(state, search_id, provider_id, provider_connector, update, request_id):
+    logger.debug(f"{module_name}: federate_process_task: {search_id}_{provider_id}_{provider_connector} update: {update} request_id {request_id}")
+    if not state:
+        # fetch failed and saved the error
+        notify_search_update(search_id, provider_id=provider_id)
+        return False
+    try:
+        connector = alloc_connector(connector=provider_connector)(provider_id, search_id, update, request_id=request_id)
+        processed = connector.process(state)
+        notify_search_update(search_id, provider_id=provider_id)
+        return processed
+    except NameError as err:
+        message = f'Error: NameError: {err}'
+        logger.error(f'{module_name}: {message}')
+    except TypeError as err:
+        message = f'Error: TypeError: {err}'
+        logger.error(f'{module_name}: {message}')
+    except Exception as err:
+        logger.error(f'{module_name}: Error: {type(err).__name__}: {err}')
+    return False
+
+def federate_signature(search_id, provider_id, provider_connector, update, session, request_id, split=False):
+
+    '''
+    Returns the celery signature that federates one provider: federate_task, or with split,
+    federate_fetch_task on the I/O queue chained to federate_process_task on the CPU queue
+    '''
+
+    if not split:
+        return federate_task.s(search_id, provider_id, provider_connector, update, session, request_id)
+    return (federate_fetch_task.s(search_id, provider_id, provider_connector, update, session, request_id) |
+            federate_process_task.s(search_id, provider_id, provider_connector, update, request_id))
+
+@shared_task(name='federate_http', ignore_result=False)
+def federate_http_task(search_id, providers, update, session, request_id):
+    from swirl.connectors.async_http import federate_http
+
+    logger.debug(f"{module_name}: federate_http_task: {search_id} {providers} update: {update} request_id {request_id}")
+    try:
+        return list(federate_http(search_id, providers, update, session, request_id).values())
+    except Exception as err:
+        logger.error(f'{module_name}: Error: {type(err).__name__}: {err}')
+        return [False for provider in providers]
+
+@shared_task(name='search_complete', ignore_result=True)
+def search_complete_task(results, search_id, update, start_time, request_id, provider_ids):
+    from swirl.search import finish_search
+
+    logger.debug(f"{module_name}: search_complete_task: {search_id}")
+    return finish_search(search_id, update, start_time, request_id, provider_ids, results)
+
+@shared_task(name='search_deadline', ignore_result=True)
+def search_deadline_task(search_id, update, start_time, request_id, provider_ids):
+    from swirl.search import finish_search
+
+    logger.debug(f"{module_name}: search_deadline_task: {search_id}")
+    return finish_search(search_id, update, start_time, request_id, provider_ids, [], timed_out=True)
 
 ##################################################
 
@@ -159,6 +243,12 @@ def subscriber_task():
 
     return subscriber()
 
+@shared_task(name='subscription_update')
+def subscription_update_task(search_id):
+    from swirl.subscriber import subscription_update
+
+    return subscription_update(search_id)
+
 @shared_task(name='update_microsoft_token')
 def update_microsoft_token_task(headers):
     if headers['Authorization']:
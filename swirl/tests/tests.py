@@ -2,8 +2,8 @@ import time
 import json
 import os
 from django.test import TestCase
-from swirl.models import SearchProvider
-from swirl.serializers import SearchProviderSerializer
+from swirl.models import SearchProvider, Search, Result
+from swirl.serializers import SearchProviderSerializer, SearchSerializer
 import swirl_server.settings as settings
 import pytest
 from unittest import mock
@@ -18,8 +18,30 @@ from swirl.processors.transform_query_processor import *
 from swirl.processors.utils import str_tok_get_prefixes, date_str_to_timestamp, highlight_list, match_all, tokenize_word_list
 from swirl.processors.result_map_converter import ResultMapConverter
 from swirl.processors.dedupe import DedupeByFieldResultProcessor
-from swirl.processors.relevancy import DropIrrelevantPostResultProcessor
+from swirl.processors.relevancy import DropIrrelevantPostResultProcessor, RelevancyField, query_match_windows, score_items
 from swirl.utils import select_providers, http_auth_parse
+from swirl.vectors import TextVector, vector_engine
+from swirl.embeddings import EmbeddingService
+from swirl.model_registry import LazyModel
+from swirl.connectors.result_cache import provider_result_cache_ttl, result_cache_key
+from swirl.streaming import notify_search_update, search_group_name, search_is_final
+from swirl.connectors.async_http import PageRequest, UnsupportedRequest, provider_timeout, deadline_transport
+from swirl.connectors.requests import Requests, PageRateLimiter
+from swirl.http_sessions import HttpSessionPool, host_key
+from swirl.connectors.client_registry import ClientRegistry, ConnectionPool
+from swirl.connectors.provider_plan import ProviderPlanCache
+from swirl.mixers.utils import top_k, relevancy_key, date_key
+from swirl.result_items import ResultItemSet, item_to_row, row_to_item
+from swirl.mix_cache import mix_cache_key, get_mix_cache
+from swirl.near_dupes import NearDuplicateIndex, shingles
+from swirl.dedupe_index import canonical_url, dedupe_key
+from swirl.subscriber import subscription_interval, schedule_subscriptions, SWIRL_SUBSCRIBE_INTERVAL
+from swirl.connectors.connector import Connector, FETCH_STATE, start_allocations, stop_allocations
+from swirl.search import finish_search
+from swirl.expirer import retention_cutoffs
+from swirl.processors.query_analysis import QueryAnalysisCache
+from swirl.tasks import federate_signature, federate_task, federate_fetch_task, federate_process_task
+from swirl.cpu_executor import split_batches, merge_relevancy_feedback
 
 
 logger = logging.getLogger(__name__)
@@ -318,6 +340,639 @@ def test_match_all(match_all_test_cases_target, match_all_test_cases_find, match
         assert r == match_all_test_expected[index]
         print(f"Elapsed time for index {index}: {elapsed_time} seconds")
 
+def test_query_match_windows():
+    result_field_list = ['I', 'have', 'a', 'Bird', 'dog', 'he', 'is', 'a', 'swell', 'bird', 'dog']
+    result_field_stemmed_list = [t.lower() for t in result_field_list]
+    windows = query_match_windows(['bird', 'dog'], ['bird', 'dog'], result_field_list, result_field_stemmed_list, False)
+    assert [w[0] for w in windows] == [3, 9]
+    assert windows[0][1] == ['Bird', 'dog']
+    assert windows[0][2] == ['Bird', 'dog', 'he', 'is', 'a', 'swell', 'bird']
+    assert windows[1][2] == ['dog', 'he', 'is', 'a', 'swell', 'bird', 'dog']
+    # capitalization carries over from earlier matches
+    assert windows[0][3] == ['Bird', 'dog']
+    assert windows[1][3] == ['Bird', 'dog']
+
+def test_relevancy_field():
+    from types import SimpleNamespace
+    parsed_query = SimpleNamespace(query_stemmed_list=['bird', 'dog'], query_list=['bird', 'dog'], query_has_numeric=False)
+    analysis = SimpleNamespace(parsed_query=parsed_query, targets=[(['bird', 'dog'], ['bird', 'dog'])])
+    prepared = RelevancyField('I have a Bird dog. He is a swell bird dog.', analysis)
+    assert prepared.result_field_list == prepared.result_field.split()
+    assert prepared.query == 'Bird dog' and len(prepared.sentences) == 2
+    (stemmed_query_target, query_target, windows), = prepared.target_windows
+    assert [window[0] for window in windows] == [3, 9]
+    # every text scoring may vectorize, from the stored matches
+    texts = prepared.nlp_texts()
+    assert texts[:4] == [prepared.result_field, 'Bird dog'] + prepared.sentences
+    assert texts[4:] == [text for window in windows for text in (' '.join(window[2]), ' '.join(window[3]))]
+    # a field without the query has no query text or sentences
+    assert RelevancyField('nothing to see', analysis).nlp_texts() == ['nothing to see']
+
+def test_vector_engine_similarity_matrix():
+    import numpy as np
+    tvs = [
+        TextVector((1, 2), np.array([1.0, 0.0], dtype='float32'), True),
+        TextVector((3,), np.array([0.0, 1.0], dtype='float32'), True),
+        TextVector((4, 5), np.array([1.0, 1.0], dtype='float32'), True),
+        TextVector((), np.zeros((2,), dtype='float32'), False),
+    ]
+    sims = vector_engine.similarity_matrix(tvs)
+    for i in range(len(tvs)):
+        for j in range(len(tvs)):
+            if i != j:
+                assert abs(sims[i, j] - tvs[i].similarity(tvs[j])) < 1e-6
+    assert abs(sims[0, 2] - 0.70710677) < 1e-6
+    assert sims[3, 0] == 0.0
+    # rows scaled to unit length, zero vectors stay zero, so dedupe can score an item against the kept rows only
+    normalized = vector_engine.normalized_matrix(tvs)
+    assert abs(float(normalized[2] @ normalized[0]) - sims[2, 0]) < 1e-6
+    assert not normalized[3].any()
+
+def test_lazy_model_loads_once():
+    calls = []
+    def loader():
+        calls.append(1)
+        return {'the', 'a'}
+    model = LazyModel('test_stopwords', loader, module='tests.py')
+    assert not model.loaded
+    assert 'the' in model
+    assert len(model) == 2
+    assert model.loaded
+    assert len(calls) == 1
+
+def test_embedding_service_caches():
+    import torch
+    loads = []
+    inferences = []
+    def fake_model(name):
+        loads.append(name)
+        model = mock.MagicMock()
+        def infer(**inputs):
+            inferences.append(name)
+            return mock.MagicMock(last_hidden_state=torch.ones((1, 2, 4)))
+        model.side_effect = infer
+        return model
+    with mock.patch('swirl.embeddings.AutoTokenizer.from_pretrained', return_value=mock.MagicMock(return_value={})), \
+         mock.patch('swirl.embeddings.AutoModel.from_pretrained', side_effect=fake_model):
+        service = EmbeddingService(model_cache_size=2, query_cache_size=8)
+        # each model loads once
+        assert service.get_model('m1') is service.get_model('m1')
+        assert loads == ['m1']
+        # the least recently used model is evicted at model_cache_size
+        service.get_model('m2')
+        service.get_model('m1')
+        service.get_model('m3')
+        assert list(service.models) == ['m1', 'm3'] and loads == ['m1', 'm2', 'm3']
+        # queries are normalized, so the second embed is a cache hit
+        first = service.embed('a  b', model_name='m1')
+        second = service.embed('a b', model_name='m1')
+        assert inferences == ['m1'] and service.hits == 1 and service.misses == 1
+        assert (first == second).all()
+        # callers get copies
+        second[0] = 42.0
+        assert service.embed('a b', model_name='m1')[0] == 1.0
+        assert inferences == ['m1']
+
+def test_result_cache_key_and_ttl():
+    from types import SimpleNamespace
+    provider = SimpleNamespace(id=7, tags=['News', 'result_cache_ttl:300'], connector='RequestsGet', url='https://example.com',
+                               query_template='{url}?q={query_string}', query_mappings='', response_mappings='', credentials='', results_per_query=10)
+    search = SimpleNamespace(sort='relevancy', filters='', owner_id=1)
+    assert provider_result_cache_ttl(provider) == 300
+    key = result_cache_key(provider, search, 'knowledge management', 'https://example.com?q=knowledge+management')
+    assert key.startswith('swirl_result:7:')
+    assert key == result_cache_key(provider, search, 'knowledge management', 'https://example.com?q=knowledge+management')
+    search.sort = 'date'
+    assert key != result_cache_key(provider, search, 'knowledge management', 'https://example.com?q=knowledge+management')
+    provider.url = 'https://example.org'
+    search.sort = 'relevancy'
+    assert key != result_cache_key(provider, search, 'knowledge management', 'https://example.com?q=knowledge+management')
+
+def test_notify_search_update():
+    channel_layer = mock.MagicMock()
+    channel_layer.group_send = mock.AsyncMock()
+    with mock.patch('swirl.streaming.get_channel_layer', return_value=channel_layer):
+        assert not notify_search_update(42, provider_id=3)
+    channel_layer.group_send.assert_not_awaited()
+    with mock.patch('swirl.streaming.SWIRL_STREAM_RESULTS', True):
+        with mock.patch('swirl.streaming.get_channel_layer', return_value=channel_layer):
+            assert notify_search_update(42, provider_id=3)
+        channel_layer.group_send.assert_awaited_once_with(search_group_name(42), {'type': 'search.update', 'search_id': 42, 'provider_id': 3, 'final': False})
+        channel_layer.group_send = mock.AsyncMock(side_effect=ConnectionError('redis down'))
+        with mock.patch('swirl.streaming.get_channel_layer', return_value=channel_layer):
+            assert not notify_search_update(42, final=True)
+
+def test_search_is_final():
+    assert search_is_final('FULL_RESULTS_READY')
+    assert search_is_final('PARTIAL_UPDATE_READY')
+    assert search_is_final('ERR_NO_SEARCHPROVIDERS')
+    assert not search_is_final('FEDERATING')
+    assert not search_is_final('POST_RESULT_PROCESSING')
+
+def test_async_http_page_request():
+    from types import SimpleNamespace
+    from requests.auth import HTTPBasicAuth, HTTPProxyAuth
+    page_request = PageRequest('get', 'https://example.com/?q=swirl', params=None, headers={'X-Api-Key': 'k'}, verify=False, auth=HTTPBasicAuth('u', 'p'))
+    assert page_request.method == 'GET'
+    assert page_request.verify is False
+    assert set(page_request.kwargs.keys()) == {'params', 'headers', 'auth'}
+    assert PageRequest('post', 'https://example.com', data='a=1').kwargs == {'content': 'a=1'}
+    with pytest.raises(UnsupportedRequest):
+        PageRequest('get', 'https://example.com', auth=HTTPProxyAuth('u', 'p'))
+    with pytest.raises(UnsupportedRequest):
+        PageRequest('get', 'https://example.com', stream=True)
+    assert provider_timeout(SimpleNamespace(id=1, tags=['News', 'timeout:2.5'])) == 2.5
+    assert provider_timeout(SimpleNamespace(id=1, tags=['News'])) == float(settings.SWIRL_TIMEOUT)
+
+def test_deadline_transport():
+    import requests
+    with mock.patch('swirl.connectors.async_http.http_session_pool.request') as request:
+        deadline_transport(time.time() + 5)('get', 'https://example.com/search', params={'q': 'x'})
+        method, url = request.call_args.args
+        assert method == 'GET' and 0 < request.call_args.kwargs['timeout'] <= 5
+        # a shorter timeout set by the connector is kept
+        deadline_transport(time.time() + 5)('post', 'https://example.com/search', timeout=1)
+        assert request.call_args.kwargs['timeout'] == 1
+        with pytest.raises(requests.exceptions.Timeout):
+            deadline_transport(time.time() - 1)('get', 'https://example.com/search')
+
+def test_async_http_provider_failure_is_isolated():
+    import asyncio
+    from types import SimpleNamespace
+    from swirl.connectors.async_http import AsyncHttpFederation
+    connectors = []
+    for provider_id in [1, 2, 3]:
+        connector = Requests.__new__(Requests)
+        connector.type = 'RequestsGet'
+        connector.search_id = 42
+        connector.provider_id = provider_id
+        connector.provider = SimpleNamespace(id=provider_id, name=f'p{provider_id}', connector='RequestsGet', tags=[])
+        connector.cached = False
+        connector.status = 'FEDERATING'
+        connector.messages = []
+        connectors.append(connector)
+    # provider 1 answers without a Content-Type header, provider 3 fails in execute_search()
+    no_content_type = SimpleNamespace(status_code=200, reason='OK', headers={}, text='{}')
+
+    async def execute(self, connector, page_requests, timeout):
+        if connector.provider_id == 1:
+            return [('https://example.com/?q=swirl', no_content_type)]
+        if connector.provider_id == 3:
+            raise ValueError('bad response')
+        return None
+
+    federation = AsyncHttpFederation(42, [], False, None)
+    with mock.patch.object(AsyncHttpFederation, 'execute', execute), \
+         mock.patch('swirl.connectors.async_http.notify_search_update'), \
+         mock.patch('swirl.connectors.requests.provider_plan'), \
+         mock.patch.object(Requests, 'save_results'), \
+         mock.patch.object(Requests, 'complete_federate', return_value=True):
+        asyncio.run(federation.fan_out([(connectors[0], []), (connectors[1], []), (connectors[2], None)]))
+    assert federation.results == {1: False, 2: True, 3: False}
+    assert connectors[0].status == 'ERROR' and "'Content-Type'" in connectors[0].messages[0]
+    assert connectors[2].status == 'ERROR' and 'bad response' in connectors[2].messages[0]
+
+def test_async_http_follows_redirects():
+    import asyncio
+    import httpx
+    from swirl.connectors.async_http import AsyncHttpFederation
+    requested = []
+
+    def handler(request):
+        requested.append(request)
+        if request.url.path == '/old':
+            return httpx.Response(302, headers={'Location': 'https://example.com/new?q=swirl'})
+        return httpx.Response(200, json={'items': []})
+
+    async_client = httpx.AsyncClient
+    federation = AsyncHttpFederation(42, [], False, None)
+
+    async def send():
+        try:
+            return await federation.send(PageRequest('get', 'https://example.com/old?q=swirl'), 30)
+        finally:
+            for client in federation.clients.values():
+                await client.aclose()
+
+    with mock.patch('swirl.connectors.async_http.httpx.AsyncClient', lambda **kwargs: async_client(transport=httpx.MockTransport(handler), **kwargs)):
+        response = asyncio.run(send())
+    assert response.status_code == 200 and response.json() == {'items': []}
+    assert [str(request.url) for request in requested] == ['https://example.com/old?q=swirl', 'https://example.com/new?q=swirl']
+    # the provider timeout applies to each request, not SWIRL_TIMEOUT
+    assert requested[0].extensions['timeout']['read'] == 30
+
+def test_requests_parallel_pages():
+    from types import SimpleNamespace
+    connector = Requests.__new__(Requests)
+    connector.provider = SimpleNamespace(results_per_query=30, tags=['page_concurrency:3'])
+    connector.query_mappings = {'PAGE': 'start=RESULT_INDEX'}
+    connector.query_to_provider = 'https://example.com/search?key=k&q=swirl'
+    page_queries = connector.page_queries()
+    assert page_queries == [
+        'https://example.com/search?key=k&start=1&q=swirl',
+        'https://example.com/search?key=k&start=11&q=swirl',
+        'https://example.com/search?key=k&start=21&q=swirl'
+    ]
+    assert connector.paging_limits() == (3, 0.0)
+    # pages finish out of order but are yielded in page order
+    def fetch_page(page_query, session=None):
+        time.sleep(0.05 * (3 - page_queries.index(page_query)))
+        return page_query
+    connector.fetch_page = fetch_page
+    pages = list(connector.fetch_pages_parallel(page_queries, 3, 0))
+    assert pages == [(page_query, page_query) for page_query in page_queries]
+
+def test_page_rate_limiter():
+    limiter = PageRateLimiter(10)
+    delays = [limiter.delay() for i in range(3)]
+    assert delays[0] == 0.0
+    assert 0.15 < delays[2] <= 0.2
+    assert PageRateLimiter(0).delay() == 0.0
+
+def test_http_session_pool():
+    assert host_key('HTTPS://Example.com:8443/search?q=1') == 'https://example.com:8443'
+    pool = HttpSessionPool(max_sessions=2, retries=1)
+    session = pool.session('https://example.com/a')
+    assert pool.session('https://example.com/b?q=2') is session
+    assert pool.session('http://example.com/a') is not session
+    assert session.adapters['https://'].max_retries.total == 1
+    # evicted, but not closed under a thread that may still be using it
+    with mock.patch.object(session, 'close') as close:
+        pool.session('https://example.org/')
+    assert 'https://example.com' not in pool.sessions and not close.called
+    assert HttpSessionPool(retries=0).session('https://example.com/').adapters['https://'].max_retries.total == 0
+    assert pool.stats()['https://example.org'] == {'requests': 0, 'connections': 0, 'reused': 0}
+    pool.close()
+    assert pool.stats() == {}
+
+def test_client_registry():
+    from types import SimpleNamespace
+    provider = SimpleNamespace(id=5, connector='Elastic', url='http://localhost:9200', credentials='elastic:pw', eval_credentials='', date_updated='2024-01-01')
+    registry = ClientRegistry(idle_timeout=300, health_check_interval=0)
+    closed = []
+    healthy = [True]
+    def get(p):
+        return registry.get(p, lambda: object(), close=closed.append, health_check=lambda client: healthy[0])
+    client = get(provider)
+    assert get(provider) is client
+    # unhealthy clients are replaced
+    healthy[0] = False
+    replacement = get(provider)
+    assert replacement is not client and closed == [client]
+    healthy[0] = True
+    # a provider update replaces its client
+    provider.date_updated = '2024-02-01'
+    updated = get(provider)
+    assert updated is not replacement and closed[-1] is replacement
+    # idle clients are evicted
+    registry.evict_idle(now=registry.clients[next(iter(registry.clients))].last_used + 301)
+    assert registry.clients == {} and closed[-1] is updated
+
+def test_client_registry_slow_provider():
+    import threading
+    from types import SimpleNamespace
+    slow = SimpleNamespace(id=1, connector='MongoDB', url='db:c', credentials='', eval_credentials='', date_updated='2024-01-01')
+    fast = SimpleNamespace(id=2, connector='MongoDB', url='db:c', credentials='', eval_credentials='', date_updated='2024-01-01')
+    registry = ClientRegistry()
+    connecting = threading.Event()
+    release = threading.Event()
+    def connect_slowly():
+        connecting.set()
+        release.wait(5)
+        return 'slow'
+    thread = threading.Thread(target=registry.get, args=(slow, connect_slowly))
+    thread.start()
+    assert connecting.wait(5)
+    # another provider's lookup doesn't wait for the blocked connect
+    assert registry.get(fast, lambda: 'fast') == 'fast'
+    release.set()
+    thread.join(5)
+    assert registry.get(slow, lambda: 'again') == 'slow'
+
+def test_connection_pool():
+    opened = []
+    closed = []
+    healthy = [True]
+    def connect():
+        opened.append(object())
+        return opened[-1]
+    pool = ConnectionPool(connect, close=closed.append, health_check=lambda connection: healthy[0], size=1, health_check_interval=0)
+    # concurrent callers never share a connection
+    first = pool.checkout()
+    second = pool.checkout()
+    assert first is not second and len(opened) == 2
+    pool.checkin(first)
+    pool.checkin(second)
+    assert closed == [second]
+    assert pool.checkout() is first
+    # a discarded connection is closed, the others are untouched
+    pool.checkin(first, discard=True)
+    assert closed == [second, first]
+    # unhealthy idle connections are replaced
+    pool.checkin(pool.checkout())
+    healthy[0] = False
+    replaced = opened[-1]
+    assert pool.checkout() is not replaced and closed[-1] is replaced
+    # closing the pool closes connections still checked out when they come back
+    healthy[0] = True
+    in_use = pool.checkout()
+    pool.close()
+    pool.checkin(in_use)
+    assert closed[-1] is in_use and pool.idle == []
+
+def test_provider_plan():
+    from types import SimpleNamespace
+    provider = SimpleNamespace(id=7, query_mappings='PAGE=start=RESULT_INDEX,cx=0c38', response_mappings='FOUND=searchInformation.totalResults,RESULTS=items',
+                               result_mappings="url=link,body='{snippet} {sw_urlencode(title)}',NO_PAYLOAD", date_updated='2024-01-01')
+    cache = ProviderPlanCache(size=2)
+    plan = cache.get(provider)
+    assert cache.get(provider) is plan
+    assert plan.query_mappings == {'PAGE': 'start=RESULT_INDEX', 'cx': '0c38'}
+    assert plan.bind_query('{url}?cx={cx}&q={query_string}', 'https://x.com/') == 'https://x.com/?cx=0c38&q={query_string}'
+    assert plan.jsonpath('$.items') is plan.jsonpath('$.items')
+    url_mapping, body_mapping = plan.result_mapping_list()
+    assert [match.value for match in url_mapping.lookups[0][3].find({'link': 'https://a'})] == ['https://a']
+    assert body_mapping.is_template and [lookup[2] for lookup in body_mapping.lookups] == ['$.snippet', 'title']
+    assert body_mapping.lookups[1][1].get_value('a b') == 'a%20b'
+    # a changed provider gets a new plan, and saving a provider drops its plans
+    provider.date_updated = '2024-02-01'
+    assert cache.get(provider) is not plan
+    cache.discard(7)
+    assert cache.plans == {}
+
+def test_result_item_row():
+    result = Result(id=3, search_id_id=9, json_results=[])
+    item = {'swirl_rank': 1, 'swirl_score': 12.5, 'title': 'a title', 'url': 'https://x.com/a', 'date_published': 'unknown',
+            'payload': {'views': 1}, 'explain': {'title': {'a_title': 0.9}}}
+    row = item_to_row(result, 4, item)
+    assert row.position == 4 and row.result_id == 3 and row.search_id_id == 9
+    assert row.swirl_score == 12.5 and row.url == 'https://x.com/a' and row.date_published == 'unknown'
+    # payload and explain are stored apart from the rest of the item
+    assert 'payload' not in row.item and 'explain' not in row.item and row.payload == {'views': 1}
+    assert row_to_item(row) == item
+    # items without a score or url keep those columns empty
+    row = item_to_row(result, 0, {'title': 'no score'})
+    assert row.swirl_score is None and row.url is None and row.payload is None
+    assert row_to_item(row) == {'title': 'no score'}
+
+def test_result_item_set_deferred():
+    items = [{'url': 'https://x.com/a', 'swirl_score': 1.0}, {'url': 'https://x.com/b', 'swirl_score': 0.0}]
+    result = Result(id=4, search_id_id=9, json_results=items)
+    result_items = ResultItemSet([result], deferred=True)
+    assert result_items.items(result) is items
+    result_items.replace(result, items[:1])
+    # deferred saves only record what to write
+    assert result_items.save(fields=[]) == 0
+    result_items.save(fields=['item'], changed=items[:1])
+    assert result_items._pending and result_items._pending_fields == {'item'} and result_items._pending_changed is None
+    assert result.json_results == items[:1]
+
+def test_mixer_top_k():
+    from itertools import chain
+    from operator import itemgetter
+    provider_1 = [{'swirl_score': 2.0, 'date_published': '2024-01-01', 'searchprovider_rank': r, 'id': f'a{r}'} for r in range(1, 6)]
+    provider_2 = [{'swirl_score': float(r % 3), 'date_published': f'2023-0{r}-01', 'searchprovider_rank': r, 'id': f'b{r}'} for r in range(1, 8)]
+    all_results = list(chain(provider_1, provider_2))
+    # the same order as the three stable sorts it replaces
+    expected = sorted(sorted(sorted(all_results, key=itemgetter('searchprovider_rank')), key=itemgetter('date_published'), reverse=True), key=itemgetter('swirl_score'), reverse=True)
+    for k in [1, 4, 12, 20]:
+        assert top_k([provider_1, provider_2], k, relevancy_key) == expected[:k]
+    assert top_k([provider_2, provider_1], 3, date_key) == sorted(all_results, key=itemgetter('date_published'), reverse=True)[:3]
+
+def test_mix_cache_key():
+    from types import SimpleNamespace
+    from datetime import datetime
+    search = SimpleNamespace(id=5, date_updated=datetime(2024, 1, 1))
+    key = mix_cache_key(search, 'RelevancyMixer', None, 'http://localhost:8000')
+    assert key.startswith('swirl_mix:5:') and key == mix_cache_key(search, 'RelevancyMixer', None, 'http://localhost:8000')
+    # each mixer, provider filter and update of the search has its own mix
+    assert key != mix_cache_key(search, 'DateMixer', None, 'http://localhost:8000')
+    assert key != mix_cache_key(search, 'RelevancyMixer', [1, 2], 'http://localhost:8000')
+    assert key != mix_cache_key(SimpleNamespace(id=5, date_updated=datetime(2024, 1, 2)), 'RelevancyMixer', None, 'http://localhost:8000')
+
+def test_mix_cache_needs_shared_backend():
+    # the default swirl_results cache is per process, so the mix cache stays off even with a TTL
+    with mock.patch('swirl.mix_cache.SWIRL_MIX_CACHE_TTL', 60):
+        assert get_mix_cache() is None
+
+def test_near_duplicate_index():
+    text = "the quick brown fox jumps over the lazy dog near the river bank on a sunny afternoon in late spring while birds sing"
+    assert shingles('A b', 3) == {'a b'} and shingles('', 3) == set()
+    index = NearDuplicateIndex(threshold=0.8)
+    assert index.add_unique(text)
+    assert not index.add_unique(text.upper() + ' today')
+    assert index.add_unique("an unrelated text about database indexes and query planning in postgres")
+    # texts without words are never duplicates
+    assert index.add_unique('') and index.add_unique('')
+    assert len(index.signatures) == 2
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(permutations=100, bands=32)
+
+def test_dedupe_canonical_url():
+    url = 'https://www.example.com/a/b/?utm_source=x&b=2&a=1#top'
+    assert canonical_url(url) == 'example.com/a/b?a=1&b=2'
+    assert dedupe_key(url) == dedupe_key('http://example.com:80/a/b?a=1&b=2&gclid=abc')
+    assert dedupe_key(url) == dedupe_key('www.example.com/a/b?b=2&a=1')
+    assert dedupe_key(url) != dedupe_key('https://example.com/a/c?a=1&b=2')
+    assert canonical_url('https://example.com:8443/') == 'example.com:8443'
+    # other values are only stripped
+    assert canonical_url(' Some Title ') == 'Some Title'
+    assert dedupe_key('') is None and -2**63 <= dedupe_key('x') < 2**63
+
+def test_subscription_interval():
+    from types import SimpleNamespace
+    assert subscription_interval(SimpleNamespace(subscribe_interval=600)) == 600
+    assert subscription_interval(SimpleNamespace(subscribe_interval=0)) == SWIRL_SUBSCRIBE_INTERVAL
+
+def subscribed_search(owner, next_run, status='FULL_RESULTS_READY', **kwargs):
+    return Search.objects.create(owner=owner, query_string='knowledge management', subscribe=True, status=status, next_run=next_run, **kwargs)
+
+@pytest.mark.django_db
+def test_schedule_subscriptions(test_suser):
+    from datetime import timedelta
+    from django.utils import timezone
+    now = timezone.now()
+    due = subscribed_search(test_suser, now - timedelta(hours=1), subscribe_interval=3600)
+    never_run = subscribed_search(test_suser, None)
+    not_due = subscribed_search(test_suser, now + timedelta(hours=1))
+    running = subscribed_search(test_suser, now - timedelta(hours=2), status='FEDERATING')
+    Search.objects.create(owner=test_suser, query_string='not subscribed', subscribe=False, status='FULL_RESULTS_READY', next_run=now - timedelta(hours=1))
+    with mock.patch('swirl.tasks.subscription_update_task') as task:
+        metrics = schedule_subscriptions(now)
+    # never run searches go first, in flight ones are left alone
+    assert [call.args[0] for call in task.delay.call_args_list] == [never_run.id, due.id]
+    assert metrics['sent'] == 2 and metrics['skipped_in_flight'] == 1 and metrics['deferred'] == 0
+    due.refresh_from_db()
+    assert due.status == 'UPDATE_SEARCH' and due.next_run == now + timedelta(seconds=3600)
+    never_run.refresh_from_db()
+    assert never_run.next_run == now + timedelta(seconds=SWIRL_SUBSCRIBE_INTERVAL)
+    not_due.refresh_from_db()
+    running.refresh_from_db()
+    assert not_due.status == 'FULL_RESULTS_READY' and running.status == 'FEDERATING'
+    # claimed searches aren't due again until their next_run
+    with mock.patch('swirl.tasks.subscription_update_task') as task:
+        assert schedule_subscriptions(now)['sent'] == 0
+    assert not task.delay.called
+
+@pytest.mark.django_db
+def test_schedule_subscriptions_concurrency(test_suser):
+    from datetime import timedelta
+    from django.utils import timezone
+    now = timezone.now()
+    subscribed_search(test_suser, now - timedelta(hours=4), status='FEDERATING')
+    most_overdue = subscribed_search(test_suser, now - timedelta(hours=3))
+    subscribed_search(test_suser, now - timedelta(hours=2))
+    subscribed_search(test_suser, now - timedelta(hours=1))
+    # one slot is taken by the running search
+    with mock.patch('swirl.subscriber.SWIRL_SUBSCRIBE_CONCURRENCY', 2), mock.patch('swirl.tasks.subscription_update_task') as task:
+        metrics = schedule_subscriptions(now)
+    assert [call.args[0] for call in task.delay.call_args_list] == [most_overdue.id]
+    assert metrics['in_flight'] == 1 and metrics['sent'] == 1 and metrics['deferred'] == 2 and metrics['skipped_in_flight'] == 1
+
+@pytest.mark.django_db
+def test_schedule_subscriptions_claimed_once(test_suser):
+    from datetime import timedelta
+    from django.utils import timezone
+    from swirl.subscriber import _check_subscription_permissions
+    now = timezone.now()
+    search = subscribed_search(test_suser, now - timedelta(hours=1))
+
+    def overlapping_tick(search):
+        # another tick claims the search between this one reading and claiming it
+        claimed = Search.objects.filter(id=search.id, subscribe=True, status=search.status, next_run=search.next_run).update(
+            next_run=now + timedelta(hours=1), status='UPDATE_SEARCH', date_updated=now)
+        assert claimed == 1
+        return _check_subscription_permissions(search)
+
+    with mock.patch('swirl.subscriber._check_subscription_permissions', side_effect=overlapping_tick), \
+         mock.patch('swirl.tasks.subscription_update_task') as task:
+        metrics = schedule_subscriptions(now)
+    assert metrics['sent'] == 0 and not task.delay.called
+    search.refresh_from_db()
+    assert search.next_run == now + timedelta(hours=1)
+
+def test_search_serializer_subscribe_interval():
+    from rest_framework.exceptions import ValidationError
+    serializer = SearchSerializer()
+    assert serializer.fields['next_run'].read_only
+    assert serializer.validate_subscribe_interval(0) == 0
+    assert serializer.validate_subscribe_interval(settings.SWIRL_SUBSCRIBE_TICK) == settings.SWIRL_SUBSCRIBE_TICK
+    for interval in [-1, 60]:
+        with pytest.raises(ValidationError):
+            serializer.validate_subscribe_interval(interval)
+
+def test_retention_cutoffs():
+    from datetime import datetime, timedelta, timezone
+    now = datetime(2024, 3, 15, 12, tzinfo=timezone.utc)
+    cutoffs = retention_cutoffs(now)
+    assert cutoffs == {1: now - timedelta(hours=1), 2: now - timedelta(days=1), 3: now - timedelta(days=30)}
+
+def test_query_analysis_cache():
+    cache = QueryAnalysisCache(size=2)
+    analysis = cache.get('knowledge management')
+    assert cache.get('knowledge management') is analysis
+    assert analysis.parsed_query.query_list == ['knowledge', 'management']
+    assert len(analysis.targets) == 3
+    # provider query terms change the parsed query, so they get their own analysis
+    with_terms = cache.get('knowledge management', {'result_processor_feedback': {'query': {'provider_query_terms': ['km']}}})
+    assert with_terms is not analysis and 'km' in with_terms.parsed_query.query_list
+    # query vectors are computed once
+    calls = []
+    doc_for = lambda text: calls.append(text) or text.lower()
+    assert analysis.vector('Knowledge management', doc_for) == 'knowledge management'
+    analysis.vector('Knowledge management', doc_for)
+    assert calls == ['Knowledge management'] and analysis.has_vector('Knowledge management')
+    # and bounded, least recently used first out
+    analysis.vectors_size = 2
+    analysis.vector('knowledge', doc_for)
+    analysis.vector('Knowledge management', doc_for)
+    analysis.vector('management', doc_for)
+    assert analysis.has_vector('Knowledge management') and not analysis.has_vector('knowledge')
+
+def test_cpu_split_batches():
+    items = list(range(10))
+    assert split_batches(items, 3) == [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    # never smaller than min_batch, never more batches than asked for
+    assert split_batches(items, 8, min_batch=4) == [[0, 1, 2, 3, 4], [5, 6, 7, 8, 9]]
+    assert split_batches(items, 4, min_batch=20) == [items]
+    assert split_batches([], 4) == []
+
+def test_merge_relevancy_feedback():
+    first = {'result_processor_feedback': {'query': {'dict_result_lens': {'title': [3, 4]}, 'list_query_lens': [2]}}}
+    second = {'result_processor_feedback': {'query': {'dict_result_lens': {'title': [4], 'body': [20]}, 'list_query_lens': [2]}}}
+    query = merge_relevancy_feedback([first, second])['result_processor_feedback']['query']
+    assert query['dict_result_lens'] == {'title': [3, 4, 4], 'body': [20]} and query['list_query_lens'] == [2]
+
+def test_relevancy_score_items():
+    item = {'url': 'https://example.com', 'swirl_score': 0.0, 'searchprovider_rank': 1, 'hits': ['knowledge'],
+            'dict_score': {'title': {'knowledge': 0.9}}, 'dict_len': {'title': 4}}
+    unscored = {'url': 'https://example.com/2', 'swirl_score': 0.0, 'searchprovider_rank': 2}
+    scored = score_items([(item, 'knowledge'), (unscored, 'knowledge')], {'title': 4}, [1])
+    assert scored[0] is item and scored[1] is None
+    # title weight 1.5 * similarity 0.9 * len('knowledge')^2, no length adjustments, rank 1 boost 2.0
+    assert round(item['swirl_score'], 3) == round(1.5 * 0.9 * 81 * 2.0, 3)
+    assert item['explain']['title']['result_length_adjust'] == 1.0 and item['explain']['hits'] == ['knowledge']
+    assert 'dict_score' not in item and 'hits' not in item
+    # a field without a pass 1 length is skipped, not a KeyError
+    no_len = {'url': 'https://example.com/3', 'swirl_score': 0.0, 'searchprovider_rank': 1, 'dict_score': {'title': {'knowledge': 0.9}}}
+    assert score_items([(no_len, 'knowledge')], {'title': 4}, [1])[0]['swirl_score'] == 0.0
+
+def test_federate_signature():
+    single = federate_signature(1, 2, 'RequestsGet', False, {}, 'r1')
+    assert single.task == 'federate' and list(single.args) == [1, 2, 'RequestsGet', False, {}, 'r1']
+    # split: fetch on the I/O queue, its state passed to process on the CPU queue
+    split = federate_signature(1, 2, 'RequestsGet', False, {}, 'r1', split=True)
+    assert [task.task for task in split.tasks] == ['federate_fetch', 'federate_process']
+    assert list(split.tasks[1].args) == [1, 2, 'RequestsGet', False, 'r1']
+
+def test_fetch_state_json_safe():
+    from bson import ObjectId
+    object_id = ObjectId('64b7f0c2a1b2c3d4e5f60718')
+    def execute_search(self, session):
+        self.results = [{'_id': object_id, 'title': 'knowledge management', 'thumbnail': b'\x89PNG'}]
+        self.found = self.retrieved = 1
+        self.status = 'READY'
+    fetcher = Connector.__new__(Connector)
+    fetcher.cached = False
+    for attr in FETCH_STATE:
+        setattr(fetcher, attr, None)
+    with mock.patch.object(Connector, 'prepare_federate', return_value=True), \
+         mock.patch.object(Connector, 'execute_search', execute_search), \
+         mock.patch.object(Connector, 'normalize_response'), mock.patch.object(Connector, 'put_cached_response'):
+        state = fetcher.fetch({})
+    # what celery's json serializer sends to federate_process
+    state = json.loads(json.dumps(state))
+    assert state['results'][0]['_id'] == str(object_id) and state['results'][0]['title'] == 'knowledge management'
+    processor = Connector.__new__(Connector)
+    processor.status = 'READY'
+    with mock.patch.object(Connector, 'complete_federate', lambda self: self.results):
+        assert processor.process(state) == state['results']
+    assert processor.cached and processor.found == 1
+
+@pytest.mark.django_db
+def test_finish_search_once(test_suser):
+    search = Search.objects.create(owner=test_suser, query_string='knowledge management', status='FEDERATING', post_result_processors=[])
+    # the deadline claims the search first, so the chord callback finds it completed
+    assert finish_search(search.id, False, time.time(), 'r1', [], [], timed_out=True)
+    assert not finish_search(search.id, False, time.time(), 'r1', [], [3, [2, 0]])
+    search.refresh_from_db()
+    assert search.status == 'PARTIAL_RESULTS_READY'
+
+def test_federate_tasks_return_false_on_error():
+    from django.db import DatabaseError
+    # a raising header task would keep the chord callback from ever running
+    failing = mock.MagicMock(side_effect=DatabaseError('connection lost'))
+    with mock.patch('swirl.tasks.alloc_connector', return_value=failing), mock.patch('swirl.tasks.notify_search_update'):
+        assert federate_task(1, 2, 'RequestsGet', False, {}, 'r1') is False
+        assert federate_fetch_task(1, 2, 'RequestsGet', False, {}, 'r1') is False
+        assert federate_process_task({'results': []}, 1, 2, 'RequestsGet', False, 'r1') is False
+
+def test_result_processor_allocations():
+    start = start_allocations()
+    held = bytearray(1 << 20)
+    elapsed, allocated, peak = stop_allocations(start)
+    assert elapsed >= 0 and allocated >= len(held) and peak >= allocated
+
 def get_dirp_result():
     data_dir = os.path.dirname(os.path.abspath(__file__))
     # Build the absolute file path for the JSON file in the 'data' subdirectory
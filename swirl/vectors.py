@@ -0,0 +1,125 @@
+'''
+@author:     Sid Probstein
+@contact:    sid@swirl.today
+'''
+
+import numpy as np
+
+from swirl.spacy import nlp
+from swirl.model_registry import register_model
+
+import logging
+logger = logging.getLogger(__name__)
+
+module_name = 'vectors.py'
+
+#############################################
+#############################################
+
+class TextVector:
+
+    '''
+    The averaged static word vector for a text
+    Behaves like a spaCy Doc for vector, vector_norm, has_vector and similarity()
+    '''
+
+    __slots__ = ('orths', 'vector', 'vector_norm', 'has_vector')
+
+    def __init__(self, orths, vector, has_vector):
+        self.orths = orths
+        self.vector = vector
+        self.vector_norm = float(np.sqrt(np.dot(vector, vector)))
+        self.has_vector = has_vector
+
+    def __len__(self):
+        return len(self.orths)
+
+    def similarity(self, other):
+        # same as Doc.similarity: identical token sequences are identical
+        if self.orths == other.orths:
+            return 1.0
+        if self.vector_norm == 0 or other.vector_norm == 0:
+            return 0.0
+        return float(np.dot(self.vector, other.vector) / (self.vector_norm * other.vector_norm))
+
+#############################################
+
+class VectorEngine:
+
+    '''
+    Computes text vectors straight from the model's vector table
+    Only the tokenizer runs; tagger, parser, NER etc. are never invoked
+    '''
+
+    def __init__(self, language):
+        self.tokenizer = language.tokenizer
+        self.table = language.vocab.vectors
+        self.data = np.asarray(self.table.data, dtype='float32')
+        self.width = self.data.shape[1] if self.data.ndim == 2 else 0
+        self.rows = {}
+        if self.width == 0:
+            logger.warning(f"{module_name}: model has no word vectors, all similarities will be 0")
+
+    def _row(self, orth):
+        row = self.rows.get(orth)
+        if row is None:
+            row = self.table.find(key=orth)
+            self.rows[orth] = row
+        return row
+
+    def text_vector(self, text):
+        orths = tuple(token.orth for token in self.tokenizer(text))
+        if not orths or self.width == 0:
+            return TextVector(orths, np.zeros((self.width,), dtype='float32'), False)
+        rows = [row for row in (self._row(orth) for orth in orths) if row >= 0]
+        if not rows:
+            return TextVector(orths, np.zeros((self.width,), dtype='float32'), False)
+        # out of vocabulary tokens count as zero vectors, like Doc.vector
+        vector = self.data[rows].sum(axis=0) / len(orths)
+        return TextVector(orths, vector, True)
+
+    def __call__(self, text):
+        return self.text_vector(text)
+
+    def text_vectors(self, texts):
+        return [self.text_vector(text) for text in texts]
+
+    def normalized_matrix(self, text_vectors):
+
+        '''
+        Returns the n x width matrix of a list of TextVectors scaled to unit length, with zero rows for zero vectors
+        A dot product of two rows is the cosine similarity of the two texts, except for identical token sequences
+        '''
+
+        n = len(text_vectors)
+        if n == 0 or self.width == 0:
+            return np.zeros((n, self.width), dtype='float32')
+        matrix = np.vstack([tv.vector for tv in text_vectors])
+        norms = np.array([tv.vector_norm for tv in text_vectors], dtype='float32')
+        safe_norms = np.where(norms == 0, 1.0, norms)
+        normalized = matrix / safe_norms[:, None]
+        normalized[norms == 0, :] = 0.0
+        return normalized
+
+    def similarity_matrix(self, text_vectors):
+
+        '''
+        Returns the n x n cosine similarity matrix of a list of TextVectors as one vectorized dot product
+        Matches TextVector.similarity(): zero vectors score 0, identical token sequences score 1
+        '''
+
+        n = len(text_vectors)
+        if n == 0:
+            return np.zeros((0, 0), dtype='float32')
+        normalized = self.normalized_matrix(text_vectors)
+        similarities = normalized @ normalized.T
+        groups = {}
+        for i, tv in enumerate(text_vectors):
+            groups.setdefault(tv.orths, []).append(i)
+        for group in groups.values():
+            if len(group) > 1:
+                similarities[np.ix_(group, group)] = 1.0
+        np.fill_diagonal(similarities, 1.0)
+        return similarities
+
+vector_engine = register_model('vector_engine', lambda: VectorEngine(nlp.load()), module=module_name)
@@ -18,7 +18,8 @@ from django.db import Error
 from django.shortcuts import render, redirect
 from django.contrib.auth import login, authenticate
 from django.core.mail import send_mail
-from swirl.utils import paginate
+from swirl.utils import paginate, get_url_details
+from swirl.streaming import search_is_final
 from django.conf import settings
 from .forms import QueryTransformForm
 
@@ -45,11 +46,13 @@ from swirl.authenticators import *
 
 module_name = 'views.py'
 
-from swirl.tasks import update_microsoft_token_task
+from swirl.tasks import update_microsoft_token_task, search_task
 from swirl.search import search as run_search
 
 SWIRL_EXPLAIN = getattr(settings, 'SWIRL_EXPLAIN', True)
 SWIRL_SUBSCRIBE_WAIT = getattr(settings, 'SWIRL_SUBSCRIBE_WAIT', 20)
+SWIRL_ASYNC_SEARCH = getattr(settings, 'SWIRL_ASYNC_SEARCH', False)
+SWIRL_SEARCH_WAIT_MAX = getattr(settings, 'SWIRL_SEARCH_WAIT_MAX', 5)
 
 def remove_duplicates(my_list):
     new_list = []
@@ -345,6 +348,9 @@ class SearchViewSet(viewsets.ModelViewSet):
     Add /<id>/ to DELETE, PUT or PATCH one.
     Add ?q=<query_string> to the URL to create a Search with default settings
     Add ?qs=<query_string> to the URL to run a Search and get results directly
+    Add &async=true to ?q, ?qs, ?rerun or ?update to queue the Search and get its status_url right away
+    Add &stream=true to ?qs to queue the Search and follow it over the search-stream websocket
+    Add /<id>/?wait=<seconds> to poll a Search for a few seconds; follow stream_url to be told when it is *_READY
     Add &providers=<provider1_id>,<provider2_tag> etc to specify SearchProvider(s)
     Add ?rerun=<query_id> to fully re-execute a query, discarding previous results
     Add ?update=<query_id> to update the Search with new results from all sources
@@ -357,6 +363,29 @@ class SearchViewSet(viewsets.ModelViewSet):
     def report(self):
         return self.queryset
 
+    def async_requested(self, request):
+        async_search = request.GET.get('async', None)
+        if async_search is None:
+            return SWIRL_ASYNC_SEARCH
+        return async_search.lower() == 'true'
+
+    def queue_search(self, request, search_id):
+
+        '''
+        Runs the search on a Celery worker instead of this request thread and returns 202 at once
+        Follow it with stream_url (websocket, pushed when *_READY) or short polls of status_url, then read result_url
+        '''
+
+        search_task.delay(search_id, Authenticator().get_session_data(request))
+        scheme, hostname, port = get_url_details(request)
+        return Response({
+            'search_id': search_id,
+            'status': Search.objects.get(id=search_id).status,
+            'status_url': f'{scheme}://{hostname}:{port}/swirl/search/{search_id}/',
+            'result_url': f'{scheme}://{hostname}:{port}/swirl/results/?search_id={search_id}',
+            'stream_url': f'/search-stream?search_id={search_id}'
+        }, status=status.HTTP_202_ACCEPTED)
+
     def list(self, request):
         # check permissions
         if not request.user.has_perm('swirl.view_search'):
@@ -415,7 +444,8 @@ class SearchViewSet(viewsets.ModelViewSet):
             new_search.status = 'NEW_SEARCH'
             new_search.save()
             logger.info(f"{request.user} search_q {new_search.id}")
-            # search_task.delay(new_search.id, Authenticator().get_session_data(request))
+            if self.async_requested(request):
+                return self.queue_search(request, new_search.id)
             run_search(new_search.id, Authenticator().get_session_data(request),request=request)
             return redirect(f'/swirl/results?search_id={new_search.id}')
 
@@ -473,6 +503,9 @@ class SearchViewSet(viewsets.ModelViewSet):
             new_search.save()
             # log info
             logger.info(f"{request.user} search_qs {new_search.id}")
+            if request.GET.get('stream', 'false').lower() == 'true' or self.async_requested(request):
+                # the websocket sends a page as each provider finishes, and the final page after post result processing
+                return self.queue_search(request, new_search.id)
             res = run_search(new_search.id, Authenticator().get_session_data(request), request=request)
             if not res:
                 logger.info(f'Search failed: {new_search.status}!!')
@@ -533,7 +566,8 @@ class SearchViewSet(viewsets.ModelViewSet):
             rerun_search.messages.append(message)
             rerun_search.save()
             logger.info(f"{request.user} rerun {rerun_id}")
-            # search_task.delay(rerun_search.id, Authenticator().get_session_data(request))
+            if self.async_requested(request):
+                return self.queue_search(request, rerun_search.id)
             run_search(rerun_search.id, Authenticator().get_session_data(request), request=request)
             return redirect(f'/swirl/results?search_id={rerun_search.id}')
         # end if
@@ -553,11 +587,12 @@ class SearchViewSet(viewsets.ModelViewSet):
             if not Search.objects.filter(id=update_id, owner=self.request.user).exists():
                 return Response('Result Object Not Found', status=status.HTTP_404_NOT_FOUND)
             logger.debug(f"{module_name}: ?update!")
+            search = Search.objects.get(id=update_id)
             search.status = 'UPDATE_SEARCH'
             search.save()
             logger.info(f"{request.user} update {update_id}")
-            # search_task.delay(update_id, Authenticator().get_session_data(request))
-            # time.sleep(SWIRL_SUBSCRIBE_WAIT)
+            if self.async_requested(request):
+                return self.queue_search(request, search.id)
             run_search(update_id, Authenticator().get_session_data(request), request=request)
             return redirect(f'/swirl/results?search_id={update_id}')
 
@@ -593,9 +628,11 @@ class SearchViewSet(viewsets.ModelViewSet):
                 search.status = 'ERR_NO_SEARCHPROVIDERS'
                 search.save()
         else:
-            # search_task.delay(serializer.data['id'], Authenticator().get_session_data(request))
             logger.info(f"{request.user} search_post")
-            run_search(serializer.data['id'], Authenticator().get_session_data(request), request=request)
+            if self.async_requested(request):
+                return self.queue_search(request, serializer.data['id'])
+            else:
+                run_search(serializer.data['id'], Authenticator().get_session_data(request), request=request)
 
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -611,6 +648,24 @@ class SearchViewSet(viewsets.ModelViewSet):
         if not Search.objects.filter(pk=pk, owner=self.request.user).exists():
             return Response('Search Object Not Found', status=status.HTTP_404_NOT_FOUND)
 
+        # short poll: ?wait=<seconds>, at most SWIRL_SEARCH_WAIT_MAX, returns as soon as the search is *_READY or failed
+        # it holds this worker while it waits; clients that wait longer should follow the search-stream websocket
+        wait = request.GET.get('wait', None)
+        if wait:
+            try:
+                wait = min(float(wait), SWIRL_SEARCH_WAIT_MAX)
+            except ValueError:
+                return Response('wait must be a number of seconds', status=status.HTTP_400_BAD_REQUEST)
+            deadline = time.time() + wait
+            while time.time() < deadline:
+                search_status = Search.objects.filter(pk=pk).values_list('status', flat=True).first()
+                if search_status is None:
+                    return Response('Search Object Not Found', status=status.HTTP_404_NOT_FOUND)
+                if search_is_final(search_status):
+                    break
+                time.sleep(0.25)
+            # end while
+
         # security review for 1.7 - OK, filtered by owner
         self.queryset = Search.objects.get(pk=pk)
         serializer = SearchSerializer(self.queryset)
@@ -11,6 +11,8 @@ from readability import Document
 from bs4 import BeautifulSoup
 from urllib.parse import quote, urlparse
 
+from swirl.http_sessions import http_session_pool
+
 # TO DO: is this correct? This is usually used in celery
 from celery.utils.log import get_task_logger
 logger = get_task_logger(__name__)
@@ -160,7 +162,7 @@ class PageFetcher (metaclass=ABCMeta):
         through access methods.
         """
         try:
-            response = requests.get(self._url, headers=self._headers, timeout=self._timeout)
+            response = http_session_pool.get(self._url, headers=self._headers, timeout=self._timeout)
             self._http_status = None
             if response.status_code != HTTPStatus.OK:
                 logger.error(f"GET Got unexpected status code: {response.status_code} : {self._url} {self._timeout} {self._headers}")
@@ -180,9 +182,9 @@ class PageFetcher (metaclass=ABCMeta):
         """
         try:
             if self._headers.get('Content-Type') == 'application/json':
-                response = requests.post(self._url, json=data, headers=self._headers, timeout=self._timeout)
+                response = http_session_pool.post(self._url, json=data, headers=self._headers, timeout=self._timeout)
             else:
-                response = requests.post(self._url, data=data, headers=self._headers, timeout=self._timeout)
+                response = http_session_pool.post(self._url, data=data, headers=self._headers, timeout=self._timeout)
         except (TimeoutError, NewConnectionError, ConnectionError, requests.exceptions.InvalidURL) as err:
             logger.error(f"{err} while posting page")
             return None
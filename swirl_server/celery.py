@@ -4,10 +4,12 @@
 @version:    Swirl 1.x
 '''
 
+import gc
 import os
+import multiprocessing
 from celery import Celery
 from celery.schedules import crontab
-from celery.signals import after_setup_logger
+from celery.signals import after_setup_logger, worker_init, worker_process_init, worker_process_shutdown
 from django.conf import settings
 
 # Set the default Django settings module for the 'celery' program.
@@ -52,6 +54,38 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
 
+@worker_init.connect
+def preload_models(**kwargs):
+    # runs in the parent before the pool forks, so prefork children share the model pages copy-on-write
+    if not getattr(settings, 'SWIRL_PRELOAD_MODELS', False):
+        return
+    import swirl.processors # registers the models
+    from swirl.model_registry import preload_models as preload, log_startup_report
+    preload()
+    # keep the preloaded objects out of the collector so it does not dirty the shared pages
+    gc.freeze()
+    log_startup_report()
+
+@worker_process_shutdown.connect
+def log_http_session_stats(**kwargs):
+    from swirl.http_sessions import http_session_pool
+    http_session_pool.log_stats()
+    http_session_pool.close()
+
+@worker_process_init.connect
+def check_cpu_pool(**kwargs):
+    # prefork children can't start the pool; say so at startup rather than on the first large search
+    if not getattr(settings, 'SWIRL_CPU_POOL', False):
+        return
+    from swirl.cpu_executor import cpu_executor
+    if multiprocessing.current_process().daemon:
+        cpu_executor.pool()
+
+@worker_process_shutdown.connect
+def shutdown_cpu_pool(**kwargs):
+    from swirl.cpu_executor import cpu_executor
+    cpu_executor.shutdown()
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
@@ -3,7 +3,7 @@ from channels.auth import AuthMiddlewareStack
 from swirl.middleware import WebSocketTokenMiddleware  # Import the TokenAuthMiddleware
 from django.urls import path
 from django.core.asgi import get_asgi_application
-from swirl.consumers import Consumer
+from swirl.consumers import Consumer, SearchStreamConsumer
 
 application = ProtocolTypeRouter({
     'http': get_asgi_application(),
@@ -11,6 +11,7 @@ application = ProtocolTypeRouter({
         AuthMiddlewareStack(
             URLRouter([
                 path('chatgpt-data', Consumer.as_asgi()),
+                path('search-stream', SearchStreamConsumer.as_asgi()),
             ])
         )
     )
@@ -218,6 +218,19 @@ CELERY_TIMEZONE = 'US/Eastern'
 CELERY_TIME_ZONE = 'US/Eastern'
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60
+# run only due subscriptions, each as its own task, every SWIRL_SUBSCRIBE_TICK seconds; interval is per search
+# (subscribe_interval, 0 or at least one tick) or SWIRL_SUBSCRIBE_INTERVAL seconds; at most SWIRL_SUBSCRIBE_CONCURRENCY updates run at once
+# each update federates as a chord (as with SWIRL_SEARCH_CHORD) instead of waiting on its federate tasks, so updates
+# never hold the worker slots their federate tasks need; this needs the celery result backend, as chords do
+SWIRL_SUBSCRIBE_SCHEDULER = env.bool('SWIRL_SUBSCRIBE_SCHEDULER', default=False)
+SWIRL_SUBSCRIBE_INTERVAL = env.int('SWIRL_SUBSCRIBE_INTERVAL', default=4 * 60 * 60)
+SWIRL_SUBSCRIBE_CONCURRENCY = env.int('SWIRL_SUBSCRIBE_CONCURRENCY', default=10)
+SWIRL_SUBSCRIBE_TICK = 10 * 60
+# an update that hasn't saved the search for this many seconds is assumed to have died
+SWIRL_SUBSCRIBE_STALE = 60 * 60
+# the hourly expirer deletes expired searches this many at a time, for at most this many seconds per run
+SWIRL_EXPIRER_BATCH_SIZE = 500
+SWIRL_EXPIRER_TIME_BUDGET = 60
 CELERY_BEAT_SCHEDULE = {
     # Executes every hour
     'expire': {
@@ -227,9 +240,24 @@ CELERY_BEAT_SCHEDULE = {
     # Executes every four hours
     'subscribe': {
          'task': 'subscriber',
-         'schedule': crontab(minute=0,hour='*/4'),   # minute='*/10'
+         'schedule': crontab(minute=f'*/{SWIRL_SUBSCRIBE_TICK // 60}') if SWIRL_SUBSCRIBE_SCHEDULER else crontab(minute=0,hour='*/4'),
         },
 }
+# federate each provider as two tasks: federate_fetch (query, connect, normalize) on the SWIRL_FETCH_QUEUE and
+# federate_process (result processors, save) on the SWIRL_PROCESS_QUEUE, so slow providers don't hold CPU workers; run e.g.
+#   celery -A swirl_server worker -Q swirl_io -P gevent -c 100
+#   celery -A swirl_server worker -Q swirl_cpu -P threads -c <cores>
+#   celery -A swirl_server worker -Q celery
+SWIRL_SPLIT_FEDERATION = env.bool('SWIRL_SPLIT_FEDERATION', default=False)
+SWIRL_FETCH_QUEUE = env('SWIRL_FETCH_QUEUE', default='swirl_io')
+SWIRL_PROCESS_QUEUE = env('SWIRL_PROCESS_QUEUE', default='swirl_cpu')
+CELERY_TASK_ROUTES = {
+    'federate_fetch': {'queue': SWIRL_FETCH_QUEUE},
+    'federate_process': {'queue': SWIRL_PROCESS_QUEUE},
+} if SWIRL_SPLIT_FEDERATION else {}
+# in a worker (search_task, subscriptions), federate as a chord instead of waiting on the federate tasks: the chord callback
+# runs the post result processors and sets *_READY; a deadline task does so after SWIRL_TIMEOUT with the results saved so far
+SWIRL_SEARCH_CHORD = env.bool('SWIRL_SEARCH_CHORD', default=False)
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 CELERY_BROKER_URL_DEF = 'redis://localhost:6379/0'
 CELERY_BROKER_URL = env('CELERY_BROKER_URL',default=CELERY_BROKER_URL_DEF)
@@ -237,6 +265,25 @@ CELERY_BROKER_URL = env('CELERY_BROKER_URL',default=CELERY_BROKER_URL_DEF)
 CELERY_RESULT_BACKEND_DEF = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = env('CELERY_RESULT_BACKEND', default=CELERY_RESULT_BACKEND_DEF)
 
+# CACHES
+# SWIRL_RESULT_CACHE_BACKEND selects where cached provider responses live: locmem (per process) or redis (shared by all workers)
+SWIRL_RESULT_CACHE_BACKEND = env('SWIRL_RESULT_CACHE_BACKEND', default='locmem')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'swirl_results': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'swirl_results',
+    }
+}
+if SWIRL_RESULT_CACHE_BACKEND == 'redis':
+    CACHES['swirl_results'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': env('SWIRL_RESULT_CACHE_URL', default=CELERY_BROKER_URL),
+    }
+
 # EMAIL
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -258,6 +305,80 @@ SWIRL_SUBSCRIBE_WAIT = 20
 SWIRL_DEDUPE_FIELD = 'url'
 SWIRL_DEDUPE_SIMILARITY_MINIMUM = 0.95
 SWIRL_DEDUPE_SIMILARITY_FIELDS = ['title', 'body']
+# dedupe SWIRL_DEDUPE_FIELD on canonical urls (no scheme, www., tracking parameters or trailing slash) and keep a hash of
+# each delivered value per search, so subscription updates don't append items the search already delivered
+SWIRL_DEDUPE_INDEX = env.bool('SWIRL_DEDUPE_INDEX', default=False)
+SWIRL_DEDUPE_TRACKING_PARAMETERS = ['utm_*', 'gclid', 'fbclid', 'msclkid', 'mc_cid', 'mc_eid', '_ga', 'ref', 'ref_src']
+# dedupe by similarity with MinHash/LSH over word 3-shingles instead of spaCy vectors; the minimum is estimated Jaccard similarity
+# SWIRL_DEDUPE_MINHASH_PERMUTATIONS must be a multiple of SWIRL_DEDUPE_MINHASH_BANDS
+SWIRL_DEDUPE_MINHASH = env.bool('SWIRL_DEDUPE_MINHASH', default=False)
+SWIRL_DEDUPE_MINHASH_MINIMUM = 0.8
+SWIRL_DEDUPE_MINHASH_PERMUTATIONS = 128
+SWIRL_DEDUPE_MINHASH_BANDS = 32
+# dedupe by exact cosine similarity of the word vector table's averaged vectors, without the spaCy pipeline; ignored
+# with SWIRL_DEDUPE_MINHASH
+SWIRL_DEDUPE_VECTORS = env.bool('SWIRL_DEDUPE_VECTORS', default=False)
+
+# cache each provider's normalized response for this many seconds; 0 disables
+# override per provider with the tag result_cache_ttl:<seconds>
+SWIRL_RESULT_CACHE = 'swirl_results'
+SWIRL_RESULT_CACHE_TTL = env.int('SWIRL_RESULT_CACHE_TTL', default=0)
+
+# push re-mixed pages to search-stream websocket clients as each provider finishes
+SWIRL_STREAM_RESULTS = env.bool('SWIRL_STREAM_RESULTS', default=False)
+
+# send RequestsGet, RequestsPost and M365 provider queries, all pages included, from one asyncio/httpx event loop
+# instead of one celery task per provider; override the per provider limit with the tag timeout:<seconds>
+SWIRL_ASYNC_HTTP = env.bool('SWIRL_ASYNC_HTTP', default=False)
+SWIRL_ASYNC_HTTP_MAX_CONNECTIONS = 100
+SWIRL_ASYNC_HTTP_MAX_KEEPALIVE = 20
+
+# request all PAGE pages of a provider at once instead of one after another
+# override per provider with the tags page_concurrency:<n> and page_rate:<requests per second>
+SWIRL_PARALLEL_PAGING = env.bool('SWIRL_PARALLEL_PAGING', default=False)
+SWIRL_PAGE_CONCURRENCY = 5
+SWIRL_PAGE_RATE_LIMIT = 0
+
+# per worker pool of keep-alive requests sessions, one per host, used by the HTTP connectors and the RAG page fetcher
+SWIRL_HTTP_POOL_SIZE = env.int('SWIRL_HTTP_POOL_SIZE', default=10)
+SWIRL_HTTP_MAX_SESSIONS = 64
+SWIRL_HTTP_KEEPALIVE = env.bool('SWIRL_HTTP_KEEPALIVE', default=True)
+# off by default; set SWIRL_HTTP_RETRIES=<n>, e.g. 2, to retry failed connections (every method) and SWIRL_HTTP_RETRY_STATUS
+# (idempotent methods) up to n times with a short backoff
+# 429 isn't retried by default, and Retry-After is never honoured, so a throttling provider can't hold a search past SWIRL_TIMEOUT
+SWIRL_HTTP_RETRIES = env.int('SWIRL_HTTP_RETRIES', default=0)
+SWIRL_HTTP_BACKOFF = 0.2
+SWIRL_HTTP_RETRY_STATUS = [502, 503, 504]
+
+# pooled Elastic, OpenSearch, MongoDB, Qdrant and SQL clients: close after this many idle seconds,
+# and health check a client at most this often before reusing it
+SWIRL_CLIENT_IDLE_TIMEOUT = 300
+SWIRL_CLIENT_HEALTH_CHECK_INTERVAL = 30
+# SQL connections aren't shared between concurrent searches; each provider keeps at most this many idle ones per worker process
+SWIRL_CLIENT_POOL_SIZE = 10
+
+# compiled SearchProvider plans (parsed mappings, bound templates, compiled jsonpaths) kept per worker process
+SWIRL_PROVIDER_PLAN_CACHE_SIZE = 256
+
+# store result items as ResultItem rows instead of one Result.json_results list, so post result processors
+# only write the rows and columns they change
+SWIRL_RESULT_ITEM_STORAGE = env.bool('SWIRL_RESULT_ITEM_STORAGE', default=False)
+SWIRL_RESULT_ITEM_BATCH_SIZE = 500
+
+# run post result processors over one in-memory copy of the results and save them once at the end
+SWIRL_POST_RESULT_PIPELINE = env.bool('SWIRL_POST_RESULT_PIPELINE', default=False)
+
+# cache each finished search's full mix order for this many seconds, so paging loads only the page's items; 0 disables
+# entries are dropped whenever the search's results change, by any worker, so this needs a shared cache: it stays off,
+# with an error logged, unless SWIRL_MIX_CACHE is a redis (or other shared) backend, e.g. SWIRL_RESULT_CACHE_BACKEND=redis
+SWIRL_MIX_CACHE = 'swirl_results'
+SWIRL_MIX_CACHE_TTL = env.int('SWIRL_MIX_CACHE_TTL', default=0)
+
+# queue ?q, ?qs, ?rerun, ?update and POST searches on Celery and return a status url (override per request with &async=)
+SWIRL_ASYNC_SEARCH = env.bool('SWIRL_ASYNC_SEARCH', default=False)
+# longest a /swirl/search/<id>/?wait= poll may block; it holds a web worker, so keep it short and have clients
+# follow the stream_url websocket, which pushes the final page when the search is *_READY
+SWIRL_SEARCH_WAIT_MAX = 5
 
 SWIRL_EXPLAIN = bool(os.getenv('SWIRL_EXPLAIN', 'True') == 'True')
 
@@ -279,6 +400,32 @@ SWIRL_MIN_SIMILARITY = env.float('SWIRL_MIN_SIMILARITY', default=SWIRL_MIN_SIMIL
 
 MIN_SWIRL_SCORE = 500
 
+# vectorize all of a provider's relevancy texts with one nlp.pipe call
+SWIRL_RELEVANCY_BATCH_NLP = env.bool('SWIRL_RELEVANCY_BATCH_NLP', default=True)
+SWIRL_RELEVANCY_NLP_BATCH_SIZE = 256
+# parsed queries and query vectors kept per worker process, shared by every provider's relevancy processor
+SWIRL_QUERY_ANALYSIS_CACHE_SIZE = 64
+# query and query target vectors kept per analysis, by capitalization variant
+SWIRL_QUERY_ANALYSIS_VECTORS = 256
+# score relevancy from the word vector table only; loads spaCy without tagger/parser/ner
+SWIRL_VECTOR_ENGINE = env.bool('SWIRL_VECTOR_ENGINE', default=False)
+# spaCy, Presidio, NLTK and TextBlob models load on first use; set this to load them in the celery parent before forking
+SWIRL_PRELOAD_MODELS = env.bool('SWIRL_PRELOAD_MODELS', default=False)
+# split item by item result processing (relevancy, PII redaction, date finding, text cleaning) across a warm pool of
+# processes, each with the SWIRL_CPU_POOL_PRELOAD models loaded; size 0 means one per core (or per SWIRL_CPU_POOL_AFFINITY cpu)
+# the pool can't start inside a prefork child, so with the pool on, swirl.py starts celery-worker with -P threads;
+# run any other worker that processes results (e.g. the SWIRL_PROCESS_QUEUE worker) with -P threads too
+SWIRL_CPU_POOL = env.bool('SWIRL_CPU_POOL', default=False)
+SWIRL_CPU_POOL_SIZE = env.int('SWIRL_CPU_POOL_SIZE', default=0)
+SWIRL_CPU_POOL_AFFINITY = []
+SWIRL_CPU_POOL_PRELOAD = ['spacy']
+SWIRL_CPU_POOL_MIN_BATCH = 25
+# result processors share one list of results; set this to deep copy it before each processor, and warn when one
+# deletes a different number of results than it reports or changes results it declares it doesn't (mutates_results)
+SWIRL_RESULT_PROCESSOR_SNAPSHOTS = env.bool('SWIRL_RESULT_PROCESSOR_SNAPSHOTS', default=False)
+# log the time and the memory allocated by each result processor, per provider; tracemalloc slows the worker down
+SWIRL_RESULT_PROCESSOR_ALLOCATIONS = env.bool('SWIRL_RESULT_PROCESSOR_ALLOCATIONS', default=False)
+
 # SWIRL_MAX_TEMPORAL_DISTANCE = 90
 # SWIRL_MAX_TEMPORAL_DISTANCE_UNITS = 'days' # days | hours
 # SWIRL_MIN_RELEVANCY_SCORE = 50.0
@@ -328,6 +475,11 @@ SWIRL_WRITE_PATH = env('SWIRL_WRITE_PATH', default=SWIRL_WRITE_PATH_DEF)
 
 SWIRL_MAX_FIELD_LEN = 512
 
+# embedding models (VectorDBConnector, get_embedding) and query embeddings are cached per process
+SWIRL_EMBEDDING_DEFAULT_MODEL = 'intfloat/e5-small-v2'
+SWIRL_EMBEDDING_MODEL_CACHE_SIZE = env.int('SWIRL_EMBEDDING_MODEL_CACHE_SIZE', default=2)
+SWIRL_EMBEDDING_QUERY_CACHE_SIZE = env.int('SWIRL_EMBEDDING_QUERY_CACHE_SIZE', default=1024)
+
 CHANNEL_LAYERS = {
     'default': {
         "BACKEND": "channels_redis.core.RedisChannelLayer",